@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Optional
+
+from llm_gateway import LLMGatewayError
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Who the current request's generations are queued for; set once the caller is authenticated.
+current_client: ContextVar[str] = ContextVar("llm_client", default="anonymous")
+
+WAIT_SAMPLES = 1000
+
+LLM_QUEUE_WAIT = Histogram("llm_queue_wait_seconds", "Seconds a generation waited for a slot.")
+LLM_REJECTED = Counter("llm_rejected_total", "Generations rejected because the queue was full.")
+
+
+class AdmissionRejected(LLMGatewayError):
+    """Raised when the generation queue is full; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limits concurrent generations and queues the rest fairly between clients.
+
+    At most `max_concurrent` generations run at once (match Ollama's
+    OLLAMA_NUM_PARALLEL). Waiting generations are queued per client and a
+    freed slot goes to the next client in round-robin order, so one client's
+    burst cannot starve everyone else. Past `max_queue_depth` waiters in
+    total, or `max_queue_per_client` for one client, new generations are
+    rejected with AdmissionRejected.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue_depth: int, max_queue_per_client: int):
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_per_client = max_queue_per_client
+        self.active = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_seconds: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        # Moving average of how long a generation holds its slot, for Retry-After.
+        self.average_hold = 10.0
+
+    def retry_after(self) -> int:
+        rounds = (self.queued + 1) / max(1, self.max_concurrent)
+        return max(1, math.ceil(rounds * self.average_hold))
+
+    def check(self, client: Optional[str] = None):
+        """Raises AdmissionRejected if a generation for `client` would be turned away right now."""
+        client = client or current_client.get()
+        if self.active < self.max_concurrent and not self.queued:
+            return
+        if self.queued >= self.max_queue_depth:
+            self._reject(f"{self.queued} generations are already queued")
+        if len(self._waiters.get(client, ())) >= self.max_queue_per_client:
+            self._reject(f"{client} already has {self.max_queue_per_client} generations queued")
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        LLM_REJECTED.inc()
+        retry_after = self.retry_after()
+        logger.warning("Rejecting generation: %s (retry after %ds)", reason, retry_after)
+        raise AdmissionRejected(f"The model is busy: {reason}.", retry_after)
+
+    @asynccontextmanager
+    async def slot(self, client: Optional[str] = None) -> AsyncIterator[None]:
+        """Holds one generation slot for the duration of the block, waiting for it in `client`'s queue."""
+        client = client or current_client.get()
+        started = time.monotonic()
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+        else:
+            self.check(client)
+            await self._wait(client)
+        self.admitted += 1
+        admitted_at = time.monotonic()
+        self.wait_seconds.append(admitted_at - started)
+        LLM_QUEUE_WAIT.observe(admitted_at - started)
+        try:
+            yield
+        finally:
+            self.average_hold = 0.8 * self.average_hold + 0.2 * (time.monotonic() - admitted_at)
+            self._release()
+
+    async def _wait(self, client: str):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append(future)
+        self.queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the caller gave up; pass it on.
+                self._release()
+            else:
+                self._forget(client, future)
+            raise
+
+    def _forget(self, client: str, future: asyncio.Future):
+        queue = self._waiters.get(client)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.queued -= 1
+            if not queue:
+                del self._waiters[client]
+
+    def _release(self):
+        # Hand the slot straight to the next client in round-robin order.
+        while self._waiters:
+            client, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._waiters.move_to_end(client)
+            else:
+                del self._waiters[client]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        waits = sorted(self.wait_seconds)
+
+        def percentile(fraction: float) -> float:
+            return round(waits[min(len(waits) - 1, int(fraction * len(waits)))], 4) if waits else 0.0
+
+        return {
+            "maxConcurrent": self.max_concurrent,
+            "active": self.active,
+            "queued": self.queued,
+            "queuedByClient": {client: len(queue) for client, queue in self._waiters.items()},
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "waitSeconds": {"p50": percentile(0.5), "p95": percentile(0.95), "max": waits[-1] if waits else 0.0},
+        }
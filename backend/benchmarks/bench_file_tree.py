@@ -0,0 +1,107 @@
+"""
+Benchmarks file tree building on synthetic checkouts.
+
+Creates trees of 10k/100k (and optionally 1M) files under a temp directory,
+then times the previous recursive os.listdir + Pydantic builder against the
+scandir-based builder, serially and with a process pool.
+
+    python benchmarks/bench_file_tree.py --sizes 10000 100000 1000000 --workers 4
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import file_tree  # noqa: E402
+
+logger = logging.getLogger("legacy")
+
+
+class FileItem(BaseModel):
+    name: str
+    path: str
+    type: str
+    children: Optional[List['FileItem']] = None
+
+
+def legacy_build_file_tree(root_dir: str, start_dir: str, max_depth=4, depth=0) -> List[FileItem]:
+    """The builder main.py used before the scandir walker, kept here for comparison."""
+    logger.debug(f"Building file tree for {root_dir}, depth {depth}")
+    if depth > max_depth:
+        return []
+    items = []
+    for item_name in os.listdir(root_dir):
+        if item_name == '.git':
+            continue
+        full_path = os.path.join(root_dir, item_name)
+        relative_path = os.path.relpath(full_path, start=start_dir)
+        logger.debug(f"Processing item: {full_path}, relative_path: {relative_path}")
+        if os.path.isdir(full_path):
+            children = legacy_build_file_tree(full_path, start_dir, max_depth, depth + 1)
+            items.append(FileItem(name=item_name, path=relative_path, type='directory', children=children))
+        else:
+            items.append(FileItem(name=item_name, path=relative_path, type='file', children=[]))
+    items.sort(key=lambda x: (x.type != 'directory', x.name))
+    return items
+
+
+def make_tree(root: str, num_files: int, fanout: int = 10, depth: int = 3):
+    """Spreads `num_files` evenly over fanout**depth leaf directories."""
+    leaves = [""]
+    for _ in range(depth):
+        leaves = [os.path.join(leaf, f"dir{i}") for leaf in leaves for i in range(fanout)]
+    per_leaf = max(1, num_files // len(leaves))
+    for leaf in leaves:
+        leaf_dir = os.path.join(root, leaf)
+        os.makedirs(leaf_dir, exist_ok=True)
+        for i in range(per_leaf):
+            with open(os.path.join(leaf_dir, f"file{i}.py"), "w"):
+                pass
+
+
+def measure(label: str, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    # Separate pass: tracemalloc itself slows allocation-heavy code down a lot.
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<28} {elapsed:8.3f}s  peak {peak / 1024 / 1024:8.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--skip-legacy", action="store_true", help="Skip the old builder (slow on 1M entries)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    for size in args.sizes:
+        root = tempfile.mkdtemp(prefix="bench-tree-")
+        try:
+            print(f"Creating {size} files...")
+            make_tree(root, size)
+            print(f"{size} files:")
+            if not args.skip_legacy:
+                measure("legacy (listdir+pydantic)", lambda: legacy_build_file_tree(root, root))
+            measure("scandir, serial", lambda: file_tree.build_file_tree(root, workers=1))
+            measure(f"scandir, {args.workers} processes", lambda: file_tree.build_file_tree(root, workers=args.workers))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    file_tree.shutdown_executor()
+
+
+if __name__ == "__main__":
+    main()
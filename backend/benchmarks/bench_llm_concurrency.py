@@ -0,0 +1,72 @@
+"""
+Load test for the async LLM gateway.
+
+Fires N concurrent /api/chat requests at the FastAPI app (in-process, via
+httpx's ASGI transport) while the MCP server is replaced by a fake that takes
+`--latency` seconds per generation. With a non-blocking gateway the requests
+overlap, so wall time stays close to one generation instead of N of them.
+
+    python benchmarks/bench_llm_concurrency.py --requests 16 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("GITHUB_PAT", "benchmark-token")
+os.environ.setdefault("DESCOPE_PROJECT_ID", "P2benchmark")
+
+import main  # noqa: E402
+from llm_gateway import LLMGateway  # noqa: E402
+
+
+def fake_mcp_transport(latency: float) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json={"response": "ok", "done": True})
+    return httpx.MockTransport(handler)
+
+
+async def run(num_requests: int, latency: float):
+    main.llm_gateway = LLMGateway(base_url="http://fake-mcp", model="bench", transport=fake_mcp_transport(latency))
+    main.app.dependency_overrides[main.verify_descope_token] = lambda: "benchmark"
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+        async def one_chat(i: int) -> float:
+            start = time.perf_counter()
+            response = await client.post("/api/chat", json={"message": f"question {i}"})
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        # Health check issued while the chats are in flight must not wait behind them.
+        async def health() -> float:
+            await asyncio.sleep(latency / 4)
+            start = time.perf_counter()
+            (await client.get("/")).raise_for_status()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        *latencies, health_latency = await asyncio.gather(*(one_chat(i) for i in range(num_requests)), health())
+        wall = time.perf_counter() - start
+
+    await main.llm_gateway.aclose()
+    serial = num_requests * latency
+    print(f"requests:            {num_requests}")
+    print(f"per-call latency:    {latency:.3f}s")
+    print(f"wall time:           {wall:.3f}s (serial would be {serial:.3f}s)")
+    print(f"overlap factor:      {serial / wall:.1f}x")
+    print(f"max request latency: {max(latencies):.3f}s")
+    print(f"health check during: {health_latency * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.latency))
@@ -0,0 +1,106 @@
+"""
+Measures what logging costs the code that logs, with debug on and off.
+
+Emits one debug record per item (like a per-file event during a tree build)
+under the old setup (basicConfig at DEBUG, f-strings, synchronous handler)
+and under log_config (lazy %-formatting, queue handler, rate limit, sampling).
+Records go to /dev/null so the terminal does not dominate; the time the
+writer thread needs to drain the queue is reported separately.
+
+    python benchmarks/bench_logging.py --items 200000
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from log_config import Sampler, configure_logging, stop_listener  # noqa: E402
+
+logger = logging.getLogger("bench")
+
+
+def reset_logging():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def eager_items(count: int):
+    for i in range(count):
+        path = "src/pkg/module_%d.py" % i
+        logger.debug(f"Visited {path} at depth {i % 7}")
+
+
+def lazy_items(count: int):
+    for i in range(count):
+        path = "src/pkg/module_%d.py" % i
+        logger.debug("Visited %s at depth %d", path, i % 7)
+
+
+def sampled_items(count: int):
+    sample = Sampler(1000)
+    for i in range(count):
+        path = "src/pkg/module_%d.py" % i
+        if sample():
+            logger.debug("Visited %s at depth %d (1 in 1000)", path, i % 7)
+
+
+def baseline_items(count: int):
+    # Formats the same path as the workloads, so only the logging differs from the baseline.
+    for i in range(count):
+        "src/pkg/module_%d.py" % i
+
+
+def run_case(label: str, workload, count: int, env: dict, baseline: float, devnull, legacy: bool = False):
+    reset_logging()
+    listener = None
+    if legacy:
+        logging.basicConfig(level=logging.DEBUG, stream=devnull, force=True)
+    else:
+        listener = configure_logging(env, stream=devnull)
+    handler = logging.getLogger().handlers[0]
+
+    started = time.perf_counter()
+    workload(count)
+    elapsed = time.perf_counter() - started
+    drained = 0.0
+    if listener is not None:
+        drain_started = time.perf_counter()
+        stop_listener(listener)
+        drained = time.perf_counter() - drain_started
+    overhead_ns = max(0.0, elapsed - baseline) / count * 1e9
+    dropped = getattr(handler, "dropped", 0)
+    print(f"  {label:<44} {elapsed:7.3f}s  {overhead_ns:8.0f} ns/item  drain {drained:6.3f}s  dropped {dropped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200_000)
+    args = parser.parse_args()
+    count = args.items
+
+    started = time.perf_counter()
+    baseline_items(count)
+    baseline = time.perf_counter() - started
+    print(f"{count} items, loop alone {baseline:.3f}s; overhead is per item beyond that:")
+
+    # basicConfig's format everywhere, so only the pipeline differs.
+    off = {"LOG_LEVEL": "INFO", "LOG_FORMAT": logging.BASIC_FORMAT}
+    queued = {"LOG_LEVEL": "DEBUG", "LOG_FORMAT": logging.BASIC_FORMAT, "LOG_DEBUG_RATE": "0", "LOG_QUEUE_SIZE": str(count + 1)}
+    with open(os.devnull, "w") as devnull:
+        run_case("old: basicConfig DEBUG, f-string, sync", eager_items, count, {}, baseline, devnull, legacy=True)
+        run_case("debug off: f-string (formats anyway)", eager_items, count, off, baseline, devnull)
+        run_case("debug off: lazy %-style", lazy_items, count, off, baseline, devnull)
+        run_case("debug on: lazy, sync handler", lazy_items, count, {**queued, "LOG_QUEUE_SIZE": "0"}, baseline, devnull)
+        run_case("debug on: lazy, queue handler", lazy_items, count, queued, baseline, devnull)
+        run_case("debug on: lazy, queue, 20/s per call site", lazy_items, count, {**queued, "LOG_DEBUG_RATE": "20"}, baseline, devnull)
+        run_case("debug on: sampled 1 in 1000, queue", sampled_items, count, queued, baseline, devnull)
+    reset_logging()
+
+
+if __name__ == "__main__":
+    main()
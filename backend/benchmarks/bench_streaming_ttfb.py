@@ -0,0 +1,77 @@
+"""
+Compares time-to-first-byte of /api/chat and /api/chat/stream.
+
+The MCP server is replaced by a fake that emits `--tokens` NDJSON chunks,
+`--token-latency` seconds apart, after a `--ttft` delay. The buffered endpoint
+only answers once every token exists; the SSE endpoint answers at ~TTFT.
+
+    python benchmarks/bench_streaming_ttfb.py --tokens 200 --token-latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("GITHUB_PAT", "benchmark-token")
+os.environ.setdefault("DESCOPE_PROJECT_ID", "P2benchmark")
+
+import main  # noqa: E402
+from llm_gateway import LLMGateway  # noqa: E402
+
+
+class FakeTokenStream(httpx.AsyncByteStream):
+    def __init__(self, tokens: int, ttft: float, token_latency: float):
+        self.tokens = tokens
+        self.ttft = ttft
+        self.token_latency = token_latency
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.ttft)
+        for i in range(self.tokens):
+            yield (json.dumps({"response": f"tok{i} ", "done": False}) + "\n").encode()
+            await asyncio.sleep(self.token_latency)
+        yield (json.dumps({"response": "", "done": True}) + "\n").encode()
+
+
+def fake_mcp_transport(tokens: int, ttft: float, token_latency: float) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if json.loads(request.content).get("stream"):
+            return httpx.Response(200, stream=FakeTokenStream(tokens, ttft, token_latency))
+        await asyncio.sleep(ttft + tokens * token_latency)
+        return httpx.Response(200, json={"response": "tok " * tokens, "done": True})
+    return httpx.MockTransport(handler)
+
+
+async def time_to_first_byte(client: httpx.AsyncClient, path: str) -> tuple:
+    start = time.perf_counter()
+    first = None
+    async with client.stream("POST", path, json={"message": "hello"}) as response:
+        async for _ in response.aiter_bytes():
+            if first is None:
+                first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+async def run(tokens: int, ttft: float, token_latency: float):
+    main.llm_gateway = LLMGateway(base_url="http://fake-mcp", model="bench", transport=fake_mcp_transport(tokens, ttft, token_latency))
+    main.app.dependency_overrides[main.verify_descope_token] = lambda: "benchmark"
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://backend") as client:
+        for path in ("/api/chat", "/api/chat/stream"):
+            ttfb, total = await time_to_first_byte(client, path)
+            print(f"{path:<18} ttfb={ttfb * 1000:8.1f}ms total={total * 1000:8.1f}ms")
+    await main.llm_gateway.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    args = parser.parse_args()
+    asyncio.run(run(args.tokens, args.ttft, args.token_latency))
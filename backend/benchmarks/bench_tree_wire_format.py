@@ -0,0 +1,90 @@
+"""
+Compares the nested FileItem response shape with the columnar tree format.
+
+For synthetic listings of 10k/100k entries (no disk access), reports payload
+size (raw, gzip, brotli if installed) and the time to validate + serialize
+each shape the way FastAPI would.
+
+    python benchmarks/bench_tree_wire_format.py --sizes 10000 100000
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("GITHUB_PAT", "benchmark-token")
+os.environ.setdefault("DESCOPE_PROJECT_ID", "P2benchmark")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+import main  # noqa: E402
+from file_tree import nest, to_columnar  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_listing(num_files: int, fanout: int = 10, depth: int = 3) -> dict:
+    listing = {}
+    dirs = [""]
+    for _ in range(depth):
+        next_dirs = []
+        for parent in dirs:
+            children = [f"{parent}/pkg{i}" if parent else f"pkg{i}" for i in range(fanout)]
+            listing[parent] = [(child.rsplit("/", 1)[-1], True) for child in children]
+            next_dirs.extend(children)
+        dirs = next_dirs
+    per_leaf = max(1, num_files // len(dirs))
+    for leaf in dirs:
+        listing[leaf] = [(f"module_{i}.py", False) for i in range(per_leaf)]
+    return listing
+
+
+def timed(fn, repeat: int = 3):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def report(label: str, seconds: float, body: bytes):
+    sizes = f"raw {len(body) / 1024:9.1f} KiB  gzip {len(gzip.compress(body, 6)) / 1024:8.1f} KiB"
+    if brotli is not None:
+        sizes += f"  br {len(brotli.compress(body, quality=5)) / 1024:8.1f} KiB"
+    print(f"  {label:<10} serialize {seconds * 1000:8.1f}ms  {sizes}")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        listing = make_listing(size)
+        meta = {"name": "bench", "url": "https://github.com/example/bench", "commit": "0" * 40, "fetchedAt": None}
+        print(f"{size} files:")
+
+        def nested():
+            analysis = dict(meta, structure=nest(listing))
+            validated = main.RepoAnalysisResponse.model_validate(analysis)
+            return json.dumps(jsonable_encoder(validated)).encode()
+
+        def columnar():
+            return json.dumps(dict(meta, tree=to_columnar(listing)), separators=(",", ":")).encode()
+
+        seconds, body = timed(nested)
+        report("nested", seconds, body)
+        seconds, body = timed(columnar)
+        report("columnar", seconds, body)
+
+
+if __name__ == "__main__":
+    main_()
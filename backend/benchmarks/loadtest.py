@@ -0,0 +1,424 @@
+"""
+Load test for the backend against local stand-ins for everything it talks to.
+
+Starts main.py under uvicorn in its own process, next to a second process
+serving:
+- a fake Ollama/MCP server that streams `--tokens` tokens, `--token-latency`
+  seconds apart, after `--ttft` seconds (embeddings answer at once),
+- a fake GitHub API (issues, issue search, the authenticated user) that
+  honours If-None-Match like the real one.
+Descope is replaced by a stub validator that accepts any bearer token as its
+own user, and https://github.com/loadtest/sample is cloned over file:// from a
+generated bare repository (git's url.<base>.insteadOf).
+
+Each scenario (analyze, file_content, chat, guide) runs `--concurrency`
+clients back to back for `--duration` seconds after one warm-up request.
+It reports p50/p95/p99 latency (and time to first byte for the streaming ones)
+and requests/s. Results go to `--output` as JSON so runs can be compared.
+
+    python benchmarks/loadtest.py --scenarios analyze,file_content,chat,guide --concurrency 16 --duration 20 --output loadtest.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+REPO_URL = "https://github.com/loadtest/sample"
+ISSUE_URL = f"{REPO_URL}/issues/1"
+READY_TIMEOUT = 60.0
+
+GUIDE_TEXT = (
+    "**Step 1: Find the parser**\nOpen the module that reads the configuration and locate the failing branch.\n"
+    "**Step 2: Fix the edge case**\nHandle empty values before they are split and add a regression test.\n"
+)
+
+
+# --- Fakes ---
+def fake_ollama_app(tokens: int, ttft: float, token_latency: float):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI()
+    words = GUIDE_TEXT.split(" ")
+
+    def token(i: int) -> str:
+        return words[i % len(words)] + " "
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + tokens * token_latency)
+            return {"model": body.get("model"), "response": "".join(token(i) for i in range(tokens)), "done": True}
+
+        async def chunks():
+            await asyncio.sleep(ttft)
+            for i in range(tokens):
+                yield json.dumps({"response": token(i), "done": False}) + "\n"
+                await asyncio.sleep(token_latency)
+            yield json.dumps({"response": "", "done": True, "eval_count": tokens}) + "\n"
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        embeddings = []
+        for text in texts:
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            embeddings.append([byte / 255.0 for byte in digest])
+        return {"model": body.get("model"), "embeddings": embeddings}
+
+    return app
+
+
+def fake_github_app():
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, Response
+
+    app = FastAPI()
+
+    def etagged(request: Request, payload: dict):
+        etag = '"' + hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest() + '"'
+        headers = {"ETag": etag, "X-RateLimit-Remaining": "4999", "X-RateLimit-Limit": "5000"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(payload, headers=headers)
+
+    @app.get("/user")
+    async def user(request: Request):
+        return etagged(request, {"login": "loadtest", "public_repos": 3, "followers": 0})
+
+    @app.get("/repos/{owner}/{repo}/issues/{number}")
+    async def issue(owner: str, repo: str, number: int, request: Request):
+        return etagged(request, {
+            "number": number,
+            "title": f"Configuration parser fails on empty values ({number})",
+            "body": "Reading a config file with an empty value raises an IndexError in the parser.",
+            "html_url": f"https://github.com/{owner}/{repo}/issues/{number}",
+        })
+
+    @app.post("/graphql")
+    async def graphql(request: Request):
+        variables = (await request.json()).get("variables", {})
+        nodes = [
+            {
+                "databaseId": i,
+                "title": f"Issue {i}",
+                "url": f"{REPO_URL}/issues/{i}",
+                "repository": {"nameWithOwner": "loadtest/sample"},
+                "labels": {"nodes": [{"name": "good first issue"}]},
+            }
+            for i in range(1, min(variables.get("first", 10), 30) + 1)
+        ]
+        return {"data": {"search": {"pageInfo": {"hasNextPage": False, "endCursor": None}, "nodes": nodes}}}
+
+    return app
+
+
+async def serve_fakes(ollama_port: int, github_port: int, tokens: int, ttft: float, token_latency: float):
+    import uvicorn
+
+    servers = [
+        uvicorn.Server(uvicorn.Config(fake_ollama_app(tokens, ttft, token_latency), host="127.0.0.1", port=ollama_port, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(fake_github_app(), host="127.0.0.1", port=github_port, log_level="warning")),
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def serve_backend(port: int, github_url: str):
+    import uvicorn
+
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+
+    # Stub Descope: every bearer token is a valid session of its own user.
+    main.token_cache.validate_sync = lambda token: {"sub": token, "exp": time.time() + 3600}
+    main.fetch_descope_keys = lambda descope_client: 0
+    main.github_client.base_url = github_url
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# --- Fixture ---
+def git(*args: str, cwd: Optional[str] = None):
+    subprocess.run(["git", "-c", "user.name=loadtest", "-c", "user.email=loadtest@example.com", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def create_fixture_repo(workdir: str, files: int) -> Tuple[str, List[str]]:
+    """
+    Generates a repository of `files` Python modules as a bare repository.
+    Returns the directory standing in for https://github.com/ and the module paths.
+    """
+    source = os.path.join(workdir, "source")
+    rng = random.Random(0)
+    paths = []
+    for i in range(files):
+        package = f"pkg{i % 20}/sub{i % 5}"
+        path = f"{package}/module_{i}.py"
+        paths.append(path)
+        os.makedirs(os.path.join(source, package), exist_ok=True)
+        with open(os.path.join(source, path), "w") as f:
+            for j in range(rng.randint(3, 12)):
+                f.write(f"def parse_value_{i}_{j}(text):\n    \"\"\"Parses one configuration value.\"\"\"\n    return text.split('=')[{j % 2}].strip()\n\n\n")
+            f.write(f"class Config{i}:\n    def load(self, path):\n        with open(path) as f:\n            return [parse_value_{i}_0(line) for line in f]\n")
+    with open(os.path.join(source, "README.md"), "w") as f:
+        f.write("# sample\n\nGenerated for the load test.\n")
+    git("init", "-q", cwd=source)
+    git("add", "-A", cwd=source)
+    git("commit", "-q", "-m", "Initial commit", cwd=source)
+
+    remotes = os.path.join(workdir, "remotes")
+    git("clone", "-q", "--bare", source, os.path.join(remotes, "loadtest", "sample"))
+    return remotes, paths
+
+
+# --- Load generation ---
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(url: str, process: subprocess.Popen):
+    deadline = time.monotonic() + READY_TIMEOUT
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with status {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {READY_TIMEOUT:.0f}s")
+
+
+def auth(worker: int) -> dict:
+    return {"Authorization": f"Bearer loadtest-user-{worker}"}
+
+
+async def timed(client: httpx.AsyncClient, method: str, path: str, worker: int, **kwargs) -> dict:
+    """Sends one request and reads the whole body; SSE `error` events count as failures."""
+    started = time.perf_counter()
+    ttfb = None
+    failed = False
+    async with client.stream(method, path, headers=auth(worker), **kwargs) as response:
+        async for chunk in response.aiter_bytes():
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+            if b"event: error" in chunk:
+                failed = True
+    latency = time.perf_counter() - started
+    return {"status": response.status_code, "ok": response.status_code < 400 and not failed, "latency": latency, "ttfb": ttfb or latency}
+
+
+def scenario_analyze(paths: List[str]) -> Callable:
+    async def run(client: httpx.AsyncClient, worker: int, i: int) -> dict:
+        return await timed(client, "POST", "/api/analyze/repo", worker, json={"repoUrl": REPO_URL})
+    return run
+
+
+def scenario_file_content(paths: List[str]) -> Callable:
+    async def run(client: httpx.AsyncClient, worker: int, i: int) -> dict:
+        path = paths[(worker * 7919 + i) % len(paths)]
+        return await timed(client, "GET", "/api/repo/file_content", worker, params={"repo_url": REPO_URL, "file_path": path})
+    return run
+
+
+def scenario_chat(paths: List[str]) -> Callable:
+    async def run(client: httpx.AsyncClient, worker: int, i: int) -> dict:
+        return await timed(client, "POST", "/api/chat/stream", worker, json={"message": f"How does the parser handle empty values? ({worker}-{i})"})
+    return run
+
+
+def scenario_guide(paths: List[str]) -> Callable:
+    async def run(client: httpx.AsyncClient, worker: int, i: int) -> dict:
+        request = {"repoUrl": REPO_URL, "issueUrl": ISSUE_URL, "issueTitle": "Configuration parser fails on empty values", "issueBody": ""}
+        return await timed(client, "POST", "/api/contribute/guide/stream", worker, json=request)
+    return run
+
+
+SCENARIOS: Dict[str, Callable[[List[str]], Callable]] = {
+    "analyze": scenario_analyze,
+    "file_content": scenario_file_content,
+    "chat": scenario_chat,
+    "guide": scenario_guide,
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "p50": round(percentile(values, 0.50), 5),
+        "p95": round(percentile(values, 0.95), 5),
+        "p99": round(percentile(values, 0.99), 5),
+        "mean": round(sum(values) / len(values), 5) if values else 0.0,
+        "max": round(max(values), 5) if values else 0.0,
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, request: Callable, concurrency: int, duration: float) -> dict:
+    warmup = await request(client, 0, -1)
+    results: List[dict] = []
+    errors: Dict[str, int] = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(n: int):
+        i = 0
+        while time.perf_counter() < deadline:
+            try:
+                results.append(await request(client, n, i))
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            i += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    ok = [result for result in results if result["ok"]]
+    return {
+        "requests": len(results),
+        "failed": len(results) - len(ok) + sum(errors.values()),
+        "statuses": statuses,
+        "transportErrors": errors,
+        "seconds": round(elapsed, 3),
+        "requestsPerSecond": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "warmupSeconds": round(warmup["latency"], 4),
+        "latency": summarize([result["latency"] for result in ok]),
+        "ttfb": summarize([result["ttfb"] for result in ok]),
+    }
+
+
+async def run_load(base_url: str, scenarios: List[str], paths: List[str], concurrency: int, duration: float) -> dict:
+    results = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        for name in scenarios:
+            results[name] = await run_scenario(client, name, SCENARIOS[name](paths), concurrency, duration)
+            print_scenario(name, results[name])
+    return results
+
+
+def print_scenario(name: str, result: dict):
+    latency, ttfb = result["latency"], result["ttfb"]
+    print(
+        f"  {name:<13} {result['requestsPerSecond']:8.1f} req/s  "
+        f"p50 {latency['p50'] * 1000:8.1f}ms  p95 {latency['p95'] * 1000:8.1f}ms  p99 {latency['p99'] * 1000:8.1f}ms  "
+        f"ttfb p50 {ttfb['p50'] * 1000:7.1f}ms  failed {result['failed']}/{result['requests']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per scenario")
+    parser.add_argument("--files", type=int, default=500, help="files in the generated repository")
+    parser.add_argument("--tokens", type=int, default=64, help="tokens per fake generation")
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory (fixture, clone cache, logs)")
+    # Internal: how the harness starts its child processes.
+    parser.add_argument("--serve", choices=("fakes", "backend"), help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--github-port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve == "fakes":
+        asyncio.run(serve_fakes(args.port, args.github_port, args.tokens, args.ttft, args.token_latency))
+        return
+    if args.serve == "backend":
+        serve_backend(args.port, f"http://127.0.0.1:{args.github_port}")
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    remotes, paths = create_fixture_repo(workdir, args.files)
+    ollama_port, github_port, backend_port = free_port(), free_port(), free_port()
+    env = {
+        **os.environ,
+        "GITHUB_PAT": "loadtest",
+        "DESCOPE_PROJECT_ID": "P2loadtest",
+        "DESCOPE_KEY_REFRESH_SECONDS": "0",
+        "MCP_SERVER_URL": f"http://127.0.0.1:{ollama_port}",
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{ollama_port}",
+        "REPO_CACHE_DIR": os.path.join(workdir, "cache"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        # Clone https://github.com/<owner>/<repo> from the local bare repositories.
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": f"url.file://{remotes}/.insteadOf",
+        "GIT_CONFIG_VALUE_0": "https://github.com/",
+    }
+    fake_args = ["--tokens", str(args.tokens), "--ttft", str(args.ttft), "--token-latency", str(args.token_latency)]
+    processes = []
+    try:
+        with open(os.path.join(workdir, "fakes.log"), "w") as fakes_log, open(os.path.join(workdir, "backend.log"), "w") as backend_log:
+            fakes = subprocess.Popen(
+                [sys.executable, __file__, "--serve", "fakes", "--port", str(ollama_port), "--github-port", str(github_port), *fake_args],
+                env=env, stdout=fakes_log, stderr=subprocess.STDOUT,
+            )
+            processes.append(fakes)
+            backend = subprocess.Popen(
+                [sys.executable, __file__, "--serve", "backend", "--port", str(backend_port), "--github-port", str(github_port)],
+                cwd=BACKEND_DIR, env=env, stdout=backend_log, stderr=subprocess.STDOUT,
+            )
+            processes.append(backend)
+            asyncio.run(wait_ready(f"http://127.0.0.1:{ollama_port}/docs", fakes))
+            asyncio.run(wait_ready(f"http://127.0.0.1:{backend_port}/", backend))
+
+            print(f"{len(paths)} files, {args.concurrency} clients, {args.duration:.0f}s per scenario, "
+                  f"{args.tokens} tokens at {args.token_latency * 1000:.0f}ms after {args.ttft * 1000:.0f}ms:")
+            results = asyncio.run(run_load(f"http://127.0.0.1:{backend_port}", scenarios, paths, args.concurrency, args.duration))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if args.keep:
+            print(f"working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "startedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {key: value for key, value in vars(args).items() if key not in ("serve", "port", "github_port", "output", "keep")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from prompt_context import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# The newest turns are never compacted, so the model always sees the latest exchange verbatim.
+MIN_RECENT_TURNS = 2
+
+
+def new_session(repo_url: str, owner: str) -> dict:
+    """A session about `repo_url` that only the user `owner` (their token's subject) may read or continue."""
+    now = time.time()
+    return {"id": secrets.token_urlsafe(16), "owner": owner, "repoUrl": repo_url, "summary": "", "turns": [], "createdAt": now, "updatedAt": now}
+
+
+def add_turn(session: dict, role: str, content: str):
+    session["turns"].append({"role": role, "content": content, "tokens": estimate_tokens(content)})
+    session["updatedAt"] = time.time()
+
+
+def history_tokens(session: dict) -> int:
+    return estimate_tokens(session["summary"]) + sum(turn["tokens"] for turn in session["turns"])
+
+
+def turns_to_compact(session: dict, token_budget: int) -> int:
+    """
+    Number of oldest turns to fold into the summary so the rest of the
+    history fits in `token_budget`. Turns are compacted in user/assistant pairs.
+    """
+    turns = session["turns"]
+    total = history_tokens(session)
+    count = 0
+    while total > token_budget and len(turns) - count > MIN_RECENT_TURNS:
+        total -= turns[count]["tokens"]
+        count += 1
+    if count % 2:
+        count = count + 1 if len(turns) - count - 1 >= MIN_RECENT_TURNS else count - 1
+    return count
+
+
+def format_turns(turns: List[dict]) -> str:
+    return "".join(f"{'User' if turn['role'] == 'user' else 'AI'}: {turn['content']}\n" for turn in turns)
+
+
+def build_compaction_prompt(summary: str, turns: List[dict]) -> str:
+    return (
+        "Summarize the following conversation between a user and an AI assistant about a code repository. "
+        "Keep the facts, file names, decisions and open questions a later answer would need. "
+        "Reply with the summary only, in at most 150 words.\n\n"
+        + (f"Summary of the conversation so far:\n{summary}\n\n" if summary else "")
+        + f"Conversation:\n{format_turns(turns)}"
+    )
+
+
+def fallback_summary(summary: str, turns: List[dict], max_chars: int = 1200) -> str:
+    """Used when the model cannot summarize: keeps the user's questions, newest last, within `max_chars`."""
+    questions = [f"- {turn['content'][:200]}" for turn in turns if turn["role"] == "user"]
+    text = "\n".join(([summary] if summary else []) + ["Earlier questions:"] + questions)
+    return text[-max_chars:]
+
+
+def apply_compaction(session: dict, count: int, summary: str):
+    session["turns"] = session["turns"][count:]
+    session["summary"] = summary.strip()
+    session["updatedAt"] = time.time()
+
+
+def select_history(session: dict, token_budget: int) -> Tuple[str, List[dict]]:
+    """The summary and the newest turns that fit in `token_budget` (the summary is counted first)."""
+    remaining = token_budget - estimate_tokens(session["summary"])
+    selected: List[dict] = []
+    for turn in reversed(session["turns"]):
+        remaining -= turn["tokens"]
+        if remaining < 0 and len(selected) >= MIN_RECENT_TURNS:
+            break
+        selected.append(turn)
+    selected.reverse()
+    return session["summary"], selected
+
+
+class ChatSessionStore:
+    """
+    SQLite-backed store of chat sessions (one JSON document per session).
+
+    Sessions idle for longer than the TTL passed to `purge` are deleted, and
+    sessions saved before they recorded an owner are dropped when the store
+    is opened, since nobody could read them. All methods are blocking and
+    thread-safe.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)")
+        ownerless = self._db.execute("DELETE FROM sessions WHERE json_extract(data, '$.owner') IS NULL").rowcount
+        if ownerless:
+            logger.warning("Dropped %d chat sessions saved without an owner", ownerless)
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+                (session["id"], json.dumps(session), session["updatedAt"]),
+            )
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def purge(self, max_idle: float) -> List[str]:
+        """Deletes the sessions idle for longer than `max_idle` seconds and returns their ids."""
+        cutoff = time.time() - max_idle
+        with self._lock:
+            # One statement, so a session saved in between is neither reported nor deleted by mistake.
+            removed = [row[0] for row in self._db.execute("DELETE FROM sessions WHERE updated_at < ? RETURNING id", (cutoff,)).fetchall()]
+        if removed:
+            logger.info("Purged %d idle chat sessions", len(removed))
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
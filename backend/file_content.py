@@ -0,0 +1,148 @@
+import email.utils
+import logging
+import mmap
+import os
+from typing import Dict, Iterator, Mapping, Optional, Tuple, Union
+
+import git
+
+logger = logging.getLogger(__name__)
+
+# Same heuristic as git: a NUL byte within the first 8000 bytes means binary.
+BINARY_SNIFF_BYTES = 8000
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    """Raised when a requested byte or line range lies outside the file."""
+
+
+def read_blob_index(repo_path: str) -> dict:
+    """
+    Lists the blob id of every file at HEAD, plus the commit time.
+
+    Blob ids only change with a file's content, so they make ETags that stay
+    valid across refreshes of the same repository.
+    """
+    repo = git.Repo(repo_path)
+    try:
+        output = repo.git.ls_tree("-r", "-z", "HEAD")
+        commit_time = repo.head.commit.committed_date
+    finally:
+        repo.close()
+    blobs: Dict[str, str] = {}
+    for record in output.split("\0"):
+        if not record:
+            continue
+        meta, path = record.split("\t", 1)
+        _, object_type, sha = meta.split(" ")
+        if object_type == "blob":
+            blobs[path] = sha
+    return {"commitTime": commit_time, "blobs": blobs}
+
+
+def is_binary(sample: bytes) -> bool:
+    return b"\0" in sample[:BINARY_SNIFF_BYTES]
+
+
+def map_file(path: str) -> Union[mmap.mmap, bytes]:
+    """
+    Maps a file read-only (empty files, which cannot be mapped, give b"").
+
+    The mapping stays readable after the lease on the checkout is released:
+    git and eviction replace or unlink files rather than rewriting them, so
+    a mapped file keeps its content while it is streamed to a slow client.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range `Range: bytes=...` header into a [start, end) span.
+
+    Returns None when the header should be ignored (other units, several
+    ranges) and raises RangeNotSatisfiable when it lies outside the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            start, end = max(0, size - int(last)), size
+        else:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def file_validators(opened: dict) -> dict:
+    """The ETag, Last-Modified and Cache-Control headers of an opened file."""
+    return {
+        "ETag": opened["etag"],
+        "Last-Modified": email.utils.formatdate(opened["last_modified"], usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+
+
+def is_not_modified(headers: Mapping[str, str], opened: dict) -> bool:
+    """
+    True if the conditional request `headers` (lower-case names) match the
+    opened file. If-None-Match takes precedence over If-Modified-Since.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or opened["etag"] in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return email.utils.parsedate_to_datetime(if_modified_since).timestamp() >= opened["last_modified"]
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def line_span(data: Union[mmap.mmap, bytes], start_line: int, end_line: Optional[int]) -> Tuple[int, int]:
+    """
+    Returns the [start, end) byte span of lines `start_line`..`end_line` (1-based, inclusive).
+
+    Only the bytes up to the last requested line are scanned.
+    """
+    if end_line is not None and end_line < start_line:
+        raise RangeNotSatisfiable(f"lines={start_line}-{end_line}")
+    size = len(data)
+    offset = 0
+    for _ in range(start_line - 1):
+        offset = data.find(b"\n", offset) + 1
+        if offset == 0:
+            raise RangeNotSatisfiable(f"lines={start_line}-{end_line or ''}")
+    if offset >= size and size:
+        raise RangeNotSatisfiable(f"lines={start_line}-{end_line or ''}")
+    if end_line is None:
+        return offset, size
+    end = offset
+    for _ in range(end_line - start_line + 1):
+        end = data.find(b"\n", end) + 1
+        if end == 0:
+            return offset, size
+    return offset, end
+
+
+def iter_span(data: Union[mmap.mmap, bytes], start: int, end: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yields bytes [start, end) of a mapped file in chunks and closes the mapping. Blocking."""
+    try:
+        for offset in range(start, end, chunk_size):
+            yield data[offset:min(offset + chunk_size, end)]
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
@@ -0,0 +1,207 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+IGNORED_NAMES = {".git"}
+
+# Bits of the `flags` column in the columnar tree format
+FLAG_DIRECTORY = 1
+
+# Relative directory path ("" for the repo root) -> [(name, is_dir), ...], directories first.
+Listing = Dict[str, List[Tuple[str, bool]]]
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _sort_key(entry: Tuple[str, bool]):
+    return (not entry[1], entry[0])
+
+
+def scan_directory(root_dir: str, rel_dir: str = "", max_depth: Optional[int] = None) -> Listing:
+    """
+    Walks `rel_dir` (relative to `root_dir`) with os.scandir and returns its flat listing.
+
+    Depth 0 is the listing of `rel_dir` itself; directories deeper than
+    `max_depth` are not read. Symlinks are listed but never followed, so a
+    checkout cannot loop or point the walker outside of itself.
+    """
+    listing: Listing = {}
+    base_depth = rel_dir.count("/") + 1 if rel_dir else 0
+    stack = [rel_dir]
+    while stack:
+        current = stack.pop()
+        entries = []
+        try:
+            with os.scandir(os.path.join(root_dir, current) if current else root_dir) as it:
+                for entry in it:
+                    if entry.name in IGNORED_NAMES:
+                        continue
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    entries.append((entry.name, is_dir))
+        except OSError as e:
+            logger.warning("Cannot list %s: %s", current or root_dir, e)
+        entries.sort(key=_sort_key)
+        listing[current] = entries
+
+        depth = (current.count("/") + 1 if current else 0) - base_depth
+        if max_depth is None or depth < max_depth:
+            prefix = f"{current}/" if current else ""
+            stack.extend(prefix + name for name, is_dir in entries if is_dir)
+    return listing
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def scan_tree(root_dir: str, max_depth: Optional[int] = None, workers: int = 1) -> Listing:
+    """
+    Returns the listing of a whole checkout.
+
+    With `workers` > 1 each top-level directory is walked in a separate
+    process, which pays off for monorepos with several large subtrees.
+    """
+    top = scan_directory(root_dir, "", max_depth=0)
+    subtrees = [name for name, is_dir in top[""] if is_dir]
+    if max_depth == 0 or not subtrees:
+        return top
+    child_depth = None if max_depth is None else max_depth - 1
+
+    if workers <= 1 or len(subtrees) < 2:
+        for name in subtrees:
+            top.update(scan_directory(root_dir, name, child_depth))
+        return top
+
+    executor = _get_executor(workers)
+    futures = [executor.submit(scan_directory, root_dir, name, child_depth) for name in subtrees]
+    for future in futures:
+        top.update(future.result())
+    return top
+
+
+def make_node(listing: Listing, path: str, name: str, is_dir: bool) -> dict:
+    if not is_dir:
+        return {"name": name, "path": path, "type": "file", "children": []}
+    entries = listing.get(path)
+    return {"name": name, "path": path, "type": "directory", "children": None, "childCount": None if entries is None else len(entries)}
+
+
+def nest(listing: Listing, rel_dir: str = "", max_depth: Optional[int] = None, max_children: Optional[int] = None, depth: int = 0) -> List[dict]:
+    """
+    Turns a flat listing into the nested [{name, path, type, children}] shape served by the API.
+
+    Directories below `max_depth` are left unexpanded (`children` is None),
+    and directories below the top level include at most `max_children`
+    entries. Every directory carries a `childCount`, so clients can fetch
+    the rest on demand.
+    """
+    prefix = f"{rel_dir}/" if rel_dir else ""
+    entries = listing.get(rel_dir, ())
+    if max_children is not None and depth > 0:
+        entries = entries[:max_children]
+    items = []
+    for name, is_dir in entries:
+        node = make_node(listing, prefix + name, name, is_dir)
+        if is_dir and (max_depth is None or depth < max_depth):
+            node["children"] = nest(listing, node["path"], max_depth, max_children, depth + 1)
+        items.append(node)
+    return items
+
+
+def list_children(listing: Listing, rel_dir: str, offset: int = 0, limit: Optional[int] = None) -> Tuple[List[dict], int]:
+    """Returns one page of a directory's direct children (unexpanded) and the total number of children."""
+    entries = listing[rel_dir]
+    page = entries[offset:] if limit is None else entries[offset:offset + limit]
+    prefix = f"{rel_dir}/" if rel_dir else ""
+    return [make_node(listing, prefix + name, name, is_dir) for name, is_dir in page], len(entries)
+
+
+def build_file_tree(root_dir: str, max_depth: Optional[int] = 4, workers: int = 1) -> List[dict]:
+    """
+    Builds the nested file tree of a checkout as plain dicts.
+
+    Nodes are only validated (as FileItem) when a response is serialized.
+    """
+    return nest(scan_tree(root_dir, max_depth=max_depth, workers=workers), max_depth=max_depth)
+
+
+def to_columnar(listing: Listing) -> dict:
+    """
+    Encodes a whole listing as parallel arrays: names, parent indices and flags.
+
+    Nodes are emitted breadth-first, so a node's parent always has a smaller
+    index (-1 for top-level entries) and clients can rebuild every path in a
+    single forward pass: path[i] = path[parents[i]] + "/" + names[i].
+    """
+    names: List[str] = []
+    parents: List[int] = []
+    flags: List[int] = []
+    queue = deque([("", -1)])
+    while queue:
+        rel_dir, parent = queue.popleft()
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        for name, is_dir in listing.get(rel_dir, ()):
+            if is_dir:
+                queue.append((prefix + name, len(names)))
+            names.append(name)
+            parents.append(parent)
+            flags.append(FLAG_DIRECTORY if is_dir else 0)
+    return {"names": names, "parents": parents, "flags": flags}
+
+
+def count_nodes(listing: Listing) -> int:
+    return sum(len(entries) for entries in listing.values())
+
+
+def patch_listing(listing: Listing, changes: dict, repo_root: str):
+    """Applies the paths added/deleted by a refresh to a stored listing instead of re-walking the checkout."""
+    touched = set()
+
+    def add_entry(parent: str, name: str, is_dir: bool):
+        entries = listing.setdefault(parent, [])
+        if not any(entry[0] == name for entry in entries):
+            entries.append((name, is_dir))
+            touched.add(parent)
+
+    def remove_entry(parent: str, name: str):
+        if parent in listing:
+            listing[parent] = [entry for entry in listing[parent] if entry[0] != name]
+
+    for path in changes["deleted"]:
+        parts = path.split("/")
+        remove_entry("/".join(parts[:-1]), parts[-1])
+        # Git does not track empty directories, so drop the ones the deletion emptied.
+        for depth in range(len(parts) - 1, 0, -1):
+            if os.path.isdir(os.path.join(repo_root, *parts[:depth])):
+                break
+            dir_path = "/".join(parts[:depth])
+            remove_entry("/".join(parts[:depth - 1]), parts[depth - 1])
+            for stale in [d for d in listing if d == dir_path or d.startswith(dir_path + "/")]:
+                del listing[stale]
+
+    for path in changes["added"]:
+        parts = path.split("/")
+        for depth in range(1, len(parts)):
+            add_entry("/".join(parts[:depth - 1]), parts[depth - 1], True)
+            listing.setdefault("/".join(parts[:depth]), [])
+        add_entry("/".join(parts[:-1]), parts[-1], False)
+
+    for parent in touched:
+        listing[parent].sort(key=_sort_key)
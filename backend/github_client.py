@@ -0,0 +1,241 @@
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from metrics import Histogram
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+GITHUB_API_URL = "https://api.github.com"
+
+GITHUB_REQUEST_DURATION = Histogram(
+    "github_request_duration_seconds", "Latency of requests sent to the GitHub API.", ["resource", "status"]
+)
+
+# Seconds a response is served without asking GitHub again, per kind of resource.
+DEFAULT_TTLS = {"search": 300.0, "issue": 300.0, "user": 600.0}
+
+# GraphQL returns each issue's repository and labels with the search results, so a
+# search costs one request per page instead of extra lookups per issue.
+SEARCH_ISSUES_QUERY = """
+query($query: String!, $first: Int!, $after: String) {
+  search(query: $query, type: ISSUE, first: $first, after: $after) {
+    pageInfo { hasNextPage endCursor }
+    nodes {
+      ... on Issue {
+        databaseId
+        title
+        url
+        repository { nameWithOwner }
+        labels(first: 20) { nodes { name } }
+      }
+    }
+  }
+}
+"""
+MAX_PAGE_SIZE = 100
+
+
+class GitHubAPIError(Exception):
+    """Raised when GitHub answers with an error or cannot be reached."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class GitHubClient:
+    """
+    Async client for the GitHub REST and GraphQL APIs with a shared response cache.
+
+    Each resource kind has its own TTL. Once a response is older than its
+    TTL it is revalidated with `If-None-Match`; a 304 answer refreshes the
+    entry and does not count against the rate limit. Concurrent requests
+    for the same URL share one upstream call, and a stale entry is served
+    if GitHub fails while revalidating it. GraphQL responses carry no ETag
+    and are simply refetched once their TTL has passed.
+
+    The latest rate-limit headers seen for every GitHub resource (core,
+    search, ...) are kept for `stats()`.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str],
+        ttls: Optional[Dict[str, float]] = None,
+        max_entries: int = 2048,
+        base_url: str = GITHUB_API_URL,
+        timeout: float = 15.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.token = token
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._entries: "OrderedDict[Tuple[str, Tuple], dict]" = OrderedDict()
+        self._flights = SingleFlight()
+        self.hits: Counter = Counter()
+        self.revalidated: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.stale: Counter = Counter()
+        self.rate_limits: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            headers = {"Accept": "application/vnd.github+json", "X-GitHub-Api-Version": "2022-11-28"}
+            if self.token:
+                headers["Authorization"] = f"Bearer {self.token}"
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, headers=headers, timeout=self.timeout, transport=self.transport
+            )
+        return self._client
+
+    def _remember(self, key: Tuple[str, Tuple], entry: dict):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _record_rate_limit(self, response: httpx.Response):
+        remaining = response.headers.get("x-ratelimit-remaining")
+        if remaining is None:
+            return
+        resource = response.headers.get("x-ratelimit-resource", "core")
+        self.rate_limits[resource] = {
+            "limit": int(response.headers.get("x-ratelimit-limit", 0)),
+            "remaining": int(remaining),
+            "reset": int(response.headers.get("x-ratelimit-reset", 0)),
+        }
+
+    async def get(self, kind: str, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """Returns the decoded JSON of GET `path`, cached under the TTL of `kind`."""
+        key = (path, tuple(sorted((params or {}).items())))
+        return await self._cached(kind, key, lambda headers: self.client.get(path, params=params, headers=headers))
+
+    async def graphql(self, kind: str, query: str, variables: Dict[str, Any]) -> dict:
+        """Runs a GraphQL query and returns its `data`, cached under the TTL of `kind`."""
+        key = (query, tuple(sorted(variables.items())))
+        payload = {"query": query, "variables": variables}
+        result = await self._cached(kind, key, lambda headers: self.client.post("/graphql", json=payload, headers=headers))
+        return result["data"]
+
+    async def _cached(self, kind: str, key: Tuple[str, Tuple], send: Callable[[Dict[str, str]], Awaitable[httpx.Response]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry["fetchedAt"] < self.ttls.get(kind, 0):
+            self._entries.move_to_end(key)
+            self.hits[kind] += 1
+            return entry["data"]
+        if self._flights.in_flight(key):
+            # Answered by the request already on its way to GitHub.
+            self.hits[kind] += 1
+        return await self._flights.do(key, lambda: self._fetch(kind, key, send))
+
+    async def _fetch(self, kind: str, key: Tuple[str, Tuple], send: Callable[[Dict[str, str]], Awaitable[httpx.Response]]) -> Any:
+        entry = self._entries.get(key)
+        headers = {"If-None-Match": entry["etag"]} if entry is not None and entry["etag"] else {}
+        started = time.perf_counter()
+        try:
+            response = await send(headers)
+        except httpx.HTTPError as e:
+            GITHUB_REQUEST_DURATION.labels(kind, "error").observe(time.perf_counter() - started)
+            return self._serve_stale(kind, key, GitHubAPIError(f"GitHub request failed: {e!r}"))
+        GITHUB_REQUEST_DURATION.labels(kind, response.status_code).observe(time.perf_counter() - started)
+        self._record_rate_limit(response)
+
+        if response.status_code == 304 and entry is not None:
+            self.revalidated[kind] += 1
+            entry["fetchedAt"] = time.monotonic()
+            self._remember(key, entry)
+            return entry["data"]
+        if response.status_code >= 400:
+            try:
+                message = response.json().get("message", response.reason_phrase)
+            except ValueError:
+                message = response.reason_phrase
+            error = GitHubAPIError(message, response.status_code)
+            if response.status_code in (403, 429) or response.status_code >= 500:
+                return self._serve_stale(kind, key, error)
+            raise error
+
+        data = response.json()
+        if isinstance(data, dict) and data.get("errors") and not data.get("data"):
+            # GraphQL reports failures in the body of a 200 response.
+            error = GitHubAPIError("; ".join(e.get("message", "") for e in data["errors"]), response.status_code)
+            if any(e.get("type") == "RATE_LIMITED" for e in data["errors"]):
+                return self._serve_stale(kind, key, error)
+            raise error
+        self.misses[kind] += 1
+        self._remember(key, {"etag": response.headers.get("etag"), "data": data, "fetchedAt": time.monotonic()})
+        return data
+
+    def _serve_stale(self, kind: str, key: Tuple[str, Tuple], error: GitHubAPIError) -> Any:
+        """Falls back to an expired entry when GitHub is failing or rate limiting; re-raises without one."""
+        entry = self._entries.get(key)
+        if entry is None:
+            raise error
+        logger.warning("Serving stale GitHub response for %s: %s", key[0], error)
+        self.stale[kind] += 1
+        return entry["data"]
+
+    async def search_issues(self, query: str, limit: int, sort: str = "created", order: str = "desc") -> List[dict]:
+        """
+        Returns up to `limit` issues matching `query` as {id, title, url, repoName, labels},
+        paging through the GraphQL search (one request per 100 issues).
+        """
+        search_query = f"{query} sort:{sort}-{order}"
+        issues: List[dict] = []
+        cursor = None
+        while len(issues) < limit:
+            variables = {"query": search_query, "first": min(MAX_PAGE_SIZE, limit - len(issues)), "after": cursor}
+            page = (await self.graphql("search", SEARCH_ISSUES_QUERY, variables))["search"]
+            for node in page["nodes"]:
+                # Search results that are not issues (pull requests) come back as empty objects.
+                if node and node.get("databaseId") is not None:
+                    issues.append({
+                        "id": node["databaseId"],
+                        "title": node["title"],
+                        "url": node["url"],
+                        "repoName": node["repository"]["nameWithOwner"],
+                        "labels": [label["name"] for label in node["labels"]["nodes"]],
+                    })
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            cursor = page["pageInfo"]["endCursor"]
+        return issues[:limit]
+
+    async def get_issue(self, repo_full_name: str, number: int) -> dict:
+        return await self.get("issue", f"/repos/{repo_full_name}/issues/{number}")
+
+    async def get_authenticated_user(self) -> dict:
+        return await self.get("user", "/user")
+
+    def stats(self) -> dict:
+        kinds = sorted(set(self.hits) | set(self.revalidated) | set(self.misses) | set(self.stale))
+        resources = {}
+        for kind in kinds:
+            served_locally = self.hits[kind] + self.revalidated[kind] + self.stale[kind]
+            total = served_locally + self.misses[kind]
+            resources[kind] = {
+                "hits": self.hits[kind],
+                "revalidated": self.revalidated[kind],
+                "misses": self.misses[kind],
+                "stale": self.stale[kind],
+                "hitRate": round(served_locally / total, 4) if total else 0.0,
+            }
+        return {"resources": resources, "rateLimit": dict(self.rate_limits), "entries": len(self._entries)}
+
+    async def start(self):
+        _ = self.client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATES = ("succeeded", "failed")
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue already holds `max_queued` jobs."""
+
+
+class Job:
+    """
+    One unit of background work and its progress.
+
+    `update` must be called on the event loop; code running in a worker
+    thread reports through `update_threadsafe`.
+    """
+
+    def __init__(self, kind: str, key: str, loop: asyncio.AbstractEventLoop):
+        self.id = secrets.token_urlsafe(12)
+        self.kind = kind
+        self.key = key
+        self.status = "queued"
+        self.stage = "queued"
+        self.stages: List[Dict[str, Any]] = [{"stage": "queued", "at": time.time()}]
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._loop = loop
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        # Wakes every watcher; later waits use a fresh event.
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def update(self, stage: Optional[str] = None, **progress):
+        """Moves the job to `stage` (progress counters are reset) and/or records progress counters."""
+        if self.finished:
+            return
+        if stage is not None and stage != self.stage:
+            self.stage = stage
+            self.stages.append({"stage": stage, "at": time.time()})
+            self.progress = {}
+        self.progress.update(progress)
+        self._notify()
+
+    def update_threadsafe(self, stage: Optional[str] = None, **progress):
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self.update(stage, **progress)
+        else:
+            self._loop.call_soon_threadsafe(lambda: self.update(stage, **progress))
+
+    def _finish(self, status: str, result: Any = None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self.stages.append({"stage": status, "at": self.finished_at})
+        self._notify()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": list(self.stages),
+            "progress": dict(self.progress),
+            "error": self.error,
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+        }
+        if include_result and self.status == "succeeded":
+            data["result"] = self.result
+        return data
+
+    async def watch(self) -> AsyncIterator["Job"]:
+        """Yields the job now and after every change, until it has finished."""
+        while True:
+            changed = self._changed
+            yield self
+            if self.finished:
+                return
+            await changed.wait()
+
+
+class JobManager:
+    """
+    Runs submitted coroutines on a fixed number of asyncio workers.
+
+    Jobs are de-duplicated by key: submitting a key that is still queued or
+    running returns the existing job. Finished jobs (and their results) are
+    kept for `result_ttl` seconds, at most `max_retained` of them.
+    """
+
+    def __init__(self, workers: int = 4, max_queued: int = 100, result_ttl: float = 3600.0, max_retained: int = 1000):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.max_retained = max_retained
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[str, Job] = {}
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, kind: str, key: str, fn: Callable[[Job], Awaitable[Any]]) -> Job:
+        """Queues `fn(job)` unless a job with `key` is still pending, whose Job is returned instead."""
+        active = self._active.get(key)
+        if active is not None:
+            logger.debug("Joining pending job %s for %s", active.id, key)
+            return active
+        if self._queue is None:
+            raise RuntimeError("JobManager.start() has not been called")
+        if self._queue.qsize() >= self.max_queued:
+            raise JobQueueFull(f"{self._queue.qsize()} jobs are already queued")
+        self._expire()
+        job = Job(kind, key, asyncio.get_running_loop())
+        self._jobs[job.id] = job
+        self._active[key] = job
+        self._queue.put_nowait((job, fn))
+        logger.info("Queued %s job %s for %s", kind, job.id, key)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def _expire(self):
+        oldest = time.time() - self.result_ttl
+        finished = [job for job in self._jobs.values() if job.finished]
+        excess = len(self._jobs) - self.max_retained
+        for job in finished:
+            if job.finished_at < oldest or excess > 0:
+                del self._jobs[job.id]
+                excess -= 1
+
+    async def _worker(self):
+        while True:
+            job, fn = await self._queue.get()
+            job.status = "running"
+            job.update("running")
+            started = time.perf_counter()
+            try:
+                result = await fn(job)
+            except asyncio.CancelledError:
+                job._finish("failed", error="Cancelled")
+                raise
+            except Exception as e:
+                # HTTPExceptions raised by shared helpers carry their message in `detail`.
+                error = getattr(e, "detail", None) or str(e) or repr(e)
+                logger.error("%s job %s failed after %.1fs: %s", job.kind, job.id, time.perf_counter() - started, error)
+                job._finish("failed", error=str(error))
+            else:
+                logger.info("%s job %s finished in %.1fs", job.kind, job.id, time.perf_counter() - started)
+                job._finish("succeeded", result=result)
+            finally:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        running = sum(1 for job in self._active.values() if job.status == "running")
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": running,
+            "retained": len(self._jobs),
+        }
+
+    async def aclose(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
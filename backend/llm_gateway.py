@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, TypeVar
+
+import httpx
+from fastapi import Request
+
+from metrics import Histogram, exponential_buckets
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "Seconds from sending a streaming generation to its first token.", ["model"]
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second", "Generation speed reported by Ollama (eval_count / eval_duration).", ["model"],
+    buckets=(1, 2.5, 5, 10, 20, 30, 50, 75, 100, 150, 250),
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens", "Prompt tokens evaluated per generation (prompt_eval_count).", ["model"],
+    buckets=exponential_buckets(64, 2, 10),
+)
+
+
+def observe_generation_stats(model: str, stats: Dict[str, Any]):
+    """Records the counters Ollama reports with a finished generation, when present."""
+    if stats.get("eval_count") and stats.get("eval_duration"):
+        LLM_TOKENS_PER_SECOND.labels(model).observe(stats["eval_count"] / (stats["eval_duration"] / 1e9))
+    if stats.get("prompt_eval_count"):
+        LLM_PROMPT_TOKENS.labels(model).observe(stats["prompt_eval_count"])
+
+
+class LLMGatewayError(Exception):
+    """Raised when the generation backend cannot produce a response."""
+
+    def __init__(self, message: str, timeout: bool = False):
+        super().__init__(message)
+        self.timeout = timeout
+
+
+class GenerationCancelled(LLMGatewayError):
+    """Raised when a generation is abandoned because its client disconnected."""
+
+
+class LLMGateway:
+    """
+    Async client for the MCP server's Ollama-compatible generate API.
+
+    A single pooled httpx client is shared by every request so connections
+    are kept alive between generations and the event loop is never blocked.
+    Generations and embedding batches wait for a slot from `admission` (an
+    AdmissionController) when one is given, so an index build queues behind
+    the same concurrency limit as chat. Generations made with `coalesce=True`
+    ask the MCP server to share them with identical requests in flight
+    (`X-Coalesce: always`), even though Ollama samples them.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        timeout: float = 900.0,
+        connect_timeout: float = 10.0,
+        max_connections: int = 64,
+        max_keepalive_connections: int = 16,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        admission=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.transport = transport
+        self.admission = admission
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so the gateway also works before startup hooks have run.
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=self.limits,
+                transport=self.transport,
+            )
+        return self._client
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        if self.admission is None:
+            yield
+        else:
+            async with self.admission.slot():
+                yield
+
+    def _timeout(self, timeout: Optional[float]) -> httpx.Timeout:
+        return httpx.Timeout(timeout or self.timeout, connect=self.connect_timeout)
+
+    def _headers(self, coalesce: bool) -> Optional[Dict[str, str]]:
+        return {"X-Coalesce": "always"} if coalesce else None
+
+    def _payload(self, prompt: str, stream: bool, model: Optional[str], options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": model or self.model, "prompt": prompt, "stream": stream}
+        if options:
+            payload["options"] = options
+        return payload
+
+    async def generate(
+        self,
+        prompt: str,
+        timeout: Optional[float] = None,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        coalesce: bool = False,
+    ) -> str:
+        """Runs a non-streaming generation and returns the completed text."""
+        payload = self._payload(prompt, False, model, options)
+        try:
+            async with self._slot():
+                response = await self.client.post("/api/generate", json=payload, headers=self._headers(coalesce), timeout=self._timeout(timeout))
+            response.raise_for_status()
+            result = response.json()
+            observe_generation_stats(payload["model"], result)
+            return result.get("response", "").strip()
+        except httpx.TimeoutException as e:
+            raise LLMGatewayError(f"Generation timed out: {e!r}", timeout=True) from e
+        except (httpx.HTTPError, ValueError) as e:
+            raise LLMGatewayError(str(e) or repr(e)) from e
+
+    async def stream(
+        self,
+        prompt: str,
+        timeout: Optional[float] = None,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        coalesce: bool = False,
+    ) -> AsyncIterator[str]:
+        """Yields response tokens as the upstream NDJSON stream produces them."""
+        payload = self._payload(prompt, True, model, options)
+        try:
+            async with self._slot():
+                started = time.perf_counter()
+                first_token = True
+                async with self.client.stream("POST", "/api/generate", json=payload, headers=self._headers(coalesce), timeout=self._timeout(timeout)) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("error"):
+                            raise LLMGatewayError(chunk["error"])
+                        token = chunk.get("response")
+                        if token:
+                            if first_token:
+                                first_token = False
+                                LLM_TIME_TO_FIRST_TOKEN.labels(payload["model"]).observe(time.perf_counter() - started)
+                            yield token
+                        if chunk.get("done"):
+                            observe_generation_stats(payload["model"], chunk)
+                            break
+        except httpx.TimeoutException as e:
+            raise LLMGatewayError(f"Generation timed out: {e!r}", timeout=True) from e
+        except (httpx.HTTPError, ValueError) as e:
+            raise LLMGatewayError(str(e) or repr(e)) from e
+
+    async def embed(self, texts: List[str], model: Optional[str] = None, timeout: Optional[float] = None) -> List[List[float]]:
+        """Returns one embedding vector per input text (Ollama /api/embed)."""
+        payload = {"model": model or self.model, "input": texts}
+        try:
+            async with self._slot():
+                response = await self.client.post("/api/embed", json=payload, timeout=self._timeout(timeout))
+            response.raise_for_status()
+            return response.json()["embeddings"]
+        except httpx.TimeoutException as e:
+            raise LLMGatewayError(f"Embedding timed out: {e!r}", timeout=True) from e
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            raise LLMGatewayError(str(e) or repr(e)) from e
+
+    async def start(self):
+        _ = self.client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+async def cancel_on_disconnect(request: Optional[Request], awaitable: Awaitable[T], poll_interval: float = 1.0) -> T:
+    """
+    Awaits `awaitable`, cancelling it if the HTTP client goes away first.
+
+    Without this a closed browser tab would keep an Ollama slot busy until
+    the generation finished on its own.
+    """
+    task = asyncio.ensure_future(awaitable)
+    if request is None:
+        return await task
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected, cancelling generation for %s", request.url.path)
+                task.cancel()
+                raise GenerationCancelled("Client disconnected before generation finished")
+    finally:
+        if not task.done():
+            task.cancel()
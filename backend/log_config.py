@@ -0,0 +1,154 @@
+import atexit
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Mapping, Optional, TextIO, Tuple
+
+DEFAULT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def parse_level(value: str) -> int:
+    value = value.strip().upper()
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value)
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {value}")
+    return level
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Parses `LOG_LEVELS`, e.g. "repo_store=DEBUG,httpx=WARNING", into {logger name: level}."""
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = parse_level(level)
+    return levels
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread as they are, without formatting them.
+
+    The stock QueueHandler renders every message in the logging thread;
+    here `%` formatting and tracebacks are rendered by the listener, so
+    pass values that will not change after the call. When the queue is
+    full records are dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `rate` records per second (bursts of up to `burst`)
+    from each logging call site, for records at or below `max_level`.
+
+    The next record let through from a throttled call site notes how many
+    were suppressed, so per-item debug logs stay cheap without going silent.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, max_level: int = logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.max_level = max_level
+        self._lock = threading.Lock()
+        # (path, line) -> [tokens, last refill, suppressed]
+        self._buckets: Dict[Tuple[str, int], List[float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or self.rate <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                return False
+            bucket[0] = tokens - 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+
+class Sampler:
+    """
+    `if sampler(): logger.debug(...)` logs one call in `every`.
+
+    For per-item events in loops; one counter increment per call.
+    """
+
+    def __init__(self, every: int):
+        self.every = max(1, every)
+        self._count = itertools.count()
+
+    def __call__(self) -> bool:
+        return next(self._count) % self.every == 0
+
+
+def configure_logging(env: Mapping[str, str] = os.environ, stream: Optional[TextIO] = None) -> Optional[QueueListener]:
+    """
+    Sets up root logging from the environment and returns the queue listener (None if logging synchronously).
+    Records are written to `stream` (stderr by default).
+
+    - `LOG_LEVEL`: root level (INFO)
+    - `LOG_LEVELS`: per-logger overrides, e.g. "main=DEBUG,httpx=WARNING"
+    - `LOG_FORMAT`: record format (DEFAULT_FORMAT)
+    - `LOG_QUEUE_SIZE`: records buffered for the writer thread; 0 writes synchronously (10000)
+    - `LOG_DEBUG_RATE`: debug records per second allowed from each call site; 0 disables the limit (20)
+    """
+    root = logging.getLogger()
+    root.setLevel(parse_level(env.get("LOG_LEVEL", "INFO")))
+    for name, level in parse_levels(env.get("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(logging.Formatter(env.get("LOG_FORMAT", DEFAULT_FORMAT)))
+    rate_limit = RateLimitFilter(float(env.get("LOG_DEBUG_RATE", "20")))
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    queue_size = int(env.get("LOG_QUEUE_SIZE", "10000"))
+    if queue_size <= 0:
+        stream_handler.addFilter(rate_limit)
+        root.addHandler(stream_handler)
+        return None
+
+    handler = LazyQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(rate_limit)
+    root.addHandler(handler)
+    listener = QueueListener(handler.queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    # Flushes what is still queued when the process exits.
+    atexit.register(stop_listener, listener)
+    return listener
+
+
+def stop_listener(listener: QueueListener):
+    """Writes out queued records and stops the writer thread; safe to call more than once."""
+    if listener._thread is not None:
+        listener.stop()
@@ -1,26 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Form, Request, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Form, Request, Query, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, List, Tuple
 import os
 import json
+import math
+import copy
+import asyncio
+import functools
+import gzip
+import hashlib
+import hmac
 from dotenv import load_dotenv
-import requests
 import logging
 import tempfile
-import shutil
-import stat
+import time
+from datetime import datetime, timezone
 from pydantic import BaseModel, Field
-from github import Github, GithubException
-import git
 import re
 import uvicorn
 from descope import DescopeClient
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from repo_store import RepoStore, RepoBusyError, RepoNotFoundError
+from singleflight import SingleFlight
+from prompt_context import build_tree_context, estimate_tokens
+from file_content import BINARY_SNIFF_BYTES, RangeNotSatisfiable, read_blob_index, is_binary, map_file, parse_byte_range, line_span, iter_span, file_validators, is_not_modified
+from semantic_index import SemanticIndex, HashingEmbedder, OllamaEmbedder
+from symbol_index import SymbolIndex, extract_symbols_batch, read_sources
+from chat_sessions import ChatSessionStore, new_session, add_turn, select_history, turns_to_compact, build_compaction_prompt, fallback_summary, apply_compaction, format_turns
+from response_cache import ResponseCache, make_key as make_response_cache_key
+from file_tree import scan_tree, nest, list_children, patch_listing, count_nodes, to_columnar, shutdown_executor as shutdown_file_tree_workers
+from log_config import configure_logging
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS_REGISTRY, Counter, Gauge, Histogram, MetricsMiddleware, exponential_buckets, monitor_event_loop_lag
+from admission import AdmissionController, AdmissionRejected, current_client
+from token_cache import TokenCache, fetch_descope_keys, refresh_descope_keys
+from jobs import Job, JobManager, JobQueueFull
+from github_client import GitHubClient, GitHubAPIError
+from llm_gateway import LLMGateway, LLMGatewayError, GenerationCancelled, cancel_on_disconnect
+
+try:
+    import brotli
+except ImportError:  # Optional; responses fall back to gzip without it
+    brotli = None
 
 # --- Basic Configuration ---
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
 load_dotenv()
+# Levels per subsystem come from LOG_LEVEL / LOG_LEVELS; records are written by a background thread
+log_listener = configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Open-Source On-Ramp API", version="3.0.0")
 
@@ -33,17 +61,80 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Metrics ---
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "Latency of HTTP requests, to the last body chunk.", ["method", "route", "status"])
+app.add_middleware(MetricsMiddleware, histogram=HTTP_REQUEST_DURATION)
+REPO_CLONE_DURATION = Histogram("repo_clone_duration_seconds", "Seconds spent cloning a repository into the store.")
+REPO_SIZE_BYTES = Histogram("repo_size_bytes", "On-disk size of cloned repositories.", buckets=exponential_buckets(1 << 20, 4, 10))
+FILE_TREE_BUILD_DURATION = Histogram("file_tree_build_duration_seconds", "Seconds spent scanning a checkout into its tree index.")
+FILE_TREE_NODES = Histogram("file_tree_nodes", "Files and directories in a scanned tree index.", buckets=exponential_buckets(100, 4, 9))
+
 # --- Environment & API Configuration ---
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "codellama")
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:8080")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "900"))
+REPO_CACHE_DIR = os.getenv("REPO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "code-navigator-repos"))
+REPO_CACHE_MAX_MB = int(os.getenv("REPO_CACHE_MAX_MB", "5120"))
+REPO_STALE_TTL_SECONDS = int(os.getenv("REPO_STALE_TTL_SECONDS", "3600"))
+# How long a request waits for an in-place refresh of a checkout (and a refresh for its readers)
+REPO_LEASE_TIMEOUT_SECONDS = float(os.getenv("REPO_LEASE_TIMEOUT_SECONDS", "30"))
+FILE_TREE_WORKERS = int(os.getenv("FILE_TREE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Background jobs (/api/jobs): concurrent workers, queue bound, and how long finished results are kept
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+REPO_TREE_INITIAL_DEPTH = int(os.getenv("REPO_TREE_INITIAL_DEPTH", "1"))
+REPO_TREE_PAGE_SIZE = int(os.getenv("REPO_TREE_PAGE_SIZE", "200"))
+GUIDE_TREE_TOKEN_BUDGET = int(os.getenv("GUIDE_TREE_TOKEN_BUDGET", "1500"))
+GUIDE_CODE_TOKEN_BUDGET = int(os.getenv("GUIDE_CODE_TOKEN_BUDGET", "1000"))
+SYMBOL_INDEX_WORKERS = int(os.getenv("SYMBOL_INDEX_WORKERS", str(FILE_TREE_WORKERS)))
+CHAT_SESSION_DB = os.getenv("CHAT_SESSION_DB", os.path.join(REPO_CACHE_DIR, "chat-sessions.sqlite3"))
+CHAT_SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+CHAT_SESSION_PURGE_INTERVAL_SECONDS = int(os.getenv("CHAT_SESSION_PURGE_INTERVAL_SECONDS", "3600"))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1200"))
+# "ollama", "hashing" (local stand-in, no server needed) or "off"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "ollama")
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+FILE_CONTENT_MAX_BYTES = int(os.getenv("FILE_CONTENT_MAX_BYTES", str(1024 * 1024)))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(REPO_CACHE_DIR, "llm-responses.sqlite3"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+# Seconds a generated response may be reused, per endpoint; 0 disables caching for it.
+LLM_CACHE_TTLS = {
+    "summarize": int(os.getenv("LLM_CACHE_TTL_SUMMARIZE", "604800")),
+    "explain": int(os.getenv("LLM_CACHE_TTL_EXPLAIN", "604800")),
+}
+# Generations sent to Ollama at once (match OLLAMA_NUM_PARALLEL); the rest wait in a per-user fair queue
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE_DEPTH = int(os.getenv("LLM_MAX_QUEUE_DEPTH", "32"))
+LLM_MAX_QUEUE_PER_USER = int(os.getenv("LLM_MAX_QUEUE_PER_USER", "8"))
+# Bearer token required to scrape /metrics; empty leaves it open (keep it off public networks then)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 GITHUB_PAT = os.getenv("GITHUB_PAT")
+# Seconds a GitHub API response is reused before it is revalidated with its ETag, per resource.
+GITHUB_CACHE_TTLS = {
+    "search": int(os.getenv("GITHUB_CACHE_TTL_SEARCH", "300")),
+    "issue": int(os.getenv("GITHUB_CACHE_TTL_ISSUE", "300")),
+    "user": int(os.getenv("GITHUB_CACHE_TTL_USER", "600")),
+}
+GITHUB_CACHE_MAX_ENTRIES = int(os.getenv("GITHUB_CACHE_MAX_ENTRIES", "2048"))
 DESCOPE_PROJECT_ID = os.getenv("DESCOPE_PROJECT_ID")
+# Seconds between background downloads of Descope's signing keys
+DESCOPE_KEY_REFRESH_SECONDS = int(os.getenv("DESCOPE_KEY_REFRESH_SECONDS", "3600"))
+AUTH_TOKEN_CACHE_ENTRIES = int(os.getenv("AUTH_TOKEN_CACHE_ENTRIES", "10000"))
 descope_client = DescopeClient(project_id=DESCOPE_PROJECT_ID, jwt_validation_leeway=15)
 security = HTTPBearer()
 
+# Validated session tokens are reused until their JWT expires
+token_cache = TokenCache(lambda token: descope_client.validate_session(session_token=token), max_entries=AUTH_TOKEN_CACHE_ENTRIES)
+descope_key_refresher: Optional[asyncio.Task] = None
+
 async def verify_descope_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        descope_client.validate_session(session_token=credentials.credentials)
+        claims = await token_cache.validate(credentials.credentials)
+        # Generations are queued fairly per user (see AdmissionController).
+        current_client.set(claims.get("sub") or hashlib.sha256(credentials.credentials.encode()).hexdigest()[:16])
         return credentials.credentials
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Invalid or expired token: {e}")
@@ -58,6 +149,7 @@ class FileItem(BaseModel):
     path: str
     type: str
     children: Optional[List['FileItem']] = None
+    childCount: Optional[int] = None # Set on directories; children is None until fetched from /api/repo/tree
     
 class CodeExplanationResponse(BaseModel):
     is_correct: bool
@@ -66,11 +158,51 @@ class CodeExplanationResponse(BaseModel):
 
 class AnalyzeRepoRequest(BaseModel):
     repoUrl: str
+    refresh: bool = False # Fetch the latest commit even if the cached analysis is not stale yet
 
 class RepoAnalysisResponse(BaseModel):
     name: str
     url: str
     structure: List[FileItem]
+    commit: Optional[str] = None
+    fetchedAt: Optional[str] = None
+
+class DirectoryPage(BaseModel):
+    path: str
+    items: List[FileItem]
+    total: int
+    offset: int
+    commit: str
+
+class CodePosition(BaseModel):
+    file: str
+    lineStart: int
+    lineEnd: int
+
+# Mirrors `CodeStructure` in shared/types/index.ts
+class CodeStructure(BaseModel):
+    type: str  # "function", "class", "module" or "file"
+    name: str
+    description: str
+    dependencies: List[str]
+    position: CodePosition
+
+class SymbolsResponse(BaseModel):
+    status: str  # "ready", or "building" while the symbol index of the current commit is not done yet
+    commit: str
+    symbols: List[CodeStructure]
+
+class SearchHit(BaseModel):
+    path: str
+    lineStart: int
+    lineEnd: int
+    score: float
+    snippet: str
+
+class SearchResponse(BaseModel):
+    status: str  # "ready", or "building" while the index of the current commit is not done yet
+    commit: str
+    results: List[SearchHit]
 
 class FindIssuesRequest(BaseModel):
     skills: str
@@ -100,190 +232,220 @@ class ContributionStep(BaseModel):
 
 class GuidedContributionResponse(BaseModel):
     plan: List[ContributionStep]
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str  # "queued", "running", "succeeded" or "failed"
+    stage: str
+    stages: List[dict]
+    progress: dict
+    error: Optional[str] = None
+    createdAt: float
+    finishedAt: Optional[float] = None
+    result: Optional[dict] = None
     
 class ChatRequest(BaseModel):
     message: str
+    # Continues a server-side session (see /api/chat/sessions); without it the message is answered on its own
+    sessionId: Optional[str] = None
+
+class CreateChatSessionRequest(BaseModel):
+    repoUrl: str
 
-# In-memory cache for cloned repository paths
-repo_cache = {}
+class ChatTurn(BaseModel):
+    role: str  # "user" or "assistant"
+    content: str
 
-# --- Utility Functions ---
-def handle_remove_readonly(func, path, exc_info):
-    if not isinstance(exc_info[1], PermissionError):
-        raise
-    logger.debug(f"Fixing permissions for {path}")
-    os.chmod(path, stat.S_IWRITE)
-    func(path)
+class ChatSessionResponse(BaseModel):
+    id: str
+    repoUrl: str
+    summary: str
+    turns: List[ChatTurn]
+    createdAt: float
+    updatedAt: float
+
+# Persistent cache of cloned repositories and their analyses, keyed by commit
+repo_store = RepoStore(REPO_CACHE_DIR, max_bytes=REPO_CACHE_MAX_MB * 1024 * 1024, wait_timeout=REPO_LEASE_TIMEOUT_SECONDS)
+# Concurrent analyze requests for the same URL share one clone-and-analyze run
+repo_analysis_flights = SingleFlight()
 
-def get_github_client(token: str = Depends(verify_descope_token)):
+# Long-running analysis and guide generation, submitted via /api/jobs and polled or streamed by clients
+job_manager = JobManager(workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED, result_ttl=JOB_RESULT_TTL_SECONDS)
+
+# Shared, pooled client for all LLM calls (routed through the MCP server)
+llm_admission = AdmissionController(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE_DEPTH, LLM_MAX_QUEUE_PER_USER)
+llm_gateway = LLMGateway(base_url=MCP_SERVER_URL, model=OLLAMA_MODEL, timeout=OLLAMA_TIMEOUT, admission=llm_admission)
+
+# GitHub reads go through one cached client shared by every user (they all use the server's PAT)
+github_client = GitHubClient(GITHUB_PAT, ttls=GITHUB_CACHE_TTLS, max_entries=GITHUB_CACHE_MAX_ENTRIES)
+
+# Embedding index of code chunks, built in the background after a repository is analyzed
+if EMBEDDING_BACKEND == "ollama":
+    semantic_index = SemanticIndex(repo_store, OllamaEmbedder(llm_gateway, OLLAMA_EMBED_MODEL))
+elif EMBEDDING_BACKEND == "hashing":
+    semantic_index = SemanticIndex(repo_store, HashingEmbedder())
+else:
+    semantic_index = None
+
+# Functions/classes/modules of every checkout, parsed in a process pool after analysis
+symbol_index = SymbolIndex(repo_store, workers=SYMBOL_INDEX_WORKERS)
+
+# Chat sessions tied to an analyzed repository; older turns are compacted into a summary
+chat_sessions = ChatSessionStore(CHAT_SESSION_DB)
+chat_session_locks: Dict[str, asyncio.Lock] = {}
+
+# Generated explanations/summaries, reused across users for identical prompts
+response_cache = ResponseCache(LLM_CACHE_PATH or None, max_memory_entries=LLM_CACHE_MEMORY_ENTRIES)
+
+def collect_cache_lookups() -> Dict[Tuple[str, str], float]:
+    lookups = {}
+    for namespace, counts in response_cache.stats().items():
+        lookups[(f"llm_{namespace}", "hit")] = counts["hits"]
+        lookups[(f"llm_{namespace}", "miss")] = counts["misses"]
+    for resource, counts in github_client.stats()["resources"].items():
+        for result, field in (("hit", "hits"), ("revalidated", "revalidated"), ("stale", "stale"), ("miss", "misses")):
+            lookups[(f"github_{resource}", result)] = counts[field]
+    lookups[("auth_token", "hit")] = token_cache.hits
+    lookups[("auth_token", "miss")] = token_cache.misses
+    return lookups
+
+def collect_cache_hit_ratios() -> Dict[Tuple[str], float]:
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), count in collect_cache_lookups().items():
+        served, total = totals.setdefault(cache, [0.0, 0.0])
+        totals[cache] = [served + (count if result != "miss" else 0), total + count]
+    return {(cache,): served / total for cache, (served, total) in totals.items() if total}
+
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and result (hit, revalidated, stale, miss).", ["cache", "result"])
+CACHE_LOOKUPS.set_function(collect_cache_lookups)
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Share of lookups answered without recomputing or refetching, since startup.", ["cache"])
+CACHE_HIT_RATIO.set_function(collect_cache_hit_ratios)
+GITHUB_RATE_LIMIT_REMAINING = Gauge("github_rate_limit_remaining", "Requests left in the current GitHub rate-limit window.", ["resource"])
+GITHUB_RATE_LIMIT_REMAINING.set_function(lambda: {(resource,): limit["remaining"] for resource, limit in github_client.rate_limits.items()})
+LLM_QUEUE_DEPTH = Gauge("llm_queue_depth", "Generations waiting for a slot.")
+LLM_QUEUE_DEPTH.set_function(lambda: {(): llm_admission.queued})
+LLM_ACTIVE_GENERATIONS = Gauge("llm_active_generations", "Generations holding a slot.")
+LLM_ACTIVE_GENERATIONS.set_function(lambda: {(): llm_admission.active})
+JOBS = Gauge("jobs", "Background jobs by state.", ["state"])
+JOBS.set_function(lambda: {("queued",): job_manager.stats()["queued"], ("running",): job_manager.stats()["running"]})
+event_loop_monitor: Optional[asyncio.Task] = None
+chat_session_purger: Optional[asyncio.Task] = None
+
+# --- Utility Functions ---
+def get_github_client(token: str = Depends(verify_descope_token)) -> GitHubClient:
     if not GITHUB_PAT:
         raise HTTPException(status_code=503, detail="GitHub PAT not configured on the server.")
-    return Github(GITHUB_PAT)
+    return github_client
 
-def generate_with_ollama(prompt: str) -> str:
+async def generate_with_ollama(prompt: str, request: Optional[Request] = None, timeout: Optional[float] = None, coalesce: bool = False) -> str:
+    """
+    Generates a completion without blocking the event loop; abandons it if `request` disconnects.
+    With `coalesce`, identical generations in flight on the MCP server share one answer.
+    """
     try:
-        mcp_url = "http://localhost:8080/api/generate"  # MCP server URL
-        payload = {"model": OLLAMA_MODEL, "prompt": prompt, "stream": False}
-        response = requests.post(mcp_url, json=payload, timeout=900)
-        response.raise_for_status()
-        return response.json().get("response", "").strip()
-    except requests.exceptions.RequestException as e:
+        return await cancel_on_disconnect(request, llm_gateway.generate(prompt, timeout=timeout, coalesce=coalesce))
+    except GenerationCancelled as e:
+        logger.info("Generation cancelled: %s", e)
+        raise HTTPException(status_code=499, detail="Client closed request.")
+    except AdmissionRejected as e:
+        raise admission_rejected_error(e)
+    except LLMGatewayError as e:
         logger.error(f"MCP API error: {e}")
+        if e.timeout:
+            raise HTTPException(status_code=504, detail=f"Timed out waiting for MCP server: {e}")
         raise HTTPException(status_code=500, detail=f"Error connecting to MCP server: {e}")
 
-def build_file_tree(root_dir: str, start_dir: str, max_depth=4, depth=0) -> List[FileItem]:
-    """Recursively builds a file tree structure, calculating paths relative to start_dir."""
-    logger.debug(f"Building file tree for {root_dir}, depth {depth}")
-    if depth > max_depth:
-        logger.debug(f"Reached max depth {max_depth} at {root_dir}")
-        return []
-    items = []
-    try:
-        for item_name in os.listdir(root_dir):
-            if item_name == '.git':
-                continue
-            full_path = os.path.join(root_dir, item_name)
-            # Paths should be relative to the actual start of the repo, not the parent temp dir
-            relative_path = os.path.relpath(full_path, start=start_dir) 
-            logger.debug(f"Processing item: {full_path}, relative_path: {relative_path}")
-            
-            if os.path.isdir(full_path):
-                # Recursive call for directories
-                children = build_file_tree(full_path, start_dir, max_depth, depth + 1)
-                items.append(FileItem(
-                    name=item_name,
-                    path=relative_path,
-                    type='directory',
-                    children=children
-                ))
-            else:
-                items.append(FileItem(
-                    name=item_name,
-                    path=relative_path,
-                    type='file',
-                    children=[]
-                ))
-        items.sort(key=lambda x: (x.type != 'directory', x.name))
-        logger.debug(f"Generated {len(items)} items for {root_dir}")
-        return items
-    except Exception as e:
-        logger.error(f"Error building file tree at {root_dir}: {e}")
-        return []
+def admission_rejected_error(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
-def format_file_tree_for_prompt(items: List[FileItem], indent: str = "") -> str:
-    tree_str = ""
-    for item in items:
-        tree_str += f"{indent}{'+-- ' if item.type == 'directory' else '|-- '}{item.name}\n"
-        if item.children:
-            tree_str += format_file_tree_for_prompt(item.children, indent + "    ")
-    return tree_str
+@app.exception_handler(RepoBusyError)
+async def repo_busy_handler(request: Request, e: RepoBusyError):
+    logger.warning(f"Timed out waiting for a refresh of {e}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The repository is being updated, try again shortly."},
+        headers={"Retry-After": str(max(1, math.ceil(REPO_LEASE_TIMEOUT_SECONDS)))},
+    )
 
-# --- API Endpoints ---
-@app.post("/api/analyze/repo", response_model=RepoAnalysisResponse)
-async def analyze_repo(request: AnalyzeRepoRequest, token: str = Depends(verify_descope_token)):
-    repo_url = request.repoUrl
-    logger.debug(f"Received analyze request for: {repo_url}")
-    if not re.match(r"https://github\.com/[\w\-]+/[\w\-\.]+", repo_url):
-        logger.error(f"Invalid GitHub repository URL format: {repo_url}")
-        raise HTTPException(status_code=400, detail="Invalid GitHub repository URL format.")
+def llm_cache_mode(request: Request) -> str:
+    """
+    Reads the per-request cache policy from the Cache-Control header: `no-cache`
+    regenerates and stores the fresh response, `no-store` bypasses the cache entirely.
+    """
+    directives = {part.strip().lower() for part in request.headers.get("cache-control", "").split(",")}
+    if "no-store" in directives:
+        return "bypass"
+    if "no-cache" in directives:
+        return "refresh"
+    return "use"
 
-    if repo_url in repo_cache:
-        logger.info(f"Using cached repository from {repo_cache[repo_url]['path']}")
-        return repo_cache[repo_url]['analysis']
+async def lookup_llm_cache(namespace: str, template_version: int, prompt: str, request: Request) -> Tuple[Optional[str], Optional[str]]:
+    """Returns (key to store the generated response under, or None if it must not be cached; cached response or None)."""
+    ttl = LLM_CACHE_TTLS[namespace]
+    mode = llm_cache_mode(request)
+    if ttl <= 0 or mode == "bypass":
+        return None, None
+    key = make_response_cache_key(llm_gateway.model, namespace, template_version, prompt)
+    if mode == "refresh":
+        return key, None
+    return key, await asyncio.to_thread(response_cache.get, namespace, key, ttl)
 
-    temp_dir = tempfile.mkdtemp()
-    logger.info(f"Cloning {repo_url} into {temp_dir}...")
-    try:
-        # The git clone command places the repository's contents directly into the temp_dir
-        git.Repo.clone_from(repo_url, temp_dir, depth=1)
-        logger.debug(f"Repository raw clone to {temp_dir}")
-        
-        repo_root_path = temp_dir
-        repo_name = repo_url.split('/')[-1].replace('.git', '')
-        logger.debug(f"Identified repo_root_path: {repo_root_path}")
+async def store_llm_response(namespace: str, key: Optional[str], text: str):
+    if key and text:
+        await asyncio.to_thread(response_cache.put, namespace, key, text)
 
-        file_structure = build_file_tree(repo_root_path, start_dir=repo_root_path)
-        logger.debug(f"File structure generated with {len(file_structure)} items")
+async def generate_cached(namespace: str, template_version: int, prompt: str, request: Request, response: Response) -> str:
+    """generate_with_ollama behind the response cache; reports HIT, MISS or BYPASS in an X-Cache header."""
+    key, cached = await lookup_llm_cache(namespace, template_version, prompt, request)
+    if cached is not None:
+        response.headers["X-Cache"] = "HIT"
+        return cached
+    # A cached answer is shared by everyone asking the same prompt anyway, so share the generation too.
+    text = await generate_with_ollama(prompt, request, coalesce=key is not None)
+    await store_llm_response(namespace, key, text)
+    response.headers["X-Cache"] = "MISS" if key else "BYPASS"
+    return text
 
-        analysis_result = {"name": repo_name, "url": repo_url, "structure": file_structure}
-        repo_cache[repo_url] = {"path": repo_root_path, "analysis": analysis_result}
-        
-        logger.info(f"Repository analysis completed for {repo_url}")
-        return analysis_result
-    except Exception as e:
-        logger.error(f"Failed during repo analysis {repo_url}: {e}")
-        shutil.rmtree(temp_dir, onerror=handle_remove_readonly)
-        raise HTTPException(status_code=500, detail=f"Failed to analyze repository: {e}")
-    
-@app.get("/tools")
-async def get_tools(token: str = Depends(verify_descope_token)):
-    with open("tools.json", "r") as f:
-        return json.load(f)
+def resolve_repo_path(repo_root: str, file_path: str) -> str:
+    # realpath, so symlinks inside the checkout cannot point outside of it
+    root = os.path.realpath(repo_root)
+    full_file_path = os.path.realpath(os.path.join(root, file_path))
 
-@app.on_event("shutdown")
-async def cleanup():
-    for repo in repo_cache.values():
-        shutil.rmtree(repo["path"], onerror=handle_remove_readonly)
-    repo_cache.clear()
-    
-@app.post("/api/summarize-code")
-async def summarize_code(code: str = Form(...), context: str = Form(""), token: str = Depends(verify_descope_token)):
-    logger.debug("Summarizing code snippet")
-    prompt = (
+    if os.path.commonpath([root, full_file_path]) != root:
+        logger.error(f"File path {full_file_path} is outside repository bounds")
+        raise HTTPException(status_code=403, detail="File path is outside the repository bounds.")
+
+    if not os.path.isfile(full_file_path):
+        logger.error(f"File {full_file_path} does not exist or is not a file")
+        raise HTTPException(status_code=404, detail="File does not exist in the repository.")
+    return full_file_path
+
+# Bump when a prompt template changes so cached responses to the old wording are not reused.
+SUMMARY_PROMPT_VERSION = 1
+EXPLAIN_PROMPT_VERSION = 1
+
+def build_summary_prompt(code: str, context: str) -> str:
+    return (
         "You are an expert code reviewer. Provide a concise summary of the following code. "
         f"Context: '{context}'.\n\n"
         f"Code:\n```\n{code}\n```"
     )
-    summary = generate_with_ollama(prompt)
-    logger.debug("Code summary generated")
-    return {"summary": summary}
-
-@app.post("/api/contribute/guide", response_model=GuidedContributionResponse)
-async def get_contribution_guide(request: GuidedContributionRequest, g: Github = Depends(get_github_client)):
-    logger.debug(f"Generating contribution guide for issue: {request.issueTitle}")
-    repo_name_match = re.search(r"github\.com/([\w\-]+/[\w\-]+)", request.repoUrl)
-    issue_number_match = re.search(r"/issues/(\d+)", request.issueUrl)
-
-    if not repo_name_match or not issue_number_match:
-        logger.error(f"Invalid repository or issue URL: {request.repoUrl}, {request.issueUrl}")
-        raise HTTPException(status_code=400, detail="Invalid repository or issue URL.")
-    
-    repo_full_name = repo_name_match.group(1)
-    issue_number = int(issue_number_match.group(1))
-
-    try:
-        repo = g.get_repo(repo_full_name)
-        issue = repo.get_issue(number=issue_number)
-        issue_body = issue.body or "No description provided."
-        logger.debug(f"Fetched issue {issue_number} from {repo_full_name}")
-    except GithubException as e:
-        logger.error(f"GitHub API error: {e.data.get('message')}")
-        raise HTTPException(status_code=404, detail=f"Could not fetch issue details from GitHub: {e.data.get('message')}")
-
-    if request.repoUrl not in repo_cache:
-        logger.debug(f"Repository {request.repoUrl} not in cache, analyzing...")
-        # Create a new AnalyzeRepoRequest with the repoUrl
-        analyze_request = AnalyzeRepoRequest(repoUrl=request.repoUrl)
-        # Assuming verify_descope_token can be called to get a token if needed,
-        # or that analyze_repo doesn't strictly need it for this internal call.
-        # For simplicity, we call it directly. You might need to adjust auth handling.
-        await analyze_repo(analyze_request, "dummy-token-for-internal-call")
-
-    
-    analysis = repo_cache[request.repoUrl]['analysis']
-    file_tree_string = format_file_tree_for_prompt(analysis['structure'])
 
+def build_guide_prompt(issue_title: str, issue_body: str, file_tree_string: str, code_context: str = "") -> str:
+    if code_context:
+        code_context = f"- **Possibly Relevant Code:**\n{code_context}\n"
     # --- UPDATED AND IMPROVED PROMPT ---
     prompt = f"""
 You are an expert software developer and mentor who provides guidance to new open-source contributors.
 Your task is to create a detailed, step-by-step plan to solve a GitHub issue.
 
 **The Issue:**
-- **Title:** {request.issueTitle}
+- **Title:** {issue_title}
 - **Description:** {issue_body}
 - **Repository File Structure (partial):**
 {file_tree_string}
-
+{code_context}
 
 **Your Plan:**
 Provide a clear, actionable, and step-by-step guide to resolve this issue. Follow this structure exactly:
@@ -314,11 +476,9 @@ Provide a clear, actionable, and step-by-step guide to resolve this issue. Follo
 - Offer some final words of encouragement.
 - Remind the contributor to ask for help if they get stuck.
 """
+    return prompt
 
-
-    logger.info(f"Generating contribution guide for issue: {request.issueTitle}")
-    ai_response = generate_with_ollama(prompt)
-    
+def parse_contribution_plan(ai_response: str) -> List[ContributionStep]:
     plan = []
     # Use a more robust regex to handle variations in the AI's output
     steps_raw = re.findall(r"\*\*Step \d+: (.+?)\*\*\n(.*?)(?=\n\*\*Step|\Z)", ai_response, re.DOTALL)
@@ -334,27 +494,777 @@ Provide a clear, actionable, and step-by-step guide to resolve this issue. Follo
         logger.warning("No structured steps parsed from AI response, using fallback.")
         plan.append(ContributionStep(step=1, title="AI Response", details=ai_response))
 
-    logger.debug(f"Contribution guide generated with {len(plan)} steps")
+    return plan
+
+def build_chat_prompt(message: str) -> str:
+    return (
+        "You are a helpful and knowledgeable AI assistant. "
+        "Your goal is to answer questions concisely and accurately.\n\n"
+        f"User: {message}\n"
+        "AI:"
+    )
+
+def build_session_chat_prompt(repo_url: str, summary: str, turns: List[dict], code_context: str, message: str) -> str:
+    parts = [
+        f"You are a helpful and knowledgeable AI assistant for the repository {repo_url}. "
+        "Answer concisely and accurately. Use the code excerpts when they are relevant and mention the files you rely on.\n"
+    ]
+    if summary:
+        parts.append(f"Summary of the earlier conversation:\n{summary}\n")
+    if code_context:
+        parts.append(f"Relevant code from the repository:\n{code_context}")
+    parts.append(f"{format_turns(turns)}User: {message}\nAI:")
+    return "\n".join(parts)
+
+def build_explain_prompt(code: str, context: str) -> str:
+    return (
+        "You are an expert cybersecurity analyst and code reviewer. Analyze the following code for potential security vulnerabilities, "
+        "such as SQL injection, cross-site scripting (XSS), buffer overflows, or insecure dependencies. "
+        "If you find a vulnerability, explain it clearly, rate its severity, and provide a corrected, secure version under a 'Corrected Code:' heading."
+        "If the code is correct, provide a clear, step-by-step explanation of what it does.\n\n"
+        f"Context: '{context}'\n"
+        f"Code:\n```\n{code}\n```"
+    )
+
+def parse_code_explanation(ai_response_str: str) -> CodeExplanationResponse:
+    corrected_code = None
+    explanation = ai_response_str
+    is_correct = True 
+
+    if "Corrected Code:" in ai_response_str:
+        is_correct = False
+        parts = ai_response_str.split("Corrected Code:", 1)
+        explanation = parts[0].strip()
+        corrected_code = parts[1].strip().replace("```python", "").replace("```", "").strip()
+
+    return CodeExplanationResponse(
+        is_correct=is_correct,
+        explanation=explanation,
+        corrected_code=corrected_code
+    )
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_llm_response(
+    prompt: str,
+    on_complete: Optional[Callable[[str], dict]] = None,
+    cache_as: Optional[Tuple[str, Optional[str]]] = None,
+    on_finished: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> StreamingResponse:
+    """
+    Streams generated tokens to the browser as Server-Sent Events.
+
+    Emits one `token` event per chunk, then a `done` event carrying the same
+    payload the non-streaming endpoint would have returned (or an `error` event).
+    A completed response is stored in the response cache under `cache_as`
+    (namespace, key) and passed to `on_finished` before the `done` event.
+
+    Raises a 429 before streaming starts if the generation queue is full.
+    """
+    try:
+        llm_admission.check()
+    except AdmissionRejected as e:
+        raise admission_rejected_error(e)
+
+    async def event_stream():
+        parts = []
+        try:
+            async for token in llm_gateway.stream(prompt, coalesce=bool(cache_as and cache_as[1])):
+                parts.append(token)
+                yield sse_event("token", {"token": token})
+        except LLMGatewayError as e:
+            logger.error(f"MCP API error while streaming: {e}")
+            yield sse_event("error", {"detail": f"Error connecting to MCP server: {e}"})
+            return
+        full_response = "".join(parts).strip()
+        if cache_as:
+            await store_llm_response(cache_as[0], cache_as[1], full_response)
+        if on_finished:
+            await on_finished(full_response)
+        yield sse_event("done", on_complete(full_response) if on_complete else {"response": full_response})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if cache_as:
+        headers["X-Cache"] = "MISS" if cache_as[1] else "BYPASS"
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+
+def stream_cached_response(text: str, on_complete: Optional[Callable[[str], dict]] = None) -> StreamingResponse:
+    """Replays a cached response in the same event format as stream_llm_response, as a single token."""
+    async def event_stream():
+        yield sse_event("token", {"token": text})
+        yield sse_event("done", on_complete(text) if on_complete else {"response": text})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Cache": "HIT"},
+    )
+
+def clone_and_analyze(repo_url: str, on_stage: Optional[Callable[[str], None]] = None) -> dict:
+    """
+    Clones `repo_url` into the store and builds its analysis. Blocking; run it in a worker thread.
+
+    `on_stage` is told when cloning and tree indexing start.
+    """
+    # A flight that finished just before this one started may already have stored it.
+    cached_analysis = repo_store.get_analysis(repo_url)
+    if cached_analysis is not None:
+        return cached_analysis
+
+    logger.info("Cloning %s into %s...", repo_url, repo_store.root_dir)
+    if on_stage:
+        on_stage("cloning")
+    started = time.perf_counter()
+    with repo_store.clone(repo_url) as checkout:
+        REPO_CLONE_DURATION.observe(time.perf_counter() - started)
+        REPO_SIZE_BYTES.observe(checkout["size"])
+        repo_root_path = checkout["path"]
+        repo_name = repo_url.split('/')[-1].replace('.git', '')
+        logger.debug("Identified repo_root_path: %s", repo_root_path)
+
+        if on_stage:
+            on_stage("tree")
+        listing = build_tree_index(repo_root_path)
+        repo_store.save_artifact(checkout["key"], "tree", listing)
+
+        analysis_result = {
+            "name": repo_name,
+            "url": repo_url,
+            "structure": nest(listing, max_depth=REPO_TREE_INITIAL_DEPTH, max_children=REPO_TREE_PAGE_SIZE),
+            "commit": checkout["commit"],
+            "fetchedAt": format_timestamp(checkout["fetched_at"]),
+        }
+        repo_store.save_analysis(checkout["key"], analysis_result)
+
+    logger.info("Repository analysis completed for %s", repo_url)
+    return analysis_result
+
+def refresh_analysis(repo_url: str, on_stage: Optional[Callable[[str], None]] = None) -> dict:
+    """
+    Brings a stored analysis up to date with the remote HEAD. Blocking; run it in a worker thread.
+
+    Only the new commit is fetched, and only the paths that changed since the
+    stored commit are patched into the analysis.
+    """
+    if on_stage:
+        on_stage("fetching")
+    with repo_store.refresh(repo_url) as (checkout, changes):
+        stored_analysis = repo_store.get_analysis(repo_url)
+        if stored_analysis is None:
+            raise RuntimeError(f"No stored analysis for {repo_url}")
+        # Other requests may be serializing the stored copy right now.
+        analysis_result = copy.deepcopy(stored_analysis)
+        if stored_analysis.get("commit") != checkout["previous_commit"]:
+            # An earlier refresh updated the tree but not the analysis; the stored listing cannot be patched.
+            logger.warning("Stored analysis of %s is at %s, not %s; rescanning the tree", repo_url, stored_analysis.get("commit"), checkout["previous_commit"])
+            if on_stage:
+                on_stage("tree")
+            listing = build_tree_index(checkout["path"])
+            repo_store.save_artifact(checkout["key"], "tree", listing)
+            analysis_result["structure"] = nest(listing, max_depth=REPO_TREE_INITIAL_DEPTH, max_children=REPO_TREE_PAGE_SIZE)
+        elif changes is not None:
+            if on_stage:
+                on_stage("tree")
+            listing = load_tree_index(checkout)
+            # Patch a copy; the cached listing may be serving /api/repo/tree right now.
+            listing = {path: list(entries) for path, entries in listing.items()}
+            patch_listing(listing, changes, checkout["path"])
+            repo_store.save_artifact(checkout["key"], "tree", listing)
+            analysis_result["structure"] = nest(listing, max_depth=REPO_TREE_INITIAL_DEPTH, max_children=REPO_TREE_PAGE_SIZE)
+        analysis_result["commit"] = checkout["commit"]
+        analysis_result["fetchedAt"] = format_timestamp(checkout["fetched_at"])
+        repo_store.save_analysis(checkout["key"], analysis_result)
+    logger.info("Repository analysis of %s refreshed to %s", repo_url, checkout['commit'])
+    return analysis_result
+
+def build_tree_index(repo_path: str) -> dict:
+    """Scans a checkout into its tree listing, recording the time taken and node count. Blocking."""
+    started = time.perf_counter()
+    listing = scan_tree(repo_path, workers=FILE_TREE_WORKERS)
+    elapsed = time.perf_counter() - started
+    nodes = count_nodes(listing)
+    FILE_TREE_BUILD_DURATION.observe(elapsed)
+    FILE_TREE_NODES.observe(nodes)
+    logger.debug("Tree index built with %s entries in %.3fs", nodes, elapsed)
+    return listing
+
+def load_tree_index(checkout: dict) -> dict:
+    """Returns the per-commit listing of a checkout, building it if it was stored without one. Blocking."""
+    listing = repo_store.load_artifact(checkout["key"], "tree")
+    if listing is None:
+        listing = build_tree_index(checkout["path"])
+        repo_store.save_artifact(checkout["key"], "tree", listing)
+    return listing
+
+def load_leased(repo_url: str, load: Callable[[dict], Any]) -> Tuple[dict, Any]:
+    """
+    Returns the newest checkout of `repo_url` and `load(checkout)`, computed while it is leased. Blocking.
+
+    Leases may wait for an in-place refresh to finish, so they are only ever
+    taken in worker threads, never on the event loop.
+    """
+    with repo_store.lease(repo_url) as checkout:
+        return checkout, load(checkout)
+
+def load_blob_index(checkout: dict) -> dict:
+    """Returns the blob id of every file in a checkout, listing them on first use. Blocking."""
+    index = repo_store.load_artifact(checkout["key"], "blobs")
+    # Refreshed checkouts keep their artifacts, so make sure this one was listed at the current commit.
+    if index is None or index.get("commit") != checkout["commit"]:
+        index = dict(read_blob_index(checkout["path"]), commit=checkout["commit"])
+        repo_store.save_artifact(checkout["key"], "blobs", index)
+    return index
+
+def open_repo_file(repo_url: str, file_path: str) -> dict:
+    """
+    Maps a file of the newest checkout of `repo_url` and describes it:
+    {data, size, binary, etag, last_modified}. The caller closes it with
+    close_repo_file. Blocking.
+
+    The checkout is only leased while the file is opened: the mapping stays
+    valid when a refresh or an eviction replaces the file afterwards, so
+    serving it to a slow client never holds up the store.
+    """
+    try:
+        with repo_store.lease(repo_url) as checkout:
+            full_file_path = resolve_repo_path(checkout["path"], file_path)
+            rel_path = os.path.relpath(full_file_path, os.path.realpath(checkout["path"])).replace(os.sep, "/")
+            blob_index = load_blob_index(checkout)
+            data = map_file(full_file_path)
+    except RepoNotFoundError:
+        logger.error(f"Repository {repo_url} not found in cache")
+        raise HTTPException(status_code=404, detail="Repository not found or hasn't been analyzed yet.")
+    except OSError as e:
+        logger.error(f"Error reading file {file_path} of {repo_url}: {e}")
+        raise HTTPException(status_code=500, detail="Could not read file content.")
+
+    blob = blob_index["blobs"].get(rel_path) or hashlib.sha1(f"{checkout['commit']}:{rel_path}".encode()).hexdigest()
+    return {
+        "data": data,
+        "size": len(data),
+        "binary": is_binary(data[:BINARY_SNIFF_BYTES]),
+        "etag": f'"{blob}"',
+        "last_modified": blob_index["commitTime"],
+    }
+
+def close_repo_file(opened: dict):
+    """Closes the mapping of a file opened by open_repo_file; safe to call twice."""
+    close_mapping(opened["data"])
+
+def stream_repo_file(opened: dict, start: int, end: int) -> Iterator[bytes]:
+    """Yields bytes [start, end) of an opened file, then closes it. Blocking."""
+    try:
+        yield from iter_span(opened["data"], start, end)
+    finally:
+        close_repo_file(opened)
+
+def close_mapping(data):
+    if hasattr(data, "close"):
+        data.close()
+
+def read_file_text(opened: dict, start_line: Optional[int], end_line: Optional[int]) -> dict:
+    """Decodes the requested lines of a mapped text file, up to FILE_CONTENT_MAX_BYTES. Blocking."""
+    data = opened["data"]
+    start, end = (0, opened["size"]) if start_line is None and end_line is None else line_span(data, start_line or 1, end_line)
+    truncated = end - start > FILE_CONTENT_MAX_BYTES
+    end = min(end, start + FILE_CONTENT_MAX_BYTES)
+    return {
+        "content": data[start:end].decode("utf-8", errors="ignore"),
+        "size": opened["size"],
+        "truncated": truncated,
+        "binary": False,
+    }
+
+async def schedule_repo_indexes(repo_url: str):
+    """Starts (re)building the symbol and search indexes of the newest checkout of `repo_url` unless they are current."""
+    try:
+        checkout, blob_index = await asyncio.to_thread(load_leased, repo_url, load_blob_index)
+        await symbol_index.schedule(checkout, blob_index["blobs"])
+        if semantic_index is not None:
+            await semantic_index.schedule(checkout, blob_index["blobs"])
+    except Exception as e:
+        logger.error(f"Could not schedule indexing of {repo_url}: {e}")
+
+def read_line_spans(repo_url: str, spans: List[Tuple[str, int, int]], max_lines: int = 40) -> List[str]:
+    """Returns the source lines of each (path, lineStart, lineEnd) span, at most `max_lines` each. Blocking."""
+    snippets = []
+    with repo_store.lease(repo_url) as checkout:
+        for path, line_start, line_end in spans:
+            try:
+                with open(resolve_repo_path(checkout["path"], path), "r", encoding="utf-8", errors="ignore") as f:
+                    lines = f.read().splitlines()
+            except (OSError, HTTPException):
+                lines = []
+            end = min(line_end, line_start + max_lines - 1)
+            snippets.append("\n".join(lines[line_start - 1:end]))
+    return snippets
+
+def read_snippets(repo_url: str, hits: List[dict], max_lines: int = 40) -> List[dict]:
+    """Attaches the source lines of each search hit. Blocking."""
+    snippets = read_line_spans(repo_url, [(hit["path"], hit["lineStart"], hit["lineEnd"]) for hit in hits], max_lines)
+    for hit, snippet in zip(hits, snippets):
+        hit["snippet"] = snippet
+    return hits
+
+def format_symbol_snippet(symbol: dict, snippet: str) -> str:
+    position = symbol["position"]
+    return f"{position['file']} (lines {position['lineStart']}-{position['lineEnd']}), {symbol['type']} `{symbol['name']}`:\n```\n{snippet}\n```\n"
+
+async def build_symbol_context(repo_url: str, text: str, token_budget: int) -> str:
+    """Snippets of the functions/classes whose names best match `text`, within `token_budget`; "" if none or not indexed yet."""
+    checkout = repo_store.latest(repo_url)
+    if checkout is None or token_budget <= 0:
+        return ""
+    symbols = await symbol_index.relevant(checkout, text)
+    if not symbols:
+        return ""
+    spans = [(symbol["position"]["file"], symbol["position"]["lineStart"], symbol["position"]["lineEnd"]) for symbol in symbols]
+    try:
+        snippets = await asyncio.to_thread(read_line_spans, repo_url, spans, 30)
+    except RepoNotFoundError:
+        return ""
+    parts = []
+    for symbol, snippet in zip(symbols, snippets):
+        part = format_symbol_snippet(symbol, snippet)
+        token_budget -= estimate_tokens(part)
+        if token_budget < 0:
+            break
+        parts.append(part)
+    return "\n".join(parts)
+
+async def resolve_symbol_code(repo_url: str, symbol_name: str, max_lines: int = 200) -> Tuple[str, str]:
+    """Returns (code, location) of the definition of `symbol_name` in the newest checkout of `repo_url`."""
+    checkout = repo_store.latest(repo_url)
+    if checkout is None:
+        raise HTTPException(status_code=404, detail="Repository not found or hasn't been analyzed yet.")
+    definitions = await symbol_index.find(checkout, symbol_name)
+    if definitions is None:
+        await schedule_repo_indexes(repo_url)
+        raise HTTPException(status_code=409, detail="The symbol index of this repository is still being built.")
+    if not definitions:
+        raise HTTPException(status_code=404, detail=f"No definition of {symbol_name} found.")
+    symbol = definitions[0]
+    position = symbol["position"]
+    try:
+        [snippet] = await asyncio.to_thread(read_line_spans, repo_url, [(position["file"], position["lineStart"], position["lineEnd"])], max_lines)
+    except RepoNotFoundError:
+        raise HTTPException(status_code=404, detail="Repository not found or hasn't been analyzed yet.")
+    return snippet, f"{symbol['type']} {symbol['name']} in {position['file']} (lines {position['lineStart']}-{position['lineEnd']})"
+
+def choose_content_encoding(accept_encoding: str) -> str:
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if "br" in accepted and brotli is not None:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+@functools.lru_cache(maxsize=32)
+def encode_columnar_analysis(repo_url: str, commit: str, fetched_at: str, encoding: str) -> bytes:
+    """Serializes and compresses the columnar form of an analysis once per commit and encoding. Blocking."""
+    with repo_store.lease(repo_url) as checkout:
+        listing = load_tree_index(checkout)
+    analysis = repo_store.get_analysis(repo_url) or {}
+    payload = {
+        "name": analysis.get("name", repo_url.split('/')[-1].replace('.git', '')),
+        "url": repo_url,
+        "commit": commit,
+        "fetchedAt": fetched_at,
+        "tree": to_columnar(listing),
+    }
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+def format_timestamp(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+async def get_or_create_analysis(repo_url: str, refresh: bool = False, on_stage: Optional[Callable[[str], None]] = None) -> dict:
+    """
+    Returns the stored analysis of `repo_url`, cloning it first or refreshing it when stale.
+
+    `on_stage` must be thread-safe; it is only called by the request that starts the work.
+    """
+    cached_analysis = repo_store.get_analysis(repo_url)
+    if cached_analysis is not None:
+        checkout = repo_store.latest(repo_url)
+        age = time.time() - checkout["fetched_at"] if checkout else 0
+        if not refresh and (REPO_STALE_TTL_SECONDS <= 0 or age < REPO_STALE_TTL_SECONDS):
+            logger.info("Using cached analysis of %s", repo_url)
+            return cached_analysis
+        try:
+            return await repo_analysis_flights.do(repo_url, lambda: asyncio.to_thread(refresh_analysis, repo_url, on_stage))
+        except Exception as e:
+            logger.warning(f"Refreshing {repo_url} failed, serving analysis of {cached_analysis.get('commit')}: {e}")
+            return cached_analysis
+
+    try:
+        return await repo_analysis_flights.do(repo_url, lambda: asyncio.to_thread(clone_and_analyze, repo_url, on_stage))
+    except Exception as e:
+        logger.error(f"Failed during repo analysis {repo_url}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to analyze repository: {e}")
+
+def validate_repo_url(repo_url: str):
+    if not re.match(r"https://github\.com/[\w\-]+/[\w\-\.]+", repo_url):
+        logger.error(f"Invalid GitHub repository URL format: {repo_url}")
+        raise HTTPException(status_code=400, detail="Invalid GitHub repository URL format.")
+
+# --- API Endpoints ---
+@app.post("/api/analyze/repo", response_model=RepoAnalysisResponse)
+async def analyze_repo(
+    request: AnalyzeRepoRequest,
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    format: str = Query("nested", pattern="^(nested|columnar)$"),
+    token: str = Depends(verify_descope_token),
+):
+    """
+    Analyzes a repository. With `format=columnar` the complete tree is returned
+    instead as `tree: {names, parents, flags}` (flags bit 1 = directory, parent
+    -1 = top level), compressed with brotli or gzip when the client accepts it.
+    """
+    repo_url = request.repoUrl
+    logger.debug("Received analyze request for: %s", repo_url)
+    validate_repo_url(repo_url)
+
+    analysis = await get_or_create_analysis(repo_url, refresh=request.refresh)
+    background_tasks.add_task(schedule_repo_indexes, repo_url)
+    if format == "nested":
+        return analysis
+
+    encoding = choose_content_encoding(http_request.headers.get("accept-encoding", ""))
+    body = await asyncio.to_thread(encode_columnar_analysis, repo_url, analysis["commit"], analysis["fetchedAt"], encoding)
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+    
+@app.get("/tools")
+async def get_tools(token: str = Depends(verify_descope_token)):
+    with open("tools.json", "r") as f:
+        return json.load(f)
+
+@app.on_event("startup")
+async def startup():
+    global descope_key_refresher, event_loop_monitor, chat_session_purger
+    event_loop_monitor = asyncio.ensure_future(monitor_event_loop_lag())
+    repo_store.recover()
+    try:
+        key_count = await asyncio.to_thread(fetch_descope_keys, descope_client)
+        logger.info("Prefetched %s Descope signing keys", key_count)
+    except Exception as e:
+        # Validation still downloads them on first use.
+        logger.warning(f"Prefetching Descope signing keys failed: {e}")
+    if DESCOPE_KEY_REFRESH_SECONDS > 0:
+        descope_key_refresher = asyncio.ensure_future(refresh_descope_keys(descope_client, DESCOPE_KEY_REFRESH_SECONDS))
+    await asyncio.to_thread(response_cache.purge, max(LLM_CACHE_TTLS.values()))
+    await purge_chat_sessions()
+    if CHAT_SESSION_PURGE_INTERVAL_SECONDS > 0:
+        chat_session_purger = asyncio.ensure_future(purge_chat_sessions_periodically(CHAT_SESSION_PURGE_INTERVAL_SECONDS))
+    await llm_gateway.start()
+    await github_client.start()
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def cleanup():
+    for task in (descope_key_refresher, event_loop_monitor, chat_session_purger):
+        if task is not None:
+            task.cancel()
+    await symbol_index.aclose()
+    if semantic_index is not None:
+        await semantic_index.aclose()
+    await job_manager.aclose()
+    await llm_gateway.aclose()
+    await github_client.aclose()
+    repo_store.close()
+    response_cache.close()
+    chat_sessions.close()
+    shutdown_file_tree_workers()
+    
+@app.post("/api/summarize-code")
+async def summarize_code(http_request: Request, response: Response, code: str = Form(...), context: str = Form(""), token: str = Depends(verify_descope_token)):
+    logger.debug("Summarizing code snippet")
+    summary = await generate_cached("summarize", SUMMARY_PROMPT_VERSION, build_summary_prompt(code, context), http_request, response)
+    logger.debug("Code summary generated")
+    return {"summary": summary}
+
+@app.post("/api/summarize-code/stream")
+async def summarize_code_stream(http_request: Request, code: str = Form(...), context: str = Form(""), token: str = Depends(verify_descope_token)):
+    logger.debug("Streaming code summary")
+    prompt = build_summary_prompt(code, context)
+    on_complete = lambda summary: {"summary": summary}
+    key, cached = await lookup_llm_cache("summarize", SUMMARY_PROMPT_VERSION, prompt, http_request)
+    if cached is not None:
+        return stream_cached_response(cached, on_complete)
+    return stream_llm_response(prompt, on_complete, cache_as=("summarize", key))
+
+async def prepare_contribution_prompt(request: GuidedContributionRequest, g: GitHubClient, on_stage: Optional[Callable[[str], None]] = None) -> str:
+    repo_name_match = re.search(r"github\.com/([\w\-]+/[\w\-]+)", request.repoUrl)
+    issue_number_match = re.search(r"/issues/(\d+)", request.issueUrl)
+
+    if not repo_name_match or not issue_number_match:
+        logger.error(f"Invalid repository or issue URL: {request.repoUrl}, {request.issueUrl}")
+        raise HTTPException(status_code=400, detail="Invalid repository or issue URL.")
+    
+    repo_full_name = repo_name_match.group(1)
+    issue_number = int(issue_number_match.group(1))
+
+    try:
+        issue = await g.get_issue(repo_full_name, issue_number)
+        issue_body = issue.get("body") or "No description provided."
+        logger.debug("Fetched issue %s from %s", issue_number, repo_full_name)
+    except GitHubAPIError as e:
+        logger.error(f"GitHub API error: {e}")
+        raise HTTPException(status_code=404, detail=f"Could not fetch issue details from GitHub: {e}")
+
+    await get_or_create_analysis(request.repoUrl, on_stage=on_stage)
+    if on_stage:
+        on_stage("context")
+    _, listing = await asyncio.to_thread(load_leased, request.repoUrl, load_tree_index)
+    file_tree_string = await asyncio.to_thread(build_tree_context, listing, request.issueTitle, issue_body, GUIDE_TREE_TOKEN_BUDGET)
+    code_context = await build_symbol_context(request.repoUrl, f"{request.issueTitle}\n{issue_body}", GUIDE_CODE_TOKEN_BUDGET)
+    return build_guide_prompt(request.issueTitle, issue_body, file_tree_string, code_context)
+
+@app.post("/api/contribute/guide", response_model=GuidedContributionResponse)
+async def get_contribution_guide(request: GuidedContributionRequest, http_request: Request, g: GitHubClient = Depends(get_github_client)):
+    logger.debug("Generating contribution guide for issue: %s", request.issueTitle)
+    prompt = await prepare_contribution_prompt(request, g)
+
+    logger.info("Generating contribution guide for issue: %s", request.issueTitle)
+    ai_response = await generate_with_ollama(prompt, http_request)
+    plan = parse_contribution_plan(ai_response)
+    logger.debug("Contribution guide generated with %s steps", len(plan))
     return GuidedContributionResponse(plan=plan)
 
+@app.post("/api/contribute/guide/stream")
+async def get_contribution_guide_stream(request: GuidedContributionRequest, g: GitHubClient = Depends(get_github_client)):
+    logger.debug("Streaming contribution guide for issue: %s", request.issueTitle)
+    prompt = await prepare_contribution_prompt(request, g)
+    return stream_llm_response(
+        prompt,
+        lambda ai_response: GuidedContributionResponse(plan=parse_contribution_plan(ai_response)).model_dump(),
+    )
+
+
+# --- Background Jobs ---
+async def run_analysis_job(job: Job, repo_url: str, refresh: bool) -> dict:
+    analysis = await get_or_create_analysis(repo_url, refresh=refresh, on_stage=job.update_threadsafe)
+    await schedule_repo_indexes(repo_url)
+    return analysis
+
+async def run_guide_job(job: Job, request: GuidedContributionRequest, g: GitHubClient, client: str) -> dict:
+    # Workers run outside the submitting request, so queue the generation under its user explicitly.
+    current_client.set(client)
+    job.update("issue")
+    prompt = await prepare_contribution_prompt(request, g, on_stage=job.update_threadsafe)
+    job.update("llm", tokens=0)
+    parts = []
+    async for token in llm_gateway.stream(prompt):
+        parts.append(token)
+        job.update(tokens=len(parts))
+    plan = parse_contribution_plan("".join(parts).strip())
+    return GuidedContributionResponse(plan=plan).model_dump()
+
+def submit_job(kind: str, key: str, fn: Callable[[Job], Awaitable[dict]]) -> Job:
+    try:
+        return job_manager.submit(kind, key, fn)
+    except JobQueueFull as e:
+        logger.warning(f"Rejecting {kind} job: {e}")
+        raise HTTPException(status_code=503, detail="Too many background jobs are queued, try again later.", headers={"Retry-After": "30"})
+
+@app.post("/api/jobs/analyze", response_model=JobResponse, status_code=202)
+async def submit_analysis_job(request: AnalyzeRepoRequest, token: str = Depends(verify_descope_token)):
+    """Starts analyzing a repository in the background. Stages: cloning or fetching, tree."""
+    validate_repo_url(request.repoUrl)
+    key = f"analyze:{request.repoUrl}:{int(request.refresh)}"
+    job = submit_job("analyze", key, lambda job: run_analysis_job(job, request.repoUrl, request.refresh))
+    return job.to_dict()
+
+@app.post("/api/jobs/guide", response_model=JobResponse, status_code=202)
+async def submit_guide_job(request: GuidedContributionRequest, g: GitHubClient = Depends(get_github_client)):
+    """Starts generating a contribution guide in the background. Stages: issue, cloning, tree, context, llm."""
+    material = json.dumps([request.repoUrl, request.issueUrl, request.issueTitle, request.issueBody])
+    key = f"guide:{hashlib.sha256(material.encode('utf-8')).hexdigest()}"
+    client = current_client.get()
+    job = submit_job("guide", key, lambda job: run_guide_job(job, request, g, client))
+    return job.to_dict()
+
+def get_job_or_404(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or its result has expired.")
+    return job
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, token: str = Depends(verify_descope_token)):
+    return get_job_or_404(job_id).to_dict()
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, token: str = Depends(verify_descope_token)):
+    """
+    Streams a job's progress as Server-Sent Events: a `progress` event per
+    change, then `done` (with the result) or `error`.
+    """
+    job = get_job_or_404(job_id)
+
+    async def event_stream():
+        async for current in job.watch():
+            if current.status == "succeeded":
+                yield sse_event("done", current.to_dict())
+            elif current.status == "failed":
+                yield sse_event("error", current.to_dict())
+            else:
+                yield sse_event("progress", current.to_dict(include_result=False))
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# --- Chat Sessions ---
+def get_chat_session_lock(session_id: str) -> asyncio.Lock:
+    return chat_session_locks.setdefault(session_id, asyncio.Lock())
+
+async def load_chat_session(session_id: str) -> dict:
+    """Returns a session of the calling user (see verify_descope_token); other users' sessions look missing."""
+    session = await asyncio.to_thread(chat_sessions.get, session_id)
+    if session is None or session.get("owner") != current_client.get():
+        raise HTTPException(status_code=404, detail="Chat session not found or expired.")
+    return session
+
+async def purge_chat_sessions():
+    """Deletes idle chat sessions together with their locks."""
+    for session_id in await asyncio.to_thread(chat_sessions.purge, CHAT_SESSION_TTL_SECONDS):
+        chat_session_locks.pop(session_id, None)
+
+async def purge_chat_sessions_periodically(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await purge_chat_sessions()
+        except Exception as e:
+            logger.warning(f"Purging idle chat sessions failed: {e}")
+
+async def retrieve_chat_context(repo_url: str, message: str, token_budget: int) -> Tuple[str, List[dict]]:
+    """
+    The code chunks most relevant to `message` (semantic search, or symbol names while
+    the search index is unavailable) as prompt text within `token_budget`, and their locations.
+    """
+    checkout = repo_store.latest(repo_url)
+    if checkout is None or token_budget <= 0:
+        return "", []
+    hits = []
+    if semantic_index is not None and await semantic_index.status(checkout) == "ready":
+        try:
+            hits = await semantic_index.search(checkout, message, 6)
+        except LLMGatewayError as e:
+            logger.warning(f"Semantic search for chat context failed: {e}")
+    if not hits:
+        hits = [
+            {"path": symbol["position"]["file"], "lineStart": symbol["position"]["lineStart"], "lineEnd": symbol["position"]["lineEnd"]}
+            for symbol in await symbol_index.relevant(checkout, message, limit=6)
+        ]
+    if not hits:
+        return "", []
+    try:
+        hits = await asyncio.to_thread(read_snippets, repo_url, hits, 40)
+    except RepoNotFoundError:
+        return "", []
+
+    parts, sources = [], []
+    for hit in hits:
+        part = f"{hit['path']} (lines {hit['lineStart']}-{hit['lineEnd']}):\n```\n{hit['snippet']}\n```\n"
+        token_budget -= estimate_tokens(part)
+        if token_budget < 0:
+            break
+        parts.append(part)
+        sources.append({"path": hit["path"], "lineStart": hit["lineStart"], "lineEnd": hit["lineEnd"]})
+    return "\n".join(parts), sources
+
+async def prepare_session_chat_prompt(session_id: str, message: str) -> Tuple[str, List[dict]]:
+    session = await load_chat_session(session_id)
+    summary, turns = select_history(session, CHAT_HISTORY_TOKEN_BUDGET)
+    code_context, sources = await retrieve_chat_context(session["repoUrl"], message, CHAT_CONTEXT_TOKEN_BUDGET)
+    return build_session_chat_prompt(session["repoUrl"], summary, turns, code_context, message), sources
+
+async def record_chat_turn(session_id: str, message: str, answer: str):
+    async with get_chat_session_lock(session_id):
+        session = await asyncio.to_thread(chat_sessions.get, session_id)
+        if session is None:
+            return
+        add_turn(session, "user", message)
+        add_turn(session, "assistant", answer)
+        await asyncio.to_thread(chat_sessions.save, session)
+
+async def compact_chat_session(session_id: str):
+    """Folds the oldest turns into the session summary once the history exceeds CHAT_HISTORY_TOKEN_BUDGET."""
+    session = await asyncio.to_thread(chat_sessions.get, session_id)
+    if session is None:
+        return
+    count = turns_to_compact(session, CHAT_HISTORY_TOKEN_BUDGET)
+    if count <= 0:
+        return
+    compacted = session["turns"][:count]
+    try:
+        summary = await llm_gateway.generate(build_compaction_prompt(session["summary"], compacted))
+    except LLMGatewayError as e:
+        logger.warning(f"Summarizing chat session {session_id} failed, keeping a plain digest: {e}")
+        summary = fallback_summary(session["summary"], compacted)
+
+    async with get_chat_session_lock(session_id):
+        # Another request may have compacted or deleted the session while the summary was generated.
+        current = await asyncio.to_thread(chat_sessions.get, session_id)
+        if current is None or current["turns"][:count] != compacted:
+            return
+        apply_compaction(current, count, summary)
+        await asyncio.to_thread(chat_sessions.save, current)
+    logger.debug("Compacted %s turns of chat session %s", count, session_id)
+
+@app.post("/api/chat/sessions", response_model=ChatSessionResponse)
+async def create_chat_session(request: CreateChatSessionRequest, token: str = Depends(verify_descope_token)):
+    """Starts a chat session about an analyzed repository."""
+    if repo_store.latest(request.repoUrl) is None:
+        raise HTTPException(status_code=404, detail="Repository not found or hasn't been analyzed yet.")
+    session = new_session(request.repoUrl, current_client.get())
+    await asyncio.to_thread(chat_sessions.save, session)
+    return session
+
+@app.get("/api/chat/sessions/{session_id}", response_model=ChatSessionResponse)
+async def get_chat_session(session_id: str, token: str = Depends(verify_descope_token)):
+    return await load_chat_session(session_id)
+
+@app.delete("/api/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str, token: str = Depends(verify_descope_token)):
+    await load_chat_session(session_id)
+    if not await asyncio.to_thread(chat_sessions.delete, session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found or expired.")
+    chat_session_locks.pop(session_id, None)
+    return {"deleted": session_id}
 
 @app.post("/api/chat")
-async def chat_with_ai(request: ChatRequest, token: str = Depends(verify_descope_token)):
+async def chat_with_ai(request: ChatRequest, http_request: Request, background_tasks: BackgroundTasks, token: str = Depends(verify_descope_token)):
     """
     Handles a chat message, sending it to the AI for a response.
-    """
-    logger.debug(f"Received chat message: {request.message}")
 
-    prompt = (
-        "You are a helpful and knowledgeable AI assistant. "
-        "Your goal is to answer questions concisely and accurately.\n\n"
-        f"User: {request.message}\n"
-        "AI:"
-    )
+    With a `sessionId` the prompt carries the session's (compacted) history
+    and the repository code most relevant to the message, listed in `sources`.
+    """
+    logger.debug("Received chat message: %s", request.message)
+    sources = None
+    if request.sessionId:
+        prompt, sources = await prepare_session_chat_prompt(request.sessionId, request.message)
+    else:
+        prompt = build_chat_prompt(request.message)
 
     try:
-        ai_response = generate_with_ollama(prompt)
+        ai_response = await generate_with_ollama(prompt, http_request)
         logger.debug("AI response generated successfully.")
+        if request.sessionId:
+            await record_chat_turn(request.sessionId, request.message, ai_response)
+            background_tasks.add_task(compact_chat_session, request.sessionId)
+            return {"response": ai_response, "sources": sources}
         return {"response": ai_response}
     except HTTPException as e:
         logger.error(f"Error during AI chat response: {e.detail}")
@@ -363,102 +1273,295 @@ async def chat_with_ai(request: ChatRequest, token: str = Depends(verify_descope
         logger.error(f"Unexpected error during AI chat response: {e}")
         raise HTTPException(status_code=500, detail="Failed to get a response from the AI.")
 
+@app.post("/api/chat/stream")
+async def chat_with_ai_stream(request: ChatRequest, token: str = Depends(verify_descope_token)):
+    """
+    Streaming variant of /api/chat: tokens are sent as Server-Sent Events while they are generated.
+    """
+    logger.debug("Received streaming chat message: %s", request.message)
+    if not request.sessionId:
+        return stream_llm_response(build_chat_prompt(request.message))
+
+    session_id = request.sessionId
+    prompt, sources = await prepare_session_chat_prompt(session_id, request.message)
+    response = stream_llm_response(
+        prompt,
+        lambda ai_response: {"response": ai_response, "sources": sources},
+        on_finished=lambda ai_response: record_chat_turn(session_id, request.message, ai_response),
+    )
+    response.background = BackgroundTask(compact_chat_session, session_id)
+    return response
+
 @app.get("/api/repo/file_content")
-async def get_file_content(repo_url: str = Query(...), file_path: str = Query(...), token: str = Depends(verify_descope_token)):
-    logger.debug(f"Fetching file content for {repo_url}, path: {file_path}")
-    if repo_url not in repo_cache:
-        logger.error(f"Repository {repo_url} not found in cache")
+async def get_file_content(
+    http_request: Request,
+    response: Response,
+    repo_url: str = Query(...),
+    file_path: str = Query(...),
+    start_line: Optional[int] = Query(None, ge=1),
+    end_line: Optional[int] = Query(None, ge=1),
+    token: str = Depends(verify_descope_token),
+):
+    """
+    Returns a file (or lines `start_line`..`end_line`) as JSON text, cut at
+    FILE_CONTENT_MAX_BYTES. Binary files are summarized instead of decoded.
+    """
+    logger.debug("Fetching file content for %s, path: %s", repo_url, file_path)
+    opened = await asyncio.to_thread(open_repo_file, repo_url, file_path)
+    try:
+        headers = file_validators(opened)
+        if is_not_modified(http_request.headers, opened):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        if opened["binary"]:
+            return {"content": f"Binary file ({opened['size']} bytes) not shown.", "size": opened["size"], "truncated": False, "binary": True}
+        try:
+            return await asyncio.to_thread(read_file_text, opened, start_line, end_line)
+        except RangeNotSatisfiable:
+            raise HTTPException(status_code=416, detail="Requested lines are outside the file.")
+    finally:
+        close_repo_file(opened)
+
+@app.get("/api/repo/file_content/raw")
+async def get_raw_file_content(
+    http_request: Request,
+    repo_url: str = Query(...),
+    file_path: str = Query(...),
+    start_line: Optional[int] = Query(None, ge=1),
+    end_line: Optional[int] = Query(None, ge=1),
+    allow_binary: bool = Query(False),
+    token: str = Depends(verify_descope_token),
+):
+    """
+    Streams a file's bytes from a memory map. Supports single `Range: bytes=`
+    requests (206) and line ranges; binary files are refused unless `allow_binary` is set.
+    """
+    opened = await asyncio.to_thread(open_repo_file, repo_url, file_path)
+    streaming = False
+    try:
+        headers = dict(file_validators(opened), **{"Accept-Ranges": "bytes"})
+        if is_not_modified(http_request.headers, opened):
+            return Response(status_code=304, headers=headers)
+        if opened["binary"] and not allow_binary:
+            raise HTTPException(status_code=415, detail=f"Binary file ({opened['size']} bytes); pass allow_binary=true to download it.")
+
+        size, status_code = opened["size"], 200
+        start, end = 0, size
+        try:
+            if start_line is not None or end_line is not None:
+                start, end = await asyncio.to_thread(line_span, opened["data"], start_line or 1, end_line)
+            elif http_request.headers.get("range") and http_request.headers.get("if-range", opened["etag"]) == opened["etag"]:
+                byte_range = parse_byte_range(http_request.headers["range"], size)
+                if byte_range is not None:
+                    start, end = byte_range
+                    status_code = 206
+                    headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{size}"
+            raise HTTPException(status_code=416, detail="Requested range is outside the file.", headers=headers)
+
+        headers["Content-Length"] = str(end - start)
+        media_type = "application/octet-stream" if opened["binary"] else "text/plain; charset=utf-8"
+        streaming = True
+        # The stream closes the file when it ends; the background task covers clients that disconnect first.
+        return StreamingResponse(
+            stream_repo_file(opened, start, end),
+            status_code=status_code,
+            media_type=media_type,
+            headers=headers,
+            background=BackgroundTask(close_repo_file, opened),
+        )
+    finally:
+        if not streaming:
+            close_repo_file(opened)
+
+@app.get("/api/repo/symbols", response_model=SymbolsResponse)
+async def list_file_symbols(repo_url: str = Query(...), file_path: str = Query(...), token: str = Depends(verify_descope_token)):
+    """Lists the functions, classes and module of one file, parsing it on the spot if the index is not built yet."""
+    checkout = repo_store.latest(repo_url)
+    if checkout is None:
         raise HTTPException(status_code=404, detail="Repository not found or hasn't been analyzed yet.")
-    
-    repo_root = repo_cache[repo_url]["path"] 
-    
-    full_file_path = os.path.abspath(os.path.join(repo_root, file_path))
-    
-    if not full_file_path.startswith(os.path.abspath(repo_root)):
-        logger.error(f"File path {full_file_path} is outside repository bounds")
-        raise HTTPException(status_code=403, detail="File path is outside the repository bounds.")
+    file_path = file_path.strip("/")
+    symbols = await symbol_index.file_symbols(checkout, file_path)
+    if symbols is not None:
+        return SymbolsResponse(status="ready", commit=checkout["commit"], symbols=symbols)
+
+    await schedule_repo_indexes(repo_url)
+    def read_file(leased: dict) -> dict:
+        resolve_repo_path(leased["path"], file_path)
+        return read_sources(leased["path"], [file_path])
 
-    if not os.path.exists(full_file_path) or not os.path.isfile(full_file_path):
-        logger.error(f"File {full_file_path} does not exist or is not a file")
-        raise HTTPException(status_code=404, detail="File does not exist in the repository.")
-        
     try:
-        with open(full_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        logger.debug(f"Successfully read file content from {full_file_path}")
-        return {"content": content}
-    except Exception as e:
-        logger.error(f"Error reading file {full_file_path}: {e}")
-        raise HTTPException(status_code=500, detail="Could not read file content.")
+        leased, sources = await asyncio.to_thread(load_leased, repo_url, read_file)
+    except RepoNotFoundError:
+        raise HTTPException(status_code=404, detail="Repository not found or hasn't been analyzed yet.")
+    parsed = await asyncio.to_thread(extract_symbols_batch, sources)
+    return SymbolsResponse(status="building", commit=leased["commit"], symbols=parsed[file_path])
+
+@app.get("/api/repo/symbols/definition", response_model=SymbolsResponse)
+async def find_symbol_definition(repo_url: str = Query(...), name: str = Query(..., min_length=1), token: str = Depends(verify_descope_token)):
+    """Finds definitions by qualified ("Class.method") or bare name."""
+    checkout = repo_store.latest(repo_url)
+    if checkout is None:
+        raise HTTPException(status_code=404, detail="Repository not found or hasn't been analyzed yet.")
+    symbols = await symbol_index.find(checkout, name)
+    if symbols is None:
+        await schedule_repo_indexes(repo_url)
+        return SymbolsResponse(status="building", commit=checkout["commit"], symbols=[])
+    return SymbolsResponse(status="ready", commit=checkout["commit"], symbols=symbols)
+
+@app.get("/api/repo/search", response_model=SearchResponse)
+async def search_repository(
+    repo_url: str = Query(...),
+    q: str = Query(..., min_length=1),
+    k: int = Query(10, ge=1, le=100),
+    token: str = Depends(verify_descope_token),
+):
+    """Finds the code chunks most similar to `q` in the newest analyzed checkout of `repo_url`."""
+    if semantic_index is None:
+        raise HTTPException(status_code=503, detail="Semantic search is disabled on this server.")
+    checkout = repo_store.latest(repo_url)
+    if checkout is None:
+        raise HTTPException(status_code=404, detail="Repository not found or hasn't been analyzed yet.")
+    index_status = await semantic_index.status(checkout)
+    if index_status != "ready":
+        if index_status == "missing":
+            await schedule_repo_indexes(repo_url)
+        return SearchResponse(status="building", commit=checkout["commit"], results=[])
+    try:
+        hits = await semantic_index.search(checkout, q, k)
+        hits = await asyncio.to_thread(read_snippets, repo_url, hits)
+    except LLMGatewayError as e:
+        logger.error(f"Embedding the search query failed: {e}")
+        raise HTTPException(status_code=502, detail=f"Could not embed the query: {e}")
+    except RepoNotFoundError:
+        raise HTTPException(status_code=404, detail="Repository not found or hasn't been analyzed yet.")
+    return SearchResponse(status="ready", commit=checkout["commit"], results=hits)
+
+@app.get("/api/repo/tree", response_model=DirectoryPage)
+async def get_directory_children(
+    repo_url: str = Query(...),
+    path: str = Query(""),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    token: str = Depends(verify_descope_token),
+):
+    """Returns one page of a directory's children from the per-commit tree index, without touching the checkout."""
+    path = path.strip("/")
+    try:
+        checkout, listing = await asyncio.to_thread(load_leased, repo_url, load_tree_index)
+    except RepoNotFoundError:
+        logger.error(f"Repository {repo_url} not found in cache")
+        raise HTTPException(status_code=404, detail="Repository not found or hasn't been analyzed yet.")
+
+    if path not in listing:
+        raise HTTPException(status_code=404, detail="Directory does not exist in the repository.")
+    items, total = list_children(listing, path, offset, limit)
+    return {"path": path, "items": items, "total": total, "offset": offset, "commit": checkout["commit"]}
 
 @app.post("/api/issues/find", response_model=List[Issue])
-async def find_issues(request: FindIssuesRequest, g: Github = Depends(get_github_client)):
-    logger.debug(f"Searching issues with skills: {request.skills}")
+async def find_issues(request: FindIssuesRequest, g: GitHubClient = Depends(get_github_client)):
+    logger.debug("Searching issues with skills: %s", request.skills)
     skills_query = ' '.join(request.skills.split(','))
     query = f'{skills_query} is:issue is:open label:"good first issue"'
     try:
-        issues = g.search_issues(query, sort='created', order='desc')
-        results = [
-            Issue(id=issue.id, title=issue.title, url=issue.html_url, repoName=issue.repository.full_name, labels=[label.name for label in issue.labels])
-            for issue in issues[:15]
-        ]
-        logger.info(f"Found {len(results)} issues for query: {query}")
+        issues = await g.search_issues(query, 15, sort='created', order='desc')
+        results = [Issue(**issue) for issue in issues]
+        logger.info("Found %s issues for query: %s", len(results), query)
         return results
-    except GithubException as e:
-        logger.error(f"Failed to fetch issues from GitHub: {e.data.get('message', 'Unknown error')}")
-        raise HTTPException(status_code=500, detail=f"Failed to fetch issues from GitHub: {e.data.get('message', 'Unknown error')}")
+    except GitHubAPIError as e:
+        logger.error(f"Failed to fetch issues from GitHub: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch issues from GitHub: {e}")
 
 @app.get("/api/user/stats", response_model=UserStats)
-async def get_user_stats(g: Github = Depends(get_github_client)):
+async def get_user_stats(g: GitHubClient = Depends(get_github_client)):
     logger.debug("Fetching user stats")
     try:
-        user = g.get_user()
-        stats = UserStats(public_repos=user.public_repos, followers=user.followers, following=user.following)
-        logger.debug(f"User stats: {stats}")
+        user = await g.get_authenticated_user()
+        stats = UserStats(public_repos=user["public_repos"], followers=user["followers"], following=user["following"])
+        logger.debug("User stats: %s", stats)
         return stats
-    except GithubException as e:
+    except GitHubAPIError as e:
         logger.error(f"Failed to fetch user stats from GitHub: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch user stats from GitHub.")
 
+async def prepare_explain_prompt(code: str, context: str, repo_url: str, symbol: str) -> str:
+    if repo_url and symbol:
+        code, location = await resolve_symbol_code(repo_url, symbol)
+        context = f"{context} ({location})" if context else location
+    if not code.strip():
+        raise HTTPException(status_code=400, detail="Provide either code or both repo_url and symbol.")
+    return build_explain_prompt(code, context)
+
 @app.post("/api/explain/code", response_model=CodeExplanationResponse)
-async def explain_code(code: str = Form(...), context: str = Form(""), token: str = Depends(verify_descope_token)):
+async def explain_code(
+    http_request: Request,
+    response: Response,
+    code: str = Form(""),
+    context: str = Form(""),
+    repo_url: str = Form(""),
+    symbol: str = Form(""),
+    token: str = Depends(verify_descope_token),
+):
+    """Explains `code`, or the definition of `symbol` in an analyzed repository when both `repo_url` and `symbol` are given."""
     logger.debug("Analyzing and explaining code snippet")
-    
-    
-    prompt = (
-        "You are an expert cybersecurity analyst and code reviewer. Analyze the following code for potential security vulnerabilities, "
-        "such as SQL injection, cross-site scripting (XSS), buffer overflows, or insecure dependencies. "
-        "If you find a vulnerability, explain it clearly, rate its severity, and provide a corrected, secure version under a 'Corrected Code:' heading."
-        "If the code is correct, provide a clear, step-by-step explanation of what it does.\n\n"
-        f"Context: '{context}'\n"
-        f"Code:\n```\n{code}\n```"
-    )
-    
+    prompt = await prepare_explain_prompt(code, context, repo_url, symbol)
 
     try:
-        ai_response_str = generate_with_ollama(prompt)
-        
-        corrected_code = None
-        explanation = ai_response_str
-        is_correct = True 
-
-        if "Corrected Code:" in ai_response_str:
-            is_correct = False
-            parts = ai_response_str.split("Corrected Code:", 1)
-            explanation = parts[0].strip()
-            corrected_code = parts[1].strip().replace("```python", "").replace("```", "").strip()
-
+        ai_response_str = await generate_cached("explain", EXPLAIN_PROMPT_VERSION, prompt, http_request, response)
         logger.debug("Code explanation generated")
-        return CodeExplanationResponse(
-            is_correct=is_correct,
-            explanation=explanation,
-            corrected_code=corrected_code
-        )
+        return parse_code_explanation(ai_response_str)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
         raise HTTPException(status_code=500, detail="Failed to get explanation from AI.")
 
+@app.post("/api/explain/code/stream")
+async def explain_code_stream(
+    http_request: Request,
+    code: str = Form(""),
+    context: str = Form(""),
+    repo_url: str = Form(""),
+    symbol: str = Form(""),
+    token: str = Depends(verify_descope_token),
+):
+    logger.debug("Streaming code explanation")
+    prompt = await prepare_explain_prompt(code, context, repo_url, symbol)
+    on_complete = lambda ai_response: parse_code_explanation(ai_response).model_dump()
+    key, cached = await lookup_llm_cache("explain", EXPLAIN_PROMPT_VERSION, prompt, http_request)
+    if cached is not None:
+        return stream_cached_response(cached, on_complete)
+    return stream_llm_response(prompt, on_complete, cache_as=("explain", key))
+
+@app.get("/api/cache/stats")
+async def get_cache_stats(token: str = Depends(verify_descope_token)):
+    """Hit/miss counters of the LLM response cache, per endpoint."""
+    return response_cache.stats()
+
+@app.get("/api/github/stats")
+async def get_github_stats(token: str = Depends(verify_descope_token)):
+    """Hit rates of the GitHub response cache per resource and the remaining rate-limit quota."""
+    return github_client.stats()
+
+@app.get("/api/llm/stats")
+async def get_llm_stats(token: str = Depends(verify_descope_token)):
+    """Generation slots in use, queue depth per user, rejections and queue wait percentiles."""
+    return llm_admission.stats()
+
+@app.get("/api/auth/stats")
+async def get_auth_stats(token: str = Depends(verify_descope_token)):
+    """Hit/miss counters of the validated-token cache."""
+    return token_cache.stats()
+
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    """Prometheus text exposition of every metric; needs `Authorization: Bearer $METRICS_TOKEN` when that is set."""
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token.")
+    return Response(content=METRICS_REGISTRY.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
 @app.get("/")
 async def root():
     return {"message": "API is running."}
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from typing import Iterable, List, Optional, Set
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class NoHealthyHost(Exception):
+    """Raised when no host is left to try for a request."""
+
+
+def model_key(name: str) -> str:
+    """Ollama reports loaded models with their tag ("codellama:latest"); requests often omit it."""
+    return name if ":" in name else f"{name}:latest"
+
+
+class OllamaHost:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.in_flight = 0
+        self.served = 0
+        self.consecutive_failures = 0
+        self.models: Set[str] = set()
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "inFlight": self.in_flight,
+            "served": self.served,
+            "consecutiveFailures": self.consecutive_failures,
+            "loadedModels": sorted(self.models),
+            "lastError": self.last_error,
+            "checkedAt": self.checked_at,
+        }
+
+
+class OllamaPool:
+    """
+    Spreads requests over several Ollama hosts.
+
+    A request goes to the host with the fewest requests in flight, where a
+    host that does not have the requested model loaded counts as
+    `load_penalty` requests busier (loading a model takes seconds), so
+    requests stick to warm hosts until those are clearly the busier ones.
+    Loaded models come from each host's /api/ps, polled every
+    `health_interval` seconds; the same poll is the health check. After
+    `eject_after` consecutive failures (failed polls or connection errors)
+    a host is ejected until a poll succeeds again. If every host is ejected,
+    all of them are tried rather than failing outright.
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        health_interval: float = 5.0,
+        eject_after: int = 2,
+        load_penalty: float = 2.0,
+        health_timeout: float = 2.0,
+    ):
+        self.hosts: List[OllamaHost] = [OllamaHost(url) for url in urls]
+        if not self.hosts:
+            raise ValueError("OllamaPool needs at least one host")
+        self.health_interval = health_interval
+        self.eject_after = eject_after
+        self.load_penalty = load_penalty
+        self.health_timeout = health_timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._checker: Optional[asyncio.Task] = None
+
+    async def start(self, client: httpx.AsyncClient):
+        self._client = client
+        await self.check_all()
+        if self.health_interval > 0:
+            self._checker = asyncio.ensure_future(self._run_health_checks())
+
+    async def aclose(self):
+        if self._checker is not None:
+            self._checker.cancel()
+            self._checker = None
+
+    def pick(self, model: Optional[str] = None, exclude: Iterable[OllamaHost] = ()) -> OllamaHost:
+        """Returns the host to send a request for `model` to, skipping `exclude`."""
+        excluded = set(id(host) for host in exclude)
+        candidates = [host for host in self.hosts if id(host) not in excluded]
+        if not candidates:
+            raise NoHealthyHost("Every Ollama host failed for this request")
+        healthy = [host for host in candidates if host.healthy]
+        wanted = model_key(model) if model else None
+
+        def cost(host: OllamaHost):
+            cold = wanted is not None and wanted not in host.models
+            return (host.in_flight + (self.load_penalty if cold else 0), host.in_flight, host.served)
+
+        return min(healthy or candidates, key=cost)
+
+    def acquire(self, host: OllamaHost):
+        host.in_flight += 1
+        host.served += 1
+
+    def mark_loaded(self, host: OllamaHost, model: str):
+        # Ollama loads the model to serve the request, so later ones can stick to this host.
+        host.models.add(model_key(model))
+
+    def release(self, host: OllamaHost):
+        host.in_flight -= 1
+
+    def report_success(self, host: OllamaHost):
+        host.consecutive_failures = 0
+        if not host.healthy:
+            host.healthy = True
+            logger.info("Ollama host %s is back, readmitting it", host.url)
+
+    def report_failure(self, host: OllamaHost, error: Exception):
+        host.consecutive_failures += 1
+        host.last_error = f"{type(error).__name__}: {error}"
+        if host.healthy and host.consecutive_failures >= self.eject_after:
+            host.healthy = False
+            logger.warning("Ejecting Ollama host %s after %d failures: %s", host.url, host.consecutive_failures, host.last_error)
+
+    async def check(self, host: OllamaHost):
+        """Polls /api/ps: a health check that also refreshes which models the host has loaded."""
+        host.checked_at = time.time()
+        try:
+            response = await self._client.get(f"{host.url}/api/ps", timeout=self.health_timeout)
+            response.raise_for_status()
+            host.models = {model_key(model["name"]) for model in response.json().get("models", [])}
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            self.report_failure(host, e)
+            return
+        self.report_success(host)
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(host) for host in self.hosts))
+
+    async def _run_health_checks(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.warning("Ollama health check failed: %s", e)
+
+    def stats(self) -> dict:
+        return {
+            "hosts": [host.to_dict() for host in self.hosts],
+            "healthy": sum(host.healthy for host in self.hosts),
+            "inFlight": sum(host.in_flight for host in self.hosts),
+        }
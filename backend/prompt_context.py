@@ -0,0 +1,192 @@
+import functools
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from file_tree import Listing
+
+# Words that say nothing about where in a repository a change belongs.
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "could", "do", "does", "for", "from",
+    "has", "have", "how", "if", "in", "into", "is", "it", "its", "not", "of", "on", "or", "should", "so",
+    "that", "the", "their", "then", "there", "this", "to", "use", "using", "was", "we", "when", "which",
+    "will", "with", "would", "you", "issue", "bug", "fix", "error", "add", "support", "please", "file",
+}
+
+# Files that are useful context for almost any contribution.
+KEY_FILES = {"readme", "contributing", "package.json", "pyproject.toml", "setup.py", "cargo.toml", "go.mod", "makefile"}
+
+TITLE_WEIGHT = 2.0
+KEY_FILE_SCORE = 0.5
+
+_WORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting; close enough for BPE tokenizers on code-like text."""
+    return len(text) // 4 + 1
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ers", "er", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def split_words(text: str) -> List[str]:
+    """Splits identifiers and prose alike ("parseHTTPHeaders_v2" -> parse, http, header, v, 2)."""
+    return [_stem(word.lower()) for word in _WORD_RE.findall(text)]
+
+
+@functools.lru_cache(maxsize=65536)
+def _name_words(name: str) -> frozenset:
+    # Path names repeat a lot across a tree (index.ts, __init__.py, ...).
+    return frozenset(split_words(name))
+
+
+def query_weights(issue_title: str, issue_body: str, listing: Listing) -> Dict[str, float]:
+    """
+    Weights each issue term by how rare it is among path names (IDF), counting title terms double.
+
+    Terms that no path contains are dropped, so the result is small even for long issue bodies.
+    """
+    document_frequency: Counter = Counter()
+    for entries in listing.values():
+        for name, _ in entries:
+            document_frequency.update(_name_words(name))
+    total = sum(len(entries) for entries in listing.values()) or 1
+
+    weights: Dict[str, float] = {}
+    for text, factor in ((issue_body or "", 1.0), (issue_title or "", TITLE_WEIGHT)):
+        for term in set(split_words(text)):
+            if len(term) < 2 or term in STOPWORDS or term not in document_frequency:
+                continue
+            weights[term] = max(weights.get(term, 0.0), factor * math.log(1 + total / document_frequency[term]))
+    return weights
+
+
+def _name_score(name: str, weights: Dict[str, float]) -> float:
+    score = sum(weights.get(term, 0.0) for term in _name_words(name))
+    if name.lower().rsplit(".", 1)[0] in KEY_FILES or name.lower() in KEY_FILES:
+        score += KEY_FILE_SCORE
+    return score
+
+
+def score_listing(listing: Listing, weights: Dict[str, float]) -> Tuple[Dict[str, float], Dict[str, float], Dict[str, int]]:
+    """
+    Returns (score of every path, best score within every directory's subtree, file count of every directory's subtree).
+    """
+    scores: Dict[str, float] = {}
+    best: Dict[str, float] = {}
+    file_counts: Dict[str, int] = {}
+    # Deepest directories first, so every child directory is finished before its parent.
+    for rel_dir in sorted(listing, key=lambda d: d.count("/") + bool(d), reverse=True):
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        subtree_best = 0.0
+        files = 0
+        for name, is_dir in listing[rel_dir]:
+            path = prefix + name
+            score = scores[path] = _name_score(name, weights)
+            if is_dir:
+                subtree_best = max(subtree_best, score + best.get(path, 0.0))
+                files += file_counts.get(path, 0)
+            else:
+                subtree_best = max(subtree_best, score)
+                files += 1
+        best[rel_dir] = subtree_best
+        file_counts[rel_dir] = files
+    return scores, best, file_counts
+
+
+def _line(depth: int, name: str, is_dir: bool, file_count: Optional[int] = None) -> str:
+    indent = "    " * depth
+    if not is_dir:
+        return f"{indent}|-- {name}"
+    if file_count is None:
+        return f"{indent}+-- {name}"
+    return f"{indent}+-- {name}/ ({file_count} files)"
+
+
+def build_tree_context(
+    listing: Listing,
+    issue_title: str,
+    issue_body: str,
+    token_budget: int,
+    max_unranked_files: int = 10,
+) -> str:
+    """
+    Renders the part of a repository tree most relevant to an issue within `token_budget`.
+
+    Directories are expanded best-first by the relevance of their subtree
+    (shallow ones first among equals) for as long as their children fit in
+    the budget; everything else stays collapsed as "name/ (N files)". An
+    expanded directory shows its relevant files plus up to
+    `max_unranked_files` others, summarizing the rest as "... (N more files)".
+    The output is assembled from a list of lines, so rendering is linear.
+    """
+    weights = query_weights(issue_title, issue_body, listing)
+    scores, best, file_counts = score_listing(listing, weights)
+
+    # Expanded directory -> (entries to show, number of files left out)
+    expanded: Dict[str, Tuple[List[Tuple[str, bool]], int]] = {}
+
+    def children_of(rel_dir: str, depth: int) -> Tuple[List[Tuple[str, bool]], int, int]:
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        entries = listing.get(rel_dir, [])
+        files = [entry for entry in entries if not entry[1]]
+        ranked = sorted(files, key=lambda entry: -scores[prefix + entry[0]])
+        shown = {name for name, _ in ranked if scores[prefix + name] > 0}
+        shown.update(name for name, _ in ranked[:len(shown) + max_unranked_files])
+        visible = [entry for entry in entries if entry[1] or entry[0] in shown]
+        hidden = len(files) - len(shown)
+        cost = 0
+        for name, is_dir in visible:
+            count = file_counts.get(prefix + name) if is_dir else None
+            cost += estimate_tokens(_line(depth, name, is_dir, count))
+        if hidden:
+            cost += estimate_tokens(_line(depth, f"... ({hidden} more files)", False))
+        return visible, hidden, cost
+
+    remaining = token_budget
+    # (-relevance, depth, path); the root is always expanded.
+    queue = [(0.0, 0, "")]
+    while queue:
+        _, depth, rel_dir = heapq.heappop(queue)
+        visible, hidden, cost = children_of(rel_dir, depth)
+        if rel_dir and cost > remaining:
+            continue
+        remaining -= cost
+        expanded[rel_dir] = (visible, hidden)
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        for name, is_dir in visible:
+            path = prefix + name
+            if is_dir and listing.get(path):
+                heapq.heappush(queue, (-(scores[path] + best.get(path, 0.0)), depth + 1, path))
+
+    lines: List[str] = []
+    # Items are either ("dir", path, depth) to expand or ("line", text, 0) to emit as is.
+    stack = [("dir", "", 0)]
+    while stack:
+        kind, value, depth = stack.pop()
+        if kind == "line":
+            lines.append(value)
+            continue
+        if value:
+            name = value.rsplit("/", 1)[-1]
+            if value not in expanded:
+                lines.append(_line(depth - 1, name, True, file_counts.get(value)))
+                continue
+            lines.append(_line(depth - 1, name, True))
+        visible, hidden = expanded[value]
+        prefix = f"{value}/" if value else ""
+        pending = [
+            ("dir", prefix + name, depth + 1) if is_dir else ("line", _line(depth, name, False), 0)
+            for name, is_dir in visible
+        ]
+        if hidden:
+            pending.append(("line", _line(depth, f"... ({hidden} more files)", False), 0))
+        stack.extend(reversed(pending))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,147 @@
+import json
+import re
+import time
+from typing import Optional
+
+from metrics import Counter, Histogram, exponential_buckets
+
+# Ollama ends every generation with one object carrying `"done": true` and its counters.
+DONE_LINE = re.compile(rb'"done"\s*:\s*true')
+
+OLLAMA_QUEUE_WAIT = Histogram(
+    "ollama_queue_wait_seconds",
+    "Seconds a generation waited inside Ollama before its model ran: total_duration minus load, prompt and eval durations.",
+    ["model", "host"],
+)
+OLLAMA_TIME_TO_FIRST_TOKEN = Histogram(
+    "ollama_time_to_first_token_seconds", "Seconds from the proxy receiving a streaming generation to its first token.", ["model", "host"]
+)
+OLLAMA_INTER_TOKEN_GAP = Histogram(
+    "ollama_inter_token_gap_seconds", "Seconds between consecutive tokens of a streaming generation.", ["model"],
+    buckets=(0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0, 2.5),
+)
+OLLAMA_TOKENS_PER_SECOND = Histogram(
+    "ollama_tokens_per_second", "Generation speed reported by Ollama (eval_count / eval_duration).", ["model", "host"],
+    buckets=(1, 2.5, 5, 10, 20, 30, 50, 75, 100, 150, 250),
+)
+OLLAMA_LOAD_DURATION = Histogram(
+    "ollama_load_duration_seconds", "Seconds Ollama spent loading the model for a generation (load_duration).", ["model", "host"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+OLLAMA_EVAL_TOKENS = Counter("ollama_eval_tokens_total", "Tokens generated (eval_count).", ["model", "host"])
+OLLAMA_PROMPT_TOKENS = Histogram(
+    "ollama_prompt_tokens", "Prompt tokens evaluated per generation (prompt_eval_count).", ["model"],
+    buckets=exponential_buckets(64, 2, 10),
+)
+
+
+def seconds(nanoseconds) -> Optional[float]:
+    return nanoseconds / 1e9 if isinstance(nanoseconds, (int, float)) else None
+
+
+class GenerationTelemetry:
+    """
+    Watches an Ollama /api/generate response as the proxy forwards it.
+
+    Call `feed(chunk, received_at)` after a chunk has been passed on, so
+    the client never waits for it. Token lines are only timed, not decoded;
+    the final `"done": true` object is parsed for Ollama's counters.
+    `finish()` records the metrics and returns (and keeps as `summary`) the
+    fields for the access log.
+    """
+
+    def __init__(self, model: Optional[str], host: str, started: float):
+        self.model = model or "unknown"
+        self.host = host
+        self.started = started
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.tokens = 0
+        self.max_gap = 0.0
+        self.final: dict = {}
+        self.error: Optional[str] = None
+        self.summary: Optional[dict] = None
+        self._buffer = bytearray()
+        self._gaps = OLLAMA_INTER_TOKEN_GAP.labels(self.model)
+
+    def feed(self, chunk: bytes, received_at: float):
+        self._buffer += chunk
+        while True:
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                return
+            line = bytes(self._buffer[:end])
+            del self._buffer[:end + 1]
+            self._line(line, received_at)
+
+    def _line(self, line: bytes, received_at: float):
+        if not line.strip():
+            return
+        if DONE_LINE.search(line):
+            try:
+                self.final = json.loads(line)
+            except ValueError:
+                pass
+            return
+        if line.lstrip().startswith(b'{"error"'):
+            try:
+                self.error = str(json.loads(line).get("error"))
+            except ValueError:
+                self.error = line.decode("utf-8", "replace")
+            return
+        if self.first_token_at is None:
+            self.first_token_at = received_at
+        else:
+            gap = received_at - self.last_token_at
+            self.max_gap = max(self.max_gap, gap)
+            self._gaps.observe(gap)
+        self.last_token_at = received_at
+        self.tokens += 1
+
+    def finish(self) -> dict:
+        if self.summary is not None:
+            return self.summary
+        if self._buffer.strip():
+            # Non-streaming responses are one object, usually without a trailing newline.
+            self._line(bytes(self._buffer), time.perf_counter())
+            self._buffer.clear()
+        final = self.final
+        summary = {"host": self.host, "tokens": self.tokens}
+        if self.error is not None:
+            summary["upstreamError"] = self.error
+        if self.first_token_at is not None:
+            summary["ttftMs"] = round((self.first_token_at - self.started) * 1000, 1)
+            summary["maxGapMs"] = round(self.max_gap * 1000, 1)
+            OLLAMA_TIME_TO_FIRST_TOKEN.labels(self.model, self.host).observe(self.first_token_at - self.started)
+
+        eval_count, eval_duration = final.get("eval_count"), seconds(final.get("eval_duration"))
+        load_duration, prompt_eval_duration = seconds(final.get("load_duration")), seconds(final.get("prompt_eval_duration"))
+        total_duration = seconds(final.get("total_duration"))
+        if eval_count:
+            summary["evalCount"] = eval_count
+            OLLAMA_EVAL_TOKENS.labels(self.model, self.host).inc(eval_count)
+            if eval_duration:
+                summary["tokensPerSecond"] = round(eval_count / eval_duration, 2)
+                OLLAMA_TOKENS_PER_SECOND.labels(self.model, self.host).observe(eval_count / eval_duration)
+        if final.get("prompt_eval_count"):
+            summary["promptEvalCount"] = final["prompt_eval_count"]
+            OLLAMA_PROMPT_TOKENS.labels(self.model).observe(final["prompt_eval_count"])
+        if load_duration is not None:
+            summary["loadMs"] = round(load_duration * 1000, 1)
+            OLLAMA_LOAD_DURATION.labels(self.model, self.host).observe(load_duration)
+        if total_duration is not None:
+            queue_wait = max(0.0, total_duration - (load_duration or 0) - (prompt_eval_duration or 0) - (eval_duration or 0))
+            summary["queueWaitMs"] = round(queue_wait * 1000, 1)
+            OLLAMA_QUEUE_WAIT.labels(self.model, self.host).observe(queue_wait)
+        self.summary = summary
+        return summary
+
+
+class JsonMessage:
+    """A log message rendered as one JSON object, only when the record is written."""
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return json.dumps(self.fields, separators=(",", ":"), default=str)
@@ -0,0 +1,443 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import git
+
+from log_config import Sampler
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+
+class RepoNotFoundError(KeyError):
+    """Raised when a repository has not been cloned into the store."""
+
+
+class RepoBusyError(TimeoutError):
+    """Raised when a checkout stays locked by an in-place refresh, or by its readers, for longer than the wait timeout."""
+
+
+# Called once per read-only file (every git object on Windows), so only a sample is logged.
+fix_permissions_sample = Sampler(1000)
+
+
+def handle_remove_readonly(func, path, exc_info):
+    if not isinstance(exc_info[1], PermissionError):
+        raise
+    if fix_permissions_sample():
+        logger.debug("Fixing permissions for %s (logged once per 1000 files)", path)
+    os.chmod(path, stat.S_IWRITE)
+    func(path)
+
+
+def parse_name_status(output: str) -> Dict[str, List[str]]:
+    """Parses `git diff --name-status --no-renames -z` output into added/modified/deleted paths."""
+    changes: Dict[str, List[str]] = {"added": [], "modified": [], "deleted": []}
+    fields = output.split("\0")
+    for status, path in zip(fields[0::2], fields[1::2]):
+        if status.startswith("A"):
+            changes["added"].append(path)
+        elif status.startswith("D"):
+            changes["deleted"].append(path)
+        elif status:
+            changes["modified"].append(path)
+    return changes
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class RepoStore:
+    """
+    On-disk cache of cloned repositories, keyed by (repo URL, HEAD commit).
+
+    Each checkout lives in `<root>/checkouts/<key>/repo` next to its cached
+    analysis and other per-commit artifacts. The index (LRU order, sizes, latest commit per URL) is persisted
+    to `<root>/index.json` so the cache survives restarts. When the total size
+    exceeds `max_bytes` the least recently used checkouts are deleted, except
+    those currently leased by a reader.
+
+    Leases are meant to be short (reading files, not serving them to a
+    client): readers wait at most `wait_timeout` seconds for an in-place
+    refresh, and a refresh waits as long for readers before giving up.
+
+    Stored checkouts can be refreshed in place: only the new commit is
+    fetched, and callers receive the list of changed paths so they can patch
+    derived data instead of rebuilding it.
+    """
+
+    def __init__(self, root_dir: str, max_bytes: int, wait_timeout: float = 30.0):
+        self.root_dir = os.path.abspath(root_dir)
+        self.checkouts_dir = os.path.join(self.root_dir, "checkouts")
+        self.tmp_dir = os.path.join(self.root_dir, "tmp")
+        self.index_path = os.path.join(self.root_dir, "index.json")
+        self.max_bytes = max_bytes
+        self.wait_timeout = wait_timeout
+
+        self._lock = threading.RLock()
+        self._released = threading.Condition(self._lock)  # signalled when leases or refreshes finish
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()  # key -> entry, least recently used first
+        self._heads: Dict[str, str] = {}  # repo URL -> key of its newest checkout
+        self._pins: Dict[str, int] = {}  # key -> number of active leases
+        self._writing: set = set()  # keys whose working tree is being updated by a refresh
+        self._artifacts: Dict[str, Dict[str, Any]] = {}  # key -> artifact name -> data loaded from disk
+
+        os.makedirs(self.checkouts_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._load_index()
+
+    # --- Index persistence ---
+    @staticmethod
+    def make_key(url: str, commit: str) -> str:
+        url_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        return f"{url_hash}-{commit}"
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.checkouts_dir, key)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable repository index {self.index_path}: {e}")
+            data = {}
+
+        if data.get("version") == INDEX_VERSION:
+            for entry in data.get("entries", []):
+                if os.path.isdir(entry["path"]):
+                    self._entries[entry["key"]] = entry
+            self._heads = {url: key for url, key in data.get("heads", {}).items() if key in self._entries}
+        logger.info(f"Repository store loaded {len(self._entries)} checkouts ({self.total_bytes()} bytes) from {self.root_dir}")
+
+    def recover(self):
+        """
+        Deletes partial clones and checkouts missing from the index, left behind by a crash.
+
+        Call once at server startup, before any clone starts; it is kept out of
+        the constructor so worker processes importing the app never run it.
+        """
+        with self._lock:
+            for name in os.listdir(self.tmp_dir):
+                shutil.rmtree(os.path.join(self.tmp_dir, name), onerror=handle_remove_readonly)
+            for name in os.listdir(self.checkouts_dir):
+                if name not in self._entries:
+                    logger.info(f"Removing orphaned checkout {name}")
+                    shutil.rmtree(self._entry_dir(name), onerror=handle_remove_readonly)
+
+    def _save_index(self):
+        data = {"version": INDEX_VERSION, "entries": list(self._entries.values()), "heads": self._heads}
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.index_path)
+
+    # --- Lookup ---
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry["size"] for entry in self._entries.values())
+
+    def _touch(self, key: str):
+        self._entries[key]["last_access"] = time.time()
+        self._entries.move_to_end(key)
+
+    def latest(self, url: str) -> Optional[dict]:
+        """Returns the newest checkout of `url`, or None if it has never been cloned."""
+        with self._lock:
+            key = self._heads.get(url)
+            if key is None:
+                return None
+            self._touch(key)
+            return dict(self._entries[key])
+
+    def artifact_path(self, key: str, name: str) -> str:
+        """Path of a file stored next to a checkout; it moves and is evicted together with it."""
+        return os.path.join(self._entry_dir(key), name)
+
+    def load_artifact(self, key: str, name: str) -> Optional[Any]:
+        """Returns the JSON artifact `name` of checkout `key`, or None if it has not been saved."""
+        with self._lock:
+            cached = self._artifacts.get(key, {})
+            if name in cached:
+                return cached[name]
+        try:
+            with open(self.artifact_path(key, f"{name}.json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._artifacts.setdefault(key, {})[name] = data
+        return data
+
+    def save_artifact(self, key: str, name: str, data: Any):
+        path = self.artifact_path(key, f"{name}.json")
+        # A private temporary file per call, so concurrent saves of the same artifact cannot interleave.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{name}.", suffix=".tmp")
+        try:
+            with open(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._artifacts.setdefault(key, {})[name] = data
+
+    def get_analysis(self, url: str) -> Optional[dict]:
+        """Returns the stored analysis for the newest checkout of `url`, if any."""
+        entry = self.latest(url)
+        if entry is None:
+            return None
+        return self.load_artifact(entry["key"], "analysis")
+
+    def save_analysis(self, key: str, analysis: dict):
+        self.save_artifact(key, "analysis", analysis)
+
+    # --- Leases ---
+    def _pin(self, key: str):
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def _unpin(self, key: str):
+        with self._lock:
+            self._pins[key] -= 1
+            if self._pins[key]:
+                return
+            del self._pins[key]
+            self._released.notify_all()
+        self._evict()
+
+    @contextmanager
+    def lease(self, url: str) -> Iterator[dict]:
+        """
+        Yields the newest checkout of `url` and keeps it from being evicted until
+        the block exits. Raises RepoNotFoundError if the repository has not been cloned,
+        and RepoBusyError if an in-place refresh of it does not finish within `wait_timeout`.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        with self._lock:
+            key = self._heads.get(url)
+            # Wait out an in-place refresh so readers never see a half-updated tree.
+            while key in self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RepoBusyError(url)
+                self._released.wait(remaining)
+                key = self._heads.get(url)
+            if key is None:
+                raise RepoNotFoundError(url)
+            self._touch(key)
+            self._pin(key)
+            entry = dict(self._entries[key])
+        try:
+            yield entry
+        finally:
+            self._unpin(key)
+
+    @contextmanager
+    def clone(self, url: str) -> Iterator[dict]:
+        """
+        Shallow-clones `url` into the store and yields the (leased) checkout.
+
+        If the remote HEAD is already stored, the fresh clone is discarded and
+        the existing checkout is reused.
+        """
+        staging_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        repo_dir = os.path.join(staging_dir, "repo")
+        try:
+            repo = git.Repo.clone_from(url, repo_dir, depth=1)
+            commit = repo.head.commit.hexsha
+            repo.close()
+            key = self.make_key(url, commit)
+            size = directory_size(staging_dir)
+            with self._lock:
+                if key in self._entries:
+                    logger.info(f"{url}@{commit} already stored, discarding duplicate clone")
+                else:
+                    os.replace(staging_dir, self._entry_dir(key))
+                    self._entries[key] = {
+                        "key": key,
+                        "url": url,
+                        "commit": commit,
+                        "path": os.path.join(self._entry_dir(key), "repo"),
+                        "size": size,
+                        "last_access": time.time(),
+                        "fetched_at": time.time(),
+                    }
+                    logger.info(f"Stored {url}@{commit} ({size} bytes)")
+                self._heads[url] = key
+                self._touch(key)
+                self._pin(key)
+                entry = dict(self._entries[key])
+                self._save_index()
+        finally:
+            if os.path.isdir(staging_dir):
+                shutil.rmtree(staging_dir, onerror=handle_remove_readonly)
+        self._evict()
+        try:
+            yield entry
+        finally:
+            self._unpin(key)
+
+    @contextmanager
+    def refresh(self, url: str) -> Iterator[Tuple[dict, Optional[Dict[str, List[str]]]]]:
+        """
+        Fetches the remote HEAD of `url` into its newest checkout and updates it in place.
+
+        Yields the (leased) checkout and the paths changed since its
+        `previous_commit` as {"added": [...], "modified": [...], "deleted": [...]},
+        or None when the working tree was not changed (then `previous_commit`
+        is its current commit). Data derived from the checkout may still be
+        older than `previous_commit`, e.g. if an earlier refresh failed after
+        updating the tree, so callers must check before patching it. The
+        working tree is only touched once no reader holds a lease on it.
+        """
+        with self._lock:
+            key = self._heads.get(url)
+            if key is None or key in self._writing:
+                raise RepoNotFoundError(url)
+            self._pin(key)
+            old_entry = dict(self._entries[key])
+
+        repo = git.Repo(old_entry["path"])
+        try:
+            repo.git.fetch("--depth=1", "origin", "HEAD")
+            new_commit = repo.rev_parse("FETCH_HEAD").hexsha
+            changes = None
+            if new_commit != old_entry["commit"]:
+                changes = parse_name_status(repo.git.diff("--name-status", "--no-renames", "-z", old_entry["commit"], new_commit))
+        except Exception:
+            repo.close()
+            self._unpin(key)
+            raise
+
+        new_key = self.make_key(url, new_commit)
+        try:
+            if changes is not None and new_key in self._entries:
+                # The new commit is already stored (e.g. the remote was reverted); just point at it.
+                with self._lock:
+                    logger.info(f"{url}@{new_commit} already stored, switching to it")
+                    self._heads[url] = new_key
+                    self._pin(new_key)
+                self._unpin(key)
+                key, changes = new_key, None
+            elif changes is not None:
+                self._update_in_place(repo, key, new_key, new_commit)
+                key = new_key
+                logger.info(f"Refreshed {url} from {old_entry['commit']} to {new_commit}: "
+                            f"{sum(len(paths) for paths in changes.values())} paths changed")
+        finally:
+            repo.close()
+
+        with self._lock:
+            self._entries[key]["fetched_at"] = time.time()
+            self._touch(key)
+            entry = dict(self._entries[key])
+            entry["previous_commit"] = old_entry["commit"] if changes is not None else entry["commit"]
+            self._save_index()
+        try:
+            yield entry, changes
+        finally:
+            self._unpin(key)
+
+    def _update_in_place(self, repo: git.Repo, key: str, new_key: str, new_commit: str):
+        """
+        Checks out `new_commit` over the checkout stored as `key` and re-keys it as `new_key`.
+
+        Expects the caller to hold one lease on `key`, which is used up; returns holding
+        one on `new_key`. Raises RepoBusyError, leaving the checkout untouched, if other
+        leases on `key` are not released within `wait_timeout`.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        with self._lock:
+            self._writing.add(key)
+            self._pins[key] -= 1
+            if not self._pins[key]:
+                del self._pins[key]
+            while self._pins.get(key):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._writing.discard(key)
+                    self._released.notify_all()
+                    raise RepoBusyError(f"{self._entries[key]['url']} is still being read")
+                self._released.wait(remaining)
+        try:
+            repo.git.reset("--hard", new_commit)
+            repo.close()
+            # Nothing else touches the tree while the key is being written.
+            size = directory_size(self._entry_dir(key))
+            with self._lock:
+                entry = self._entries.pop(key)
+                os.replace(self._entry_dir(key), self._entry_dir(new_key))
+                entry.update(
+                    key=new_key,
+                    commit=new_commit,
+                    path=os.path.join(self._entry_dir(new_key), "repo"),
+                    size=size,
+                )
+                self._entries[new_key] = entry
+                self._heads[entry["url"]] = new_key
+                if key in self._artifacts:
+                    self._artifacts[new_key] = self._artifacts.pop(key)
+                self._pin(new_key)
+        finally:
+            with self._lock:
+                self._writing.discard(key)
+                self._released.notify_all()
+
+    # --- Eviction ---
+    def _evict(self):
+        """
+        Deletes least recently used, unleased checkouts until the store fits its budget.
+
+        Victims are moved into the tmp directory under the lock and deleted
+        after it is released, so other requests never wait on a recursive delete.
+        Must not be called with the lock held.
+        """
+        doomed = []
+        with self._lock:
+            total = sum(entry["size"] for entry in self._entries.values())
+            for key in list(self._entries):
+                if total <= self.max_bytes:
+                    break
+                if self._pins.get(key) or key in self._writing:
+                    continue
+                entry = self._entries.pop(key)
+                self._artifacts.pop(key, None)
+                if self._heads.get(entry["url"]) == key:
+                    del self._heads[entry["url"]]
+                total -= entry["size"]
+                logger.info(f"Evicting {entry['url']}@{entry['commit']} ({entry['size']} bytes)")
+                trash_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+                os.replace(self._entry_dir(key), os.path.join(trash_dir, key))
+                doomed.append(trash_dir)
+            if doomed:
+                self._save_index()
+        # Anything left behind by a crash here is removed by recover().
+        for trash_dir in doomed:
+            shutil.rmtree(trash_dir, onerror=handle_remove_readonly)
+
+    def close(self):
+        with self._lock:
+            self._save_index()
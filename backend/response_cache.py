@@ -0,0 +1,116 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Drops differences that cannot change the answer: line endings and trailing whitespace."""
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def make_key(model: str, template: str, template_version: int, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+    material = json.dumps(
+        [model, template, template_version, normalize_prompt(prompt), options or {}],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of generated LLM responses, addressed by the hash of everything that determines them.
+
+    Lookups hit an in-memory LRU first and fall back to a SQLite database
+    that survives restarts (pass `db_path=None` to keep only the memory
+    tier). Entries carry their creation time; the TTL is chosen by the
+    caller on every lookup so each endpoint can apply its own.
+
+    All methods are blocking and thread-safe.
+    """
+
+    def __init__(self, db_path: Optional[str], max_memory_entries: int = 1024):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, namespace: str, key: str, ttl: float) -> Optional[str]:
+        """Returns the cached response for `key` if it is younger than `ttl` seconds."""
+        oldest = time.time() - ttl
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] >= oldest:
+                self._memory.move_to_end(key)
+                self.hits[namespace] += 1
+                return entry[0]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ? AND created_at >= ?", (key, oldest)
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0], row[1])
+                    self.hits[namespace] += 1
+                    return row[0]
+            self.misses[namespace] += 1
+            return None
+
+    def put(self, namespace: str, key: str, value: str):
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, value, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, namespace, value, created_at) VALUES (?, ?, ?, ?)",
+                    (key, namespace, value, created_at),
+                )
+
+    def purge(self, max_age: float) -> int:
+        """Deletes persisted entries older than `max_age` seconds and returns how many were removed."""
+        if self._db is None:
+            return 0
+        with self._lock:
+            removed = self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - max_age,)).rowcount
+        if removed:
+            logger.info("Purged %d expired LLM responses from %s", removed, self.db_path)
+        return removed
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                namespace: {"hits": self.hits[namespace], "misses": self.misses[namespace]}
+                for namespace in sorted(set(self.hits) | set(self.misses))
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
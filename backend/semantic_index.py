@@ -0,0 +1,296 @@
+import ast
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from llm_gateway import LLMGateway
+from repo_store import RepoStore
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+SOURCE_EXTENSIONS = {
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs", ".java", ".kt", ".scala", ".go", ".rs", ".rb",
+    ".php", ".c", ".h", ".cc", ".cpp", ".hpp", ".cs", ".swift", ".m", ".sh", ".md", ".rst",
+}
+MAX_FILE_BYTES = 256 * 1024
+MAX_CHUNK_LINES = 60
+MAX_EMBED_CHARS = 2000
+
+# Declarations at (or near) the top level in C-like, Go, Rust, Ruby and JS/TS sources.
+DECLARATION_RE = re.compile(
+    r"^\s{0,4}(?:export\s+(?:default\s+)?)?"
+    r"(?:(?:public|private|protected|internal|static|abstract|final|async|pub(?:\([\w:]+\))?)\s+)*"
+    r"(?:function\*?|class|interface|enum|struct|impl|trait|fn|func|def|module|namespace"
+    r"|const\s+\w+\s*=\s*(?:async\s*)?(?:\(|function))\b"
+)
+HEADING_RE = re.compile(r"^#{1,3}\s")
+
+
+def python_boundaries(text: str) -> List[int]:
+    """Start lines of top-level functions and classes, and of the methods of classes too long for one chunk."""
+    starts = []
+    for node in ast.parse(text).body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        starts.append(min([node.lineno] + [decorator.lineno for decorator in node.decorator_list]))
+        if isinstance(node, ast.ClassDef) and node.end_lineno - node.lineno > MAX_CHUNK_LINES:
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    starts.append(min([child.lineno] + [decorator.lineno for decorator in child.decorator_list]))
+    return starts
+
+
+def pattern_boundaries(lines: List[str], pattern: re.Pattern) -> List[int]:
+    return [number for number, line in enumerate(lines, 1) if pattern.match(line)]
+
+
+def chunk_spans(path: str, text: str) -> List[Tuple[int, int]]:
+    """
+    Splits a source file into (lineStart, lineEnd) chunks at function/class boundaries.
+
+    Code between definitions stays with the preceding chunk, and chunks
+    longer than MAX_CHUNK_LINES are cut into windows.
+    """
+    lines = text.splitlines()
+    if not lines:
+        return []
+    extension = os.path.splitext(path)[1].lower()
+    starts: List[int] = []
+    if extension == ".py":
+        try:
+            starts = python_boundaries(text)
+        except (SyntaxError, ValueError):
+            starts = pattern_boundaries(lines, DECLARATION_RE)
+    elif extension in (".md", ".rst"):
+        starts = pattern_boundaries(lines, HEADING_RE)
+    else:
+        starts = pattern_boundaries(lines, DECLARATION_RE)
+
+    starts = sorted(set(start for start in starts if start > 1))
+    bounds = [1] + starts + [len(lines) + 1]
+    spans = []
+    for start, next_start in zip(bounds, bounds[1:]):
+        for window_start in range(start, next_start, MAX_CHUNK_LINES):
+            spans.append((window_start, min(window_start + MAX_CHUNK_LINES, next_start) - 1))
+    return [(start, end) for start, end in spans if any(line.strip() for line in lines[start - 1:end])]
+
+
+def collect_chunks(repo_path: str, paths: List[str]) -> Tuple[List[List], List[str]]:
+    """Chunks the given files of a checkout; returns ([path, lineStart, lineEnd] per chunk, text to embed per chunk). Blocking."""
+    chunks: List[List] = []
+    texts: List[str] = []
+    for path in paths:
+        full_path = os.path.join(repo_path, path)
+        try:
+            if os.path.getsize(full_path) > MAX_FILE_BYTES:
+                continue
+            with open(full_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        if b"\0" in data[:8000]:
+            continue
+        text = data.decode("utf-8", errors="ignore")
+        lines = text.splitlines()
+        for start, end in chunk_spans(path, text):
+            chunks.append([path, start, end])
+            texts.append(f"{path}\n" + "\n".join(lines[start - 1:end])[:MAX_EMBED_CHARS])
+    return chunks, texts
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class HashingEmbedder:
+    """
+    Local stand-in for a real embedding model: hashed bag of identifier parts.
+
+    Needs no server, so indexing and search can be exercised in tests and
+    offline; results only reflect shared words, not meaning.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"[A-Za-z][a-z]+|[A-Z]+(?![a-z])|\d+", text):
+                digest = hashlib.blake2b(word.lower().encode(), digest_size=4).digest()
+                matrix[row, int.from_bytes(digest, "little") % self.dim] += 1.0
+        return matrix
+
+
+class OllamaEmbedder:
+    """Embeds through Ollama's /api/embed endpoint (via the MCP server), in batches."""
+
+    def __init__(self, gateway: LLMGateway, model: str, batch_size: int = 32):
+        self.gateway = gateway
+        self.model = model
+        self.batch_size = batch_size
+        self.name = f"ollama:{model}"
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        vectors: List[List[float]] = []
+        for offset in range(0, len(texts), self.batch_size):
+            vectors.extend(await self.gateway.embed(texts[offset:offset + self.batch_size], model=self.model))
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class SemanticIndex:
+    """
+    Per-commit embedding index of the code chunks of stored checkouts.
+
+    The vectors of a checkout are saved as `embeddings.npy` (one normalized
+    row per chunk) next to a `search` artifact describing the chunks and the
+    blob id of every indexed file. Rebuilding after a refresh re-embeds only
+    the files whose blob id changed and reuses every other row.
+    """
+
+    def __init__(self, repo_store: RepoStore, embedder, max_loaded: int = 8):
+        self.repo_store = repo_store
+        self.embedder = embedder
+        self.max_loaded = max_loaded
+        self._builds: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._loaded: "OrderedDict[str, Tuple[dict, np.ndarray]]" = OrderedDict()
+
+    def _matrix_path(self, key: str) -> str:
+        return self.repo_store.artifact_path(key, "embeddings.npy")
+
+    def _load(self, key: str) -> Optional[Tuple[dict, np.ndarray]]:
+        """Returns (metadata, matrix) stored for checkout `key`, whatever commit it was built at. Blocking."""
+        with self._lock:
+            loaded = self._loaded.get(key)
+            if loaded is not None:
+                self._loaded.move_to_end(key)
+                return loaded
+        meta = self.repo_store.load_artifact(key, "search")
+        if meta is None or meta.get("version") != INDEX_VERSION or meta.get("embedder") != self.embedder.name:
+            return None
+        try:
+            matrix = np.load(self._matrix_path(key))
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._loaded[key] = (meta, matrix)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return meta, matrix
+
+    async def status(self, checkout: dict) -> str:
+        """"building", "ready" (built at the checkout's commit) or "missing"."""
+        if checkout["key"] in self._builds:
+            return "building"
+        loaded = await asyncio.to_thread(self._load, checkout["key"])
+        if loaded is not None and loaded[0]["commit"] == checkout["commit"]:
+            return "ready"
+        return "missing"
+
+    async def schedule(self, checkout: dict, blobs: Dict[str, str]) -> Optional[asyncio.Task]:
+        """Starts building the index of `checkout` in the background unless it is current or already building."""
+        key = checkout["key"]
+        if key in self._builds:
+            return self._builds[key]
+        if await self.status(checkout) == "ready" or key in self._builds:
+            return self._builds.get(key)
+        task = asyncio.ensure_future(self.build(checkout, blobs))
+        self._builds[key] = task
+        task.add_done_callback(lambda t: self._finished(key, t))
+        return task
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._builds.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Building the search index of %s failed: %r", key, task.exception())
+
+    async def build(self, checkout: dict, blobs: Dict[str, str]):
+        key = checkout["key"]
+        previous = await asyncio.to_thread(self._load, key)
+        indexable = {path: blob for path, blob in blobs.items() if os.path.splitext(path)[1].lower() in SOURCE_EXTENSIONS}
+
+        keep_rows: List[int] = []
+        chunks: List[List] = []
+        if previous is not None:
+            meta, _ = previous
+            unchanged = {path for path, blob in meta["files"].items() if indexable.get(path) == blob}
+            for row, chunk in enumerate(meta["chunks"]):
+                if chunk[0] in unchanged:
+                    keep_rows.append(row)
+                    chunks.append(chunk)
+        else:
+            unchanged = set()
+
+        changed = sorted(path for path in indexable if path not in unchanged)
+        new_chunks, texts = await asyncio.to_thread(self._collect, checkout["url"], key, changed)
+        logger.info("Indexing %s: %d chunks reused, %d chunks from %d files to embed",
+                    key, len(keep_rows), len(new_chunks), len(changed))
+
+        parts = []
+        if keep_rows:
+            parts.append(previous[1][keep_rows])
+        if texts:
+            parts.append(normalize_rows(await self.embedder.embed(texts)))
+        matrix = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+        meta = {
+            "version": INDEX_VERSION,
+            "commit": checkout["commit"],
+            "embedder": self.embedder.name,
+            "files": indexable,
+            "chunks": chunks + new_chunks,
+        }
+        await asyncio.to_thread(self._save, key, meta, matrix)
+
+    def _collect(self, url: str, key: str, paths: List[str]) -> Tuple[List[List], List[str]]:
+        with self.repo_store.lease(url) as checkout:
+            if checkout["key"] != key:
+                raise RuntimeError(f"{url} was refreshed while {key} was being indexed")
+            return collect_chunks(checkout["path"], paths)
+
+    def _save(self, key: str, meta: dict, matrix: np.ndarray):
+        path = self._matrix_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix="embeddings.", suffix=".tmp")
+        try:
+            with open(fd, "wb") as f:
+                np.save(f, matrix)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.repo_store.save_artifact(key, "search", meta)
+        with self._lock:
+            self._loaded.pop(key, None)
+
+    async def search(self, checkout: dict, query: str, k: int) -> List[dict]:
+        """Returns the `k` chunks most similar to `query` as [{path, lineStart, lineEnd, score}]."""
+        loaded = await asyncio.to_thread(self._load, checkout["key"])
+        if loaded is None or loaded[0]["commit"] != checkout["commit"] or not loaded[0]["chunks"]:
+            return []
+        meta, matrix = loaded
+        query_vector = normalize_rows(await self.embedder.embed([query]))[0]
+        scores = matrix @ query_vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"path": meta["chunks"][row][0], "lineStart": meta["chunks"][row][1], "lineEnd": meta["chunks"][row][2], "score": float(scores[row])}
+            for row in top
+        ]
+
+    async def aclose(self):
+        for task in list(self._builds.values()):
+            task.cancel()
@@ -1,11 +1,37 @@
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Callable, Optional
+
 import uvicorn
 import httpx
+from dotenv import load_dotenv
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from contextlib import asynccontextmanager
 
-# The Ollama server address
-OLLAMA_BASE_URL = "http://localhost:11434"
+from log_config import configure_logging
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS_REGISTRY, Counter, Gauge, Histogram, MetricsMiddleware, monitor_event_loop_lag
+from ollama_pool import NoHealthyHost, OllamaHost, OllamaPool
+from proxy_telemetry import GenerationTelemetry, JsonMessage
+from stream_coalescer import SharedStream, StreamCoalescer, is_deterministic, request_key
+
+load_dotenv()
+log_listener = configure_logging()
+logger = logging.getLogger(__name__)
+# One JSON object per proxied request; set LOG_FORMAT=%(message)s for plain JSON lines
+access_logger = logging.getLogger(f"{__name__}.access")
+
+# The Ollama servers to spread requests over, comma-separated
+OLLAMA_HOSTS = [url.strip() for url in os.getenv("OLLAMA_HOSTS", os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")).split(",") if url.strip()]
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "5"))
+OLLAMA_EJECT_AFTER = int(os.getenv("OLLAMA_EJECT_AFTER", "2"))
+# How many extra requests in flight a host with the model loaded may have before a cold host is preferred
+OLLAMA_LOAD_PENALTY = float(os.getenv("OLLAMA_LOAD_PENALTY", "2"))
+# Identical deterministic generations in flight share one upstream stream; sampled ones only if this is set
+COALESCE_SAMPLED = os.getenv("COALESCE_SAMPLED", "0").lower() in ("1", "true", "yes")
 
 # A dictionary to hold our application's state, including the HTTP client
 app_state = {}
@@ -15,41 +41,254 @@ async def lifespan(app: FastAPI):
     """
     This function runs on application startup and shutdown.
     It creates a single, persistent httpx client that lives
-    as long as the application is running.
+    as long as the application is running, and starts the
+    health checks of the Ollama hosts.
     """
     # On startup, create the client and store it in the app_state
     app_state["client"] = httpx.AsyncClient(timeout=None)
+    app_state["pool"] = OllamaPool(
+        OLLAMA_HOSTS,
+        health_interval=OLLAMA_HEALTH_INTERVAL,
+        eject_after=OLLAMA_EJECT_AFTER,
+        load_penalty=OLLAMA_LOAD_PENALTY,
+    )
+    await app_state["pool"].start(app_state["client"])
+    app_state["coalescer"] = StreamCoalescer()
+    event_loop_monitor = asyncio.ensure_future(monitor_event_loop_lag())
     yield
-    # On shutdown, close the client
+    # On shutdown, stop the health checks and close the client
+    event_loop_monitor.cancel()
+    await app_state["pool"].aclose()
     await app_state["client"].aclose()
 
 # Pass the lifespan manager to the FastAPI app
 app = FastAPI(lifespan=lifespan)
 
+# --- Metrics ---
+# Generation timings and Ollama's counters are defined in proxy_telemetry.
+PROXY_REQUEST_DURATION = Histogram("proxy_request_duration_seconds", "Latency of proxied requests, to the last body chunk.", ["method", "route", "status"])
+app.add_middleware(MetricsMiddleware, histogram=PROXY_REQUEST_DURATION)
+OLLAMA_HOST_IN_FLIGHT = Gauge("ollama_host_in_flight", "Requests the proxy has in flight on each Ollama host.", ["host"])
+OLLAMA_HOST_IN_FLIGHT.set_function(lambda: {(host.url,): host.in_flight for host in app_state["pool"].hosts} if "pool" in app_state else {})
+OLLAMA_HOST_HEALTHY = Gauge("ollama_host_healthy", "1 if the Ollama host is in the pool, 0 if it is ejected.", ["host"])
+OLLAMA_HOST_HEALTHY.set_function(lambda: {(host.url,): int(host.healthy) for host in app_state["pool"].hosts} if "pool" in app_state else {})
+PROXY_COALESCED = Counter("proxy_generations_total", "Generations started upstream, and requests that joined one in flight.", ["role"])
+PROXY_COALESCED.set_function(lambda: {("started",): app_state["coalescer"].started, ("joined",): app_state["coalescer"].joined} if "coalescer" in app_state else {})
+
+async def open_upstream(path: str, data: dict):
+    """
+    Sends `data` to the best Ollama host for its model and returns
+    (host, response) with the response body not read yet. Hosts that
+    cannot be connected to are reported to the pool and the next one is
+    tried. The caller must close the response and release the host.
+    """
+    pool: OllamaPool = app_state["pool"]
+    client: httpx.AsyncClient = app_state["client"]
+    model = data.get("model")
+    tried = []
+    while True:
+        host = pool.pick(model, exclude=tried)
+        pool.acquire(host)
+        try:
+            response = await client.send(client.build_request("POST", f"{host.url}{path}", json=data), stream=True)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            # Nothing reached Ollama, so the request is safe to send elsewhere.
+            pool.release(host)
+            pool.report_failure(host, e)
+            tried.append(host)
+            logger.warning("Could not connect to Ollama host %s: %s", host.url, e)
+            continue
+        except BaseException:
+            pool.release(host)
+            raise
+        pool.report_success(host)
+        if model and response.status_code < 400:
+            pool.mark_loaded(host, model)
+        return host, response
+
+def release_upstream(host: OllamaHost, error: Exception = None):
+    if error is not None:
+        app_state["pool"].report_failure(host, error)
+    app_state["pool"].release(host)
+
+def no_host_response(e: NoHealthyHost, access: dict) -> JSONResponse:
+    logger.error("Error in simple_mcp_server: %s", e)
+    log_access({**access, "status": 503, "durationMs": elapsed_ms(access["started"])})
+    return JSONResponse({"error": "Failed to connect to Ollama"}, status_code=503)
+
+def elapsed_ms(started: float, until: Optional[float] = None) -> float:
+    return round(((until or time.perf_counter()) - started) * 1000, 1)
+
+def access_fields(path: str, data: dict, started: float) -> dict:
+    return {"path": path, "model": data.get("model"), "started": started}
+
+def log_access(fields: dict):
+    fields.pop("started", None)
+    access_logger.info("%s", JsonMessage(fields))
+
+async def logged_stream(body: AsyncIterator[bytes], access: dict, summary: Callable[[], Optional[dict]]) -> AsyncIterator[bytes]:
+    """
+    Passes `body` through unchanged, then writes the access log line with
+    what this client received and the generation's telemetry.
+    """
+    first_byte_at = None
+    sent = 0
+    completed = False
+    try:
+        async for chunk in body:
+            if first_byte_at is None:
+                first_byte_at = time.perf_counter()
+            sent += len(chunk)
+            yield chunk
+        completed = True
+    finally:
+        # Close the upstream side now, not when the abandoned generator is collected.
+        await body.aclose()
+        access.update(
+            durationMs=elapsed_ms(access["started"]),
+            ttfbMs=elapsed_ms(access["started"], first_byte_at) if first_byte_at else None,
+            bytes=sent,
+            completed=completed,
+        )
+        access.update(summary() or {})
+        log_access(access)
+
+def should_coalesce(data: dict, header: str = None) -> bool:
+    """
+    Deterministic requests are shared unless the client sends
+    `X-Coalesce: never`; sampled ones only with `X-Coalesce: always`
+    (or COALESCE_SAMPLED), since each copy would otherwise get its own sample.
+    """
+    header = (header or "").strip().lower()
+    if header == "never":
+        return False
+    return header == "always" or COALESCE_SAMPLED or is_deterministic(data)
+
+async def produce_generation(data: dict, stream: SharedStream, started: float):
+    host, upstream = await open_upstream("/api/generate", data)
+    telemetry = stream.telemetry = GenerationTelemetry(data.get("model"), host.url, started)
+    error = None
+    try:
+        stream.start(upstream.status_code, upstream.headers.get("content-type"))
+        async for chunk in upstream.aiter_bytes():
+            stream.publish(chunk)
+            telemetry.feed(chunk, time.perf_counter())
+    except httpx.TransportError as e:
+        error = e
+        raise
+    finally:
+        await upstream.aclose()
+        release_upstream(host, error)
+        telemetry.finish()
+
+async def coalesced_generate(data: dict, access: dict):
+    coalescer: StreamCoalescer = app_state["coalescer"]
+    joined_before = coalescer.joined
+    subscription = coalescer.join(request_key("/api/generate", data), lambda stream: produce_generation(data, stream, access["started"]))
+    access["coalesced"] = "joined" if coalescer.joined > joined_before else "started"
+    try:
+        status_code, media_type = await subscription.started()
+    except NoHealthyHost as e:
+        subscription.leave()
+        return no_host_response(e, access)
+    except BaseException:
+        subscription.leave()
+        raise
+    access["status"] = status_code
+    stream = subscription.stream
+    body = logged_stream(subscription.subscribe(), access, lambda: stream.telemetry.summary if stream.telemetry else None)
+    # The background task also runs when the client left before the body was ever iterated.
+    return StreamingResponse(body, status_code=status_code, media_type=media_type, background=BackgroundTask(subscription.leave))
+
 @app.post("/api/generate")
 async def generate(request: Request):
     """
-    Receives a request, forwards it to Ollama using the persistent
-    client, and streams the response back.
+    Receives a request, forwards it to the least busy Ollama host
+    using the persistent client, and streams the response back.
+    Identical requests already in flight share that stream (see should_coalesce).
+    """
+    started = time.perf_counter()
+    data = await request.json()
+    access = access_fields("/api/generate", data, started)
+    access["stream"] = data.get("stream", True)
+    if should_coalesce(data, request.headers.get("x-coalesce")):
+        return await coalesced_generate(data, access)
+    try:
+        host, upstream = await open_upstream("/api/generate", data)
+    except NoHealthyHost as e:
+        return no_host_response(e, access)
+    telemetry = GenerationTelemetry(data.get("model"), host.url, started)
+
+    async def stream_generator():
+        error = None
+        try:
+            async for chunk in upstream.aiter_bytes():
+                received_at = time.perf_counter()
+                yield chunk
+                # Looked at only once the chunk is on its way to the client.
+                telemetry.feed(chunk, received_at)
+        except httpx.TransportError as e:
+            error = e
+            raise
+        finally:
+            await upstream.aclose()
+            release_upstream(host, error)
+            telemetry.finish()
+
+    access["status"] = upstream.status_code
+    body = logged_stream(stream_generator(), access, lambda: telemetry.summary)
+    return StreamingResponse(body, status_code=upstream.status_code, media_type=upstream.headers.get("content-type"))
+
+@app.post("/api/embed")
+async def embed(request: Request):
+    """
+    Forwards an embedding request to an Ollama host and returns its JSON response.
     """
+    started = time.perf_counter()
+    data = await request.json()
+    access = access_fields("/api/embed", data, started)
+    try:
+        host, upstream = await open_upstream("/api/embed", data)
+    except NoHealthyHost as e:
+        return no_host_response(e, access)
+    error = None
+    content = b""
     try:
-        data = await request.json()
-        ollama_url = f"{OLLAMA_BASE_URL}/api/generate"
-        
-        # Get the persistent client from our app_state
-        client = app_state["client"]
-        
-        async def stream_generator():
-            async with client.stream("POST", ollama_url, json=data) as response:
-                async for chunk in response.aiter_bytes():
-                    yield chunk
-
-        return StreamingResponse(stream_generator())
-
-    except Exception as e:
-        print(f"Error in simple_mcp_server: {e}")
-        return {"error": "Failed to connect to Ollama"}, 500
+        content = await upstream.aread()
+    except httpx.TransportError as e:
+        error = e
+        raise
+    finally:
+        await upstream.aclose()
+        release_upstream(host, error)
+        access.update(status=upstream.status_code, host=host.url, durationMs=elapsed_ms(started), bytes=len(content))
+        log_access(access)
+    return Response(content=content, status_code=upstream.status_code, media_type="application/json")
+
+@app.get("/hosts")
+async def hosts():
+    """
+    Lists the Ollama hosts with their health, requests in flight (the
+    queue depth this proxy adds to each host) and loaded models.
+    """
+    return app_state["pool"].stats()
+
+@app.get("/coalescing")
+async def coalescing():
+    """
+    Counts generations started upstream and requests that joined one
+    already in flight instead.
+    """
+    return app_state["coalescer"].stats()
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: time-to-first-token, inter-token gaps, tokens/s,
+    queue wait and load time per model and host, and the pool's state.
+    """
+    return Response(content=METRICS_REGISTRY.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
 
 if __name__ == "__main__":
-    print("Starting Simple MCP Server on http://localhost:8080")
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
+    print(f"Starting Simple MCP Server on http://localhost:8080 for {', '.join(OLLAMA_HOSTS)}")
+    uvicorn.run(app, host="0.0.0.0", port=8080)
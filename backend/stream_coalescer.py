@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(path: str, data: dict) -> str:
+    """Identifies a request by its path and canonical JSON body."""
+    body = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(f"{path}\n{body}".encode("utf-8")).hexdigest()
+
+
+def is_deterministic(data: dict) -> bool:
+    """
+    True if Ollama would give the same answer to every copy of the request:
+    greedy decoding (temperature 0) or a fixed seed. Ollama samples at a
+    non-zero temperature when none is given.
+    """
+    options = data.get("options") or {}
+    if options.get("seed") is not None:
+        return True
+    temperature = options.get("temperature")
+    try:
+        return temperature is not None and float(temperature) == 0
+    except (TypeError, ValueError):
+        return False
+
+
+class SharedStream:
+    """
+    One upstream response, read once and replayed to every subscriber.
+
+    Every chunk is kept until the response ends, so a subscriber that joins
+    late first receives what it missed and then follows live.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        # Set by the producer: whatever describes the upstream response (e.g. its telemetry).
+        self.telemetry = None
+        self._started: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._changed = asyncio.Event()
+        self._pump: Optional[asyncio.Task] = None
+
+    def start(self, status_code: int, media_type: Optional[str]):
+        if not self._started.done():
+            self._started.set_result((status_code, media_type))
+
+    def publish(self, chunk: bytes):
+        self.chunks.append(chunk)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        if not self._started.done():
+            if error is not None:
+                self._started.set_exception(error)
+            else:
+                self._started.set_result((502, None))
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def started(self) -> Tuple[int, Optional[str]]:
+        """Waits for the upstream status code and media type; raises if the upstream could not be reached."""
+        return await asyncio.shield(self._started)
+
+    async def follow(self) -> AsyncIterator[bytes]:
+        """Yields every chunk from the first one on, then raises the upstream error if there was one."""
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+    def leave(self):
+        self.subscribers -= 1
+        if self.subscribers <= 0 and not self.done and self._pump is not None:
+            # Nobody is listening any more; stop generating.
+            self._pump.cancel()
+
+
+class Subscription:
+    """
+    One caller's place on a SharedStream, as returned by `StreamCoalescer.join`.
+
+    `leave()` may be called any number of times. Closing the body leaves, but
+    a body that is never iterated (the client went away before the response
+    started) never runs its cleanup, so callers also leave once the response
+    is over.
+    """
+
+    def __init__(self, stream: SharedStream):
+        self.stream = stream
+        self.left = False
+
+    async def started(self) -> Tuple[int, Optional[str]]:
+        return await self.stream.started()
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        """Yields every chunk of the shared stream; ends the subscription when closed."""
+        try:
+            async for chunk in self.stream.follow():
+                yield chunk
+        finally:
+            self.leave()
+
+    def leave(self):
+        if not self.left:
+            self.left = True
+            self.stream.leave()
+
+
+class StreamCoalescer:
+    """
+    Shares upstream responses between identical requests that are in flight
+    at the same time.
+
+    The first request for a key starts the upstream call in a task of its
+    own, so it keeps running if that first client disconnects; it is
+    cancelled only when every subscriber has gone. Finished responses are
+    not kept: only requests that overlap share a response.
+    """
+
+    def __init__(self):
+        self._streams: Dict[str, SharedStream] = {}
+        self.started = 0
+        self.joined = 0
+
+    def join(self, key: str, produce: Callable[[SharedStream], Awaitable[None]]) -> Subscription:
+        """
+        Subscribes to the in-flight stream for `key`, or starts one with
+        `produce(stream)`, which must call `stream.start(...)` and then
+        `stream.publish(chunk)` for each chunk of the upstream response.
+        """
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = SharedStream(key)
+            self._streams[key] = stream
+            stream._pump = asyncio.ensure_future(self._run(stream, produce))
+            self.started += 1
+        else:
+            self.joined += 1
+            logger.debug("Joining in-flight request %s (%d chunks buffered)", key[:12], len(stream.chunks))
+        stream.subscribers += 1
+        return Subscription(stream)
+
+    async def _run(self, stream: SharedStream, produce: Callable[[SharedStream], Awaitable[None]]):
+        try:
+            await produce(stream)
+        except BaseException as e:
+            stream.finish(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            stream.finish()
+        finally:
+            if self._streams.get(stream.key) is stream:
+                del self._streams[stream.key]
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": len(self._streams),
+            "subscribers": sum(stream.subscribers for stream in self._streams.values()),
+            "started": self.started,
+            "joined": self.joined,
+        }
@@ -0,0 +1,429 @@
+import ast
+import asyncio
+import heapq
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
+
+from prompt_context import STOPWORDS, split_words
+from repo_store import RepoStore
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+MAX_FILE_BYTES = 512 * 1024
+MAX_DEPENDENCIES = 20
+BATCH_SIZE = 200
+
+# Extension -> language family used to pick the extractor.
+LANGUAGES = {
+    ".py": "python",
+    ".js": "js", ".jsx": "js", ".mjs": "js", ".cjs": "js", ".ts": "js", ".tsx": "js",
+    ".java": "java", ".kt": "java", ".scala": "java", ".cs": "java",
+    ".go": "go",
+    ".rs": "rust",
+    ".c": "c", ".h": "c", ".cc": "c", ".cpp": "c", ".hpp": "c",
+    ".rb": "ruby",
+    ".php": "php",
+}
+
+# (pattern, symbol type) per language family. The symbol name is the first group, or the
+# `name` group next to an `owner` group (e.g. a Go method's receiver type) that qualifies it.
+DECLARATIONS = {
+    "js": [
+        (re.compile(r"^\s*(?:export\s+(?:default\s+)?)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)"), "class"),
+        (re.compile(r"^\s*(?:export\s+(?:default\s+)?)?(?:interface|enum|type)\s+([A-Za-z_$][\w$]*)"), "class"),
+        (re.compile(r"^\s*(?:export\s+(?:default\s+)?)?(?:async\s+)?function\*?\s+([A-Za-z_$][\w$]*)"), "function"),
+        (re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*(?:async\s+)?(?:\([^)]*\)|[A-Za-z_$][\w$]*)\s*(?::[^=]+)?=>"), "function"),
+        (re.compile(r"^\s+(?:(?:public|private|protected|static|async|readonly|get|set)\s+)*(?!if\b|for\b|while\b|switch\b|catch\b|return\b)([A-Za-z_$][\w$]*)\s*\([^)]*\)\s*(?::[^{]+)?\{\s*$"), "function"),
+    ],
+    "java": [
+        (re.compile(r"^\s*(?:(?:public|private|protected|internal|static|abstract|final|sealed|data|open)\s+)*(?:class|interface|enum|record|object)\s+(\w+)"), "class"),
+        (re.compile(r"^\s+(?:(?:public|private|protected|internal|static|final|abstract|synchronized|override|suspend)\s+)+(?:fun\s+)?(?:<[^>]+>\s+)?(?:[\w<>\[\],.?]+\s+)?(\w+)\s*\("), "function"),
+    ],
+    "go": [
+        (re.compile(r"^type\s+(\w+)\s+(?:struct|interface)"), "class"),
+        (re.compile(r"^func\s+(?:\(\s*(?:\w+\s+)?\*?(?P<owner>\w+)[^)]*\)\s*)?(?P<name>\w+)\s*[\[(]"), "function"),
+    ],
+    "rust": [
+        (re.compile(r"^\s*(?:pub(?:\([\w:]+\))?\s+)?(?:struct|enum|trait|union)\s+(\w+)"), "class"),
+        (re.compile(r"^\s*impl(?:<[^>]*>)?\s+(?:[\w:<>]+\s+for\s+)?([\w:]+)"), "class"),
+        (re.compile(r"^\s*(?:pub(?:\([\w:]+\))?\s+)?(?:const\s+)?(?:async\s+)?(?:unsafe\s+)?(?:extern\s+\"\w+\"\s+)?fn\s+(\w+)"), "function"),
+    ],
+    "c": [
+        (re.compile(r"^\s*(?:typedef\s+)?(?:struct|class|union|enum)\s+(\w+)\s*(?::[^{]*)?\{?\s*$"), "class"),
+        (re.compile(r"^(?!\s)(?:[\w\*&<>:,]+\s+)+\**(\w+)\s*\([^;]*$"), "function"),
+    ],
+    "ruby": [
+        (re.compile(r"^\s*(?:class|module)\s+([A-Z][\w:]*)"), "class"),
+        (re.compile(r"^\s*def\s+(?:self\.)?([\w?!=]+)"), "function"),
+    ],
+    "php": [
+        (re.compile(r"^\s*(?:(?:abstract|final)\s+)?(?:class|interface|trait|enum)\s+(\w+)"), "class"),
+        (re.compile(r"^\s*(?:(?:public|private|protected|static|abstract|final)\s+)*function\s+&?(\w+)"), "function"),
+    ],
+}
+
+IMPORTS = {
+    "js": re.compile(r"""(?:^\s*import\s[^'"]*?from\s+|^\s*import\s+|require\()\s*['"]([^'"]+)['"]"""),
+    "java": re.compile(r"^\s*(?:import|using)\s+(?:static\s+)?([\w.]+)"),
+    "go": re.compile(r"""^\s*(?:import\s+)?(?:\w+\s+)?"([\w./-]+)"\s*$"""),
+    "rust": re.compile(r"^\s*(?:pub\s+)?use\s+([\w:]+)"),
+    "c": re.compile(r"""^\s*#\s*include\s+[<"]([^>"]+)[>"]"""),
+    "ruby": re.compile(r"""^\s*require(?:_relative)?\s+['"]([^'"]+)['"]"""),
+    "php": re.compile(r"^\s*(?:use|require_once|include_once)\s+['\"]?([\w\\/.]+)"),
+}
+
+COMMENT_PREFIXES = ("///", "//", "#", "/**", "/*", "*", "--")
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def make_symbol(kind: str, name: str, path: str, line_start: int, line_end: int, description: str = "", dependencies: Optional[List[str]] = None) -> dict:
+    """A symbol in the shape of the shared `CodeStructure` type."""
+    return {
+        "type": kind,
+        "name": name,
+        "description": description,
+        "dependencies": (dependencies or [])[:MAX_DEPENDENCIES],
+        "position": {"file": path, "lineStart": line_start, "lineEnd": line_end},
+    }
+
+
+def _first_line(text: Optional[str]) -> str:
+    return text.strip().splitlines()[0].strip() if text and text.strip() else ""
+
+
+def _called_names(node: ast.AST) -> List[str]:
+    names = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Call):
+            func = child.func
+            if isinstance(func, ast.Name):
+                names.add(func.id)
+            elif isinstance(func, ast.Attribute):
+                names.add(func.attr)
+    return sorted(names)
+
+
+def python_symbols(path: str, text: str) -> List[dict]:
+    tree = ast.parse(text)
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            imports.add("." * node.level + node.module)
+    module_name = os.path.splitext(path)[0].replace("/", ".")
+    symbols = [make_symbol("module", module_name, path, 1, max(1, len(text.splitlines())), _first_line(ast.get_docstring(tree)), sorted(imports))]
+
+    def visit(body, prefix: str):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+                name = prefix + node.name
+                if isinstance(node, ast.ClassDef):
+                    bases = [ast.unparse(base) for base in node.bases]
+                    symbols.append(make_symbol("class", name, path, start, node.end_lineno, _first_line(ast.get_docstring(node)), bases))
+                    visit(node.body, name + ".")
+                else:
+                    symbols.append(make_symbol("function", name, path, start, node.end_lineno, _first_line(ast.get_docstring(node)), _called_names(node)))
+
+    visit(tree.body, "")
+    return symbols
+
+
+def _block_end(lines: List[str], start: int, language: str) -> int:
+    """Last line (1-based) of the block declared on line `start`, by brace depth or, for Ruby, the matching `end`."""
+    if language == "ruby":
+        indent = len(lines[start - 1]) - len(lines[start - 1].lstrip())
+        for number in range(start + 1, len(lines) + 1):
+            line = lines[number - 1]
+            if line.strip() == "end" and len(line) - len(line.lstrip()) == indent:
+                return number
+        return start
+    depth = 0
+    opened = False
+    for number in range(start, len(lines) + 1):
+        line = re.sub(r"""(["'`])(?:\\.|(?!\1).)*\1|//.*$""", "", lines[number - 1])
+        if not opened and number > start + 2 and "{" not in line:
+            return start
+        for char in line:
+            if char == "{":
+                depth += 1
+                opened = True
+            elif char == "}":
+                depth -= 1
+        if opened and depth <= 0:
+            return number
+        if not opened and line.rstrip().endswith(";"):
+            return number
+    return len(lines) if opened else start
+
+
+def _leading_comment(lines: List[str], start: int) -> str:
+    """First line of the comment block directly above line `start`."""
+    number = start - 1
+    comment = []
+    while number >= 1:
+        stripped = lines[number - 1].strip()
+        if not stripped.startswith(COMMENT_PREFIXES) and not stripped.endswith("*/"):
+            break
+        comment.append(stripped)
+        number -= 1
+    for line in reversed(comment):
+        text = line.lstrip("/*#-! ").rstrip("*/ ").strip()
+        if text and not text.startswith("@"):
+            return text
+    return ""
+
+
+def pattern_symbols(path: str, text: str, language: str) -> List[dict]:
+    lines = text.splitlines()
+    import_pattern = IMPORTS.get(language)
+    imports = sorted({match.group(1) for line in lines for match in [import_pattern.match(line)] if match}) if import_pattern else []
+    symbols = [make_symbol("file", path, path, 1, max(1, len(lines)), "", imports)]
+    # Innermost enclosing classes, for qualified method names.
+    enclosing: List[Tuple[str, int]] = []
+    for number, line in enumerate(lines, 1):
+        for pattern, kind in DECLARATIONS[language]:
+            match = pattern.match(line)
+            if not match:
+                continue
+            end = _block_end(lines, number, language)
+            while enclosing and enclosing[-1][1] < number:
+                enclosing.pop()
+            groups = match.groupdict()
+            name = groups.get("name") or match.group(1)
+            if groups.get("owner"):
+                name = f"{groups['owner']}.{name}"
+            elif kind == "function" and enclosing:
+                name = f"{enclosing[-1][0]}.{name}"
+            symbols.append(make_symbol(kind, name, path, number, end, _leading_comment(lines, number)))
+            if kind == "class" and end > number:
+                enclosing.append((name, end))
+            break
+    return symbols
+
+
+def extract_symbols(path: str, text: str) -> List[dict]:
+    language = LANGUAGES.get(os.path.splitext(path)[1].lower())
+    if language == "python":
+        try:
+            return python_symbols(path, text)
+        except (SyntaxError, ValueError, RecursionError):
+            return []
+    if language is None:
+        return []
+    return pattern_symbols(path, text, language)
+
+
+def read_sources(repo_path: str, paths: List[str]) -> Dict[str, Optional[str]]:
+    """Reads the text of several files of a checkout; None for files that are unreadable, too large or binary."""
+    sources: Dict[str, Optional[str]] = {}
+    for path in paths:
+        try:
+            full_path = os.path.join(repo_path, path)
+            if os.path.getsize(full_path) > MAX_FILE_BYTES:
+                sources[path] = None
+                continue
+            with open(full_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            sources[path] = None
+            continue
+        sources[path] = None if b"\0" in data[:8000] else data.decode("utf-8", errors="ignore")
+    return sources
+
+
+def extract_symbols_batch(sources: Dict[str, Optional[str]]) -> Dict[str, List[dict]]:
+    """Extracts the symbols of several files read by read_sources; runs in worker processes."""
+    return {path: [] if text is None else extract_symbols(path, text) for path, text in sources.items()}
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def rank_symbols(named: List[Tuple[frozenset, dict]], text: str, limit: int) -> List[dict]:
+    """
+    The symbols whose name words overlap most with the words of `text`; ties go
+    to the shorter definition, then the name. Blocking.
+    """
+    terms = {term for term in split_words(text) if len(term) > 2 and term not in STOPWORDS}
+    if not terms:
+        return []
+    scored = []
+    for words, symbol in named:
+        overlap = len(terms.intersection(words))
+        if overlap:
+            scored.append((-overlap, symbol["position"]["lineEnd"] - symbol["position"]["lineStart"], symbol["name"], symbol))
+    return [item[3] for item in heapq.nsmallest(limit, scored, key=lambda item: item[:3])]
+
+
+# (index, name -> [symbol, ...], [(name words, symbol), ...])
+LoadedIndex = Tuple[dict, Dict[str, List[dict]], List[Tuple[frozenset, dict]]]
+
+
+class SymbolIndex:
+    """
+    Per-commit index of the functions, classes and modules of stored checkouts.
+
+    Files are parsed in a process pool: Python with `ast`, other languages
+    with declaration patterns and brace (or `end`) matching. The result is
+    saved as the `symbols` artifact of a checkout together with the blob id
+    of every parsed file, so a rebuild after a refresh only re-parses files
+    whose content changed.
+    """
+
+    def __init__(self, repo_store: RepoStore, workers: int = 1, max_loaded: int = 8):
+        self.repo_store = repo_store
+        self.workers = workers
+        self.max_loaded = max_loaded
+        self._builds: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        # key -> (index, name -> [symbol, ...], [(name words, symbol), ...] of functions and classes)
+        self._loaded: "OrderedDict[str, LoadedIndex]" = OrderedDict()
+
+    def _load(self, key: str) -> Optional[LoadedIndex]:
+        """
+        Returns the stored index of checkout `key` (whatever commit it was built at),
+        its name lookup and the words of every function and class name. Blocking.
+        """
+        with self._lock:
+            loaded = self._loaded.get(key)
+            if loaded is not None:
+                self._loaded.move_to_end(key)
+                return loaded
+        index = self.repo_store.load_artifact(key, "symbols")
+        if index is None or index.get("version") != INDEX_VERSION:
+            return None
+        by_name: Dict[str, List[dict]] = {}
+        named: List[Tuple[frozenset, dict]] = []
+        for symbols in index["symbols"].values():
+            for symbol in symbols:
+                by_name.setdefault(symbol["name"], []).append(symbol)
+                short_name = symbol["name"].rsplit(".", 1)[-1]
+                if short_name != symbol["name"]:
+                    by_name.setdefault(short_name, []).append(symbol)
+                if symbol["type"] in ("function", "class"):
+                    named.append((frozenset(split_words(symbol["name"])), symbol))
+        loaded = (index, by_name, named)
+        with self._lock:
+            self._loaded[key] = loaded
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return loaded
+
+    async def current(self, checkout: dict) -> Optional[LoadedIndex]:
+        """The index of `checkout` if it has been built at its commit, else None."""
+        loaded = await asyncio.to_thread(self._load, checkout["key"])
+        if loaded is None or loaded[0]["commit"] != checkout["commit"]:
+            return None
+        return loaded
+
+    async def status(self, checkout: dict) -> str:
+        if checkout["key"] in self._builds:
+            return "building"
+        return "ready" if await self.current(checkout) is not None else "missing"
+
+    async def schedule(self, checkout: dict, blobs: Dict[str, str]) -> Optional[asyncio.Task]:
+        """Starts building the index of `checkout` in the background unless it is current or already building."""
+        key = checkout["key"]
+        if key in self._builds:
+            return self._builds[key]
+        if await self.status(checkout) == "ready" or key in self._builds:
+            return self._builds.get(key)
+        task = asyncio.ensure_future(asyncio.to_thread(self._build, checkout, blobs))
+        self._builds[key] = task
+        task.add_done_callback(lambda t: self._finished(key, t))
+        return task
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._builds.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Building the symbol index of %s failed: %r", key, task.exception())
+
+    def _build(self, checkout: dict, blobs: Dict[str, str]):
+        key = checkout["key"]
+        previous = self._load(key)
+        parsable = {path: blob for path, blob in blobs.items() if os.path.splitext(path)[1].lower() in LANGUAGES}
+        symbols: Dict[str, List[dict]] = {}
+        if previous is not None:
+            old_index = previous[0]
+            for path, blob in old_index["files"].items():
+                if parsable.get(path) == blob:
+                    symbols[path] = old_index["symbols"].get(path, [])
+        changed = sorted(path for path in parsable if path not in symbols)
+        logger.info("Indexing symbols of %s: %d files reused, %d to parse", key, len(symbols), len(changed))
+
+        batches = [changed[offset:offset + BATCH_SIZE] for offset in range(0, len(changed), BATCH_SIZE)]
+        executor = _get_executor(self.workers) if self.workers > 1 and len(batches) > 1 else None
+        pending: Deque[Future] = deque()
+        for batch in batches:
+            sources = self._read(checkout, batch)
+            if executor is None:
+                symbols.update(extract_symbols_batch(sources))
+                continue
+            pending.append(executor.submit(extract_symbols_batch, sources))
+            # Bound how many batches of file contents are held in memory at once.
+            if len(pending) > 2 * self.workers:
+                symbols.update(pending.popleft().result())
+        for future in pending:
+            symbols.update(future.result())
+
+        index = {"version": INDEX_VERSION, "commit": checkout["commit"], "files": parsable, "symbols": symbols}
+        self.repo_store.save_artifact(key, "symbols", index)
+        with self._lock:
+            self._loaded.pop(key, None)
+
+    def _read(self, checkout: dict, paths: List[str]) -> Dict[str, Optional[str]]:
+        """Reads `paths` of `checkout`, leasing it only for the reads; parsing happens after the lease is released."""
+        with self.repo_store.lease(checkout["url"]) as leased:
+            if leased["key"] != checkout["key"]:
+                raise RuntimeError(f"{checkout['url']} was refreshed while {checkout['key']} was being indexed")
+            return read_sources(leased["path"], paths)
+
+    async def file_symbols(self, checkout: dict, path: str) -> Optional[List[dict]]:
+        """Symbols of one file, or None if the index is not built yet."""
+        loaded = await self.current(checkout)
+        if loaded is None:
+            return None
+        return loaded[0]["symbols"].get(path, [])
+
+    async def find(self, checkout: dict, name: str) -> Optional[List[dict]]:
+        """
+        Definitions named `name`, either fully qualified ("Class.method") or
+        by their last component; None if the index is not built yet.
+        """
+        loaded = await self.current(checkout)
+        if loaded is None:
+            return None
+        return list(loaded[1].get(name, []))
+
+    async def relevant(self, checkout: dict, text: str, limit: int = 5) -> List[dict]:
+        """Functions and classes whose names share the most words with `text`, best first."""
+        loaded = await self.current(checkout)
+        if loaded is None:
+            return []
+        return await asyncio.to_thread(rank_symbols, loaded[2], text, limit)
+
+    async def aclose(self):
+        for task in list(self._builds.values()):
+            task.cancel()
+        shutdown_executor()
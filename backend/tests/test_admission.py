@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx", reason="admission imports the LLM gateway, which needs httpx")
+
+from admission import AdmissionController, AdmissionRejected  # noqa: E402
+
+
+async def hold(controller, client, order, release):
+    async with controller.slot(client):
+        order.append(client)
+        await release.wait()
+
+
+def test_freed_slots_go_round_robin_between_clients():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=10, max_queue_per_client=5)
+        order = []
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(hold(controller, "holder", order, asyncio.Event()))
+        await asyncio.sleep(0)
+        # Alice queues a burst before Bob and Carol queue one generation each.
+        waiters = [asyncio.ensure_future(hold(controller, client, order, release)) for client in ("alice", "alice", "alice", "bob", "carol")]
+        await asyncio.sleep(0)
+        assert controller.stats()["queuedByClient"] == {"alice": 3, "bob": 1, "carol": 1}
+
+        holder.cancel()
+        release.set()
+        await asyncio.gather(*waiters)
+        assert order == ["holder", "alice", "bob", "carol", "alice", "alice"]
+        assert controller.active == 0 and controller.queued == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_client_queue_is_rejected_with_a_retry_hint():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=10, max_queue_per_client=1)
+        release = asyncio.Event()
+        tasks = [asyncio.ensure_future(hold(controller, "alice", [], release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            controller.check("alice")
+        assert rejected.value.retry_after >= 1
+        # Other clients still get a place in the queue.
+        controller.check("bob")
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=10, max_queue_per_client=5)
+        order = []
+        release = asyncio.Event()
+        holder_release = asyncio.Event()
+        holder = asyncio.ensure_future(hold(controller, "holder", order, holder_release))
+        await asyncio.sleep(0)
+        gone = asyncio.ensure_future(hold(controller, "alice", order, release))
+        stays = asyncio.ensure_future(hold(controller, "bob", order, release))
+        await asyncio.sleep(0)
+        gone.cancel()
+        await asyncio.sleep(0)
+        assert controller.stats()["queuedByClient"] == {"bob": 1}
+
+        holder_release.set()
+        release.set()
+        await asyncio.gather(holder, stays)
+        assert order == ["holder", "bob"]
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=10, max_queue_per_client=5)
+        order = []
+        release = asyncio.Event()
+        async with controller.slot("holder"):
+            first = asyncio.ensure_future(hold(controller, "alice", order, release))
+            second = asyncio.ensure_future(hold(controller, "bob", order, release))
+            await asyncio.sleep(0)
+        # Leaving the block handed the slot to Alice, who gives up before she resumes.
+        first.cancel()
+        release.set()
+        await second
+        assert first.cancelled()
+        assert order == ["bob"]
+        assert controller.active == 0 and controller.queued == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+import time
+
+from chat_sessions import ChatSessionStore, new_session, select_history, turns_to_compact
+
+
+def session_with_turns(count, tokens=10, summary=""):
+    session = new_session("https://github.com/o/r", "alice")
+    session["summary"] = summary
+    session["turns"] = [{"role": "user" if i % 2 == 0 else "assistant", "content": str(i), "tokens": tokens} for i in range(count)]
+    return session
+
+
+def test_compaction_folds_whole_pairs_and_keeps_the_newest_turns():
+    session = session_with_turns(6)
+    assert turns_to_compact(session, 1000) == 0
+    # Three turns would fit the budget; the pair is completed.
+    assert turns_to_compact(session, 35) == 4
+    assert turns_to_compact(session, 0) == 4
+    # Completing the pair would eat into the newest turns, so it is left whole instead.
+    assert turns_to_compact(session_with_turns(5), 0) == 2
+
+
+def test_history_takes_the_newest_turns_that_fit_but_at_least_the_last_exchange():
+    session = session_with_turns(6, summary="earlier")
+    summary, turns = select_history(session, 32)
+    assert summary == "earlier"
+    assert [turn["content"] for turn in turns] == ["3", "4", "5"]
+    assert [turn["content"] for turn in select_history(session, 0)[1]] == ["4", "5"]
+
+
+def test_purge_deletes_only_idle_sessions(tmp_path):
+    store = ChatSessionStore(str(tmp_path / "sessions.sqlite3"))
+    idle, active = new_session("r", "alice"), new_session("r", "bob")
+    idle["updatedAt"] = time.time() - 3600
+    store.save(idle)
+    store.save(active)
+
+    assert store.purge(60) == [idle["id"]]
+    assert store.get(idle["id"]) is None
+    assert store.get(active["id"]) == active
+    assert store.purge(60) == []
+    store.close()
+
+
+def test_sessions_without_an_owner_are_dropped_on_open(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = ChatSessionStore(path)
+    legacy, owned = new_session("r", "alice"), new_session("r", "bob")
+    del legacy["owner"]
+    store.save(legacy)
+    store.save(owned)
+    store.close()
+
+    store = ChatSessionStore(path)
+    assert store.get(legacy["id"]) is None
+    assert store.get(owned["id"]) == owned
+    store.close()
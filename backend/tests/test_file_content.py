@@ -0,0 +1,68 @@
+import email.utils
+
+import pytest
+
+pytest.importorskip("git", reason="file_content needs GitPython")
+
+from file_content import RangeNotSatisfiable, is_not_modified, iter_span, line_span, map_file, parse_byte_range  # noqa: E402
+
+TEXT = b"one\ntwo\nthree\n"
+OPENED = {"etag": '"abc123"', "last_modified": 1_700_000_000}
+
+
+def test_byte_ranges():
+    assert parse_byte_range("bytes=0-3", 10) == (0, 4)
+    assert parse_byte_range("bytes=4-", 10) == (4, 10)
+    assert parse_byte_range("bytes=-3", 10) == (7, 10)
+    assert parse_byte_range("bytes=-30", 10) == (0, 10)
+    # The end is clamped to the file.
+    assert parse_byte_range("bytes=8-100", 10) == (8, 10)
+
+
+def test_unsupported_range_headers_are_ignored():
+    for header in ("items=0-3", "bytes=0-1,4-5", "bytes=abc", "bytes=x-3"):
+        assert parse_byte_range(header, 10) is None
+
+
+def test_ranges_outside_the_file_are_not_satisfiable():
+    for header in ("bytes=10-", "bytes=5-2", "bytes=-0"):
+        with pytest.raises(RangeNotSatisfiable):
+            parse_byte_range(header, 10)
+
+
+def test_line_spans():
+    assert TEXT[slice(*line_span(TEXT, 2, 2))] == b"two\n"
+    assert TEXT[slice(*line_span(TEXT, 2, None))] == b"two\nthree\n"
+    assert TEXT[slice(*line_span(TEXT, 1, 99))] == TEXT
+    assert line_span(b"no newline", 1, 1) == (0, 10)
+    assert line_span(b"", 1, None) == (0, 0)
+    for start, end in ((4, None), (3, 2)):
+        with pytest.raises(RangeNotSatisfiable):
+            line_span(TEXT, start, end)
+
+
+def test_iter_span_chunks_and_closes_the_mapping(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(bytes(range(256)) * 4)
+    data = map_file(str(path))
+    assert b"".join(iter_span(data, 10, 1000, chunk_size=100)) == path.read_bytes()[10:1000]
+    assert data.closed
+    (tmp_path / "empty").write_bytes(b"")
+    assert map_file(str(tmp_path / "empty")) == b""
+
+
+def test_entity_tags_decide_before_dates():
+    assert is_not_modified({"if-none-match": '"abc123"'}, OPENED)
+    assert is_not_modified({"if-none-match": 'W/"other", W/"abc123"'}, OPENED)
+    assert is_not_modified({"if-none-match": "*"}, OPENED)
+    later = email.utils.formatdate(OPENED["last_modified"] + 60, usegmt=True)
+    assert not is_not_modified({"if-none-match": '"other"', "if-modified-since": later}, OPENED)
+
+
+def test_modified_since():
+    at = email.utils.formatdate(OPENED["last_modified"], usegmt=True)
+    earlier = email.utils.formatdate(OPENED["last_modified"] - 60, usegmt=True)
+    assert is_not_modified({"if-modified-since": at}, OPENED)
+    assert not is_not_modified({"if-modified-since": earlier}, OPENED)
+    assert not is_not_modified({"if-modified-since": "yesterday"}, OPENED)
+    assert not is_not_modified({}, OPENED)
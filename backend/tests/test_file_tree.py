@@ -0,0 +1,120 @@
+import copy
+import os
+
+import pytest
+
+from file_tree import FLAG_DIRECTORY, list_children, nest, patch_listing, scan_tree, shutdown_executor, to_columnar
+
+LISTING = {
+    "": [("src", True), ("docs", True), ("README.md", False)],
+    "src": [("pkg", True), ("main.py", False)],
+    "src/pkg": [("util.py", False)],
+    "docs": [],
+}
+
+
+def decode_paths(tree):
+    paths = []
+    for name, parent in zip(tree["names"], tree["parents"]):
+        assert parent < len(paths)
+        paths.append(name if parent < 0 else f"{paths[parent]}/{name}")
+    return paths
+
+
+def test_columnar_parents_precede_children():
+    tree = to_columnar(LISTING)
+    assert len(tree["names"]) == len(tree["parents"]) == len(tree["flags"]) == 6
+    assert all(parent < index for index, parent in enumerate(tree["parents"]))
+    # Breadth-first: every top-level entry comes before anything nested.
+    assert tree["parents"][:3] == [-1, -1, -1]
+
+
+def test_columnar_round_trips_every_path_and_type():
+    tree = to_columnar(LISTING)
+    decoded = dict(zip(decode_paths(tree), tree["flags"]))
+    assert decoded == {
+        "src": FLAG_DIRECTORY,
+        "docs": FLAG_DIRECTORY,
+        "README.md": 0,
+        "src/pkg": FLAG_DIRECTORY,
+        "src/main.py": 0,
+        "src/pkg/util.py": 0,
+    }
+
+
+def test_columnar_of_an_empty_repository():
+    assert to_columnar({"": []}) == {"names": [], "parents": [], "flags": []}
+
+
+@pytest.fixture
+def checkout(tmp_path):
+    root = tmp_path / "checkout"
+    for path in (".git/objects", "src/pkg/deep", "docs", "lib"):
+        (root / path).mkdir(parents=True)
+    for path in (".git/HEAD", "README.md", "src/main.py", "src/pkg/util.py", "src/pkg/deep/x.py", "lib/a.js"):
+        (root / path).write_text("x")
+    os.symlink(str(tmp_path), str(root / "src" / "outside"))
+    return str(root)
+
+
+def test_scan_skips_git_and_does_not_follow_symlinks(checkout):
+    listing = scan_tree(checkout)
+    assert listing[""] == [("docs", True), ("lib", True), ("src", True), ("README.md", False)]
+    # The symlink is listed as a file and never walked into.
+    assert listing["src"] == [("pkg", True), ("main.py", False), ("outside", False)]
+    assert set(listing) == {"", "docs", "lib", "src", "src/pkg", "src/pkg/deep"}
+
+
+def test_scan_stops_at_max_depth(checkout):
+    assert set(scan_tree(checkout, max_depth=0)) == {""}
+    listing = scan_tree(checkout, max_depth=1)
+    assert set(listing) == {"", "docs", "lib", "src"}
+    # Directories below the limit are listed by their parent but not read.
+    assert ("pkg", True) in listing["src"]
+
+
+def test_scan_with_worker_processes_matches_a_serial_scan(checkout):
+    try:
+        assert scan_tree(checkout, workers=2) == scan_tree(checkout)
+        assert scan_tree(checkout, max_depth=1, workers=2) == scan_tree(checkout, max_depth=1)
+    finally:
+        shutdown_executor()
+
+
+def test_patch_adds_files_and_their_new_directories_in_order(tmp_path):
+    listing = copy.deepcopy(LISTING)
+    patch_listing(listing, {"added": ["lib/sub/new.py", "src/a.py", "src/main.py"], "deleted": []}, str(tmp_path))
+    assert listing[""] == [("docs", True), ("lib", True), ("src", True), ("README.md", False)]
+    assert listing["lib"] == [("sub", True)]
+    assert listing["lib/sub"] == [("new.py", False)]
+    # Already listed paths are not duplicated.
+    assert listing["src"] == [("pkg", True), ("a.py", False), ("main.py", False)]
+
+
+def test_patch_drops_directories_a_deletion_emptied(tmp_path):
+    (tmp_path / "src").mkdir()
+    listing = copy.deepcopy(LISTING)
+    patch_listing(listing, {"added": [], "deleted": ["src/pkg/util.py", "README.md"]}, str(tmp_path))
+    assert listing[""] == [("src", True), ("docs", True)]
+    # src still exists on disk, so only the emptied src/pkg goes away.
+    assert listing["src"] == [("main.py", False)]
+    assert "src/pkg" not in listing
+
+
+def test_children_are_paged_and_left_unexpanded():
+    page, total = list_children(LISTING, "src", offset=1, limit=5)
+    assert total == 2
+    assert page == [{"name": "main.py", "path": "src/main.py", "type": "file", "children": []}]
+    page, total = list_children(LISTING, "", limit=1)
+    assert total == 3
+    assert page == [{"name": "src", "path": "src", "type": "directory", "children": None, "childCount": 2}]
+
+
+def test_nest_stops_at_max_depth_and_truncates_nested_directories():
+    tree = nest(LISTING, max_depth=1, max_children=1)
+    assert [node["name"] for node in tree] == ["src", "docs", "README.md"]
+    src = tree[0]
+    assert src["childCount"] == 2
+    assert [node["name"] for node in src["children"]] == ["pkg"]
+    # Below max_depth the directory is left for the client to expand.
+    assert src["children"][0]["children"] is None and src["children"][0]["childCount"] == 1
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from jobs import JobManager, JobQueueFull
+
+
+def test_pending_jobs_are_shared_by_key_and_report_their_stages():
+    async def scenario():
+        manager = JobManager(workers=1)
+        await manager.start()
+        release = asyncio.Event()
+
+        async def analyze(job):
+            job.update("cloning", done=0)
+            await release.wait()
+            # Progress from a worker thread is applied on the loop.
+            await asyncio.to_thread(job.update_threadsafe, "indexing", files=3)
+            await asyncio.sleep(0)
+            return {"files": 3}
+
+        job = manager.submit("analyze", "repo", analyze)
+        assert manager.submit("analyze", "repo", analyze) is job
+        seen = []
+
+        async def watch():
+            async for update in job.watch():
+                seen.append((update.status, update.stage))
+
+        watcher = asyncio.ensure_future(watch())
+        await asyncio.sleep(0.01)
+        release.set()
+        await watcher
+
+        assert seen[0] in (("queued", "queued"), ("running", "cloning"))
+        assert seen[-1] == ("succeeded", "indexing")
+        assert [stage["stage"] for stage in job.stages] == ["queued", "running", "cloning", "indexing", "succeeded"]
+        assert job.to_dict()["result"] == {"files": 3}
+        # Once finished, the key can be submitted again.
+        assert manager.submit("analyze", "repo", analyze) is not job
+        await manager.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_failures_are_recorded_without_a_result():
+    async def scenario():
+        manager = JobManager(workers=1)
+        await manager.start()
+
+        class NotFound(Exception):
+            detail = "Repository not found."
+
+        async def fail(job):
+            raise NotFound("404")
+
+        job = manager.submit("analyze", "repo", fail)
+        async for _ in job.watch():
+            pass
+        assert job.status == "failed" and job.error == "Repository not found."
+        assert "result" not in job.to_dict()
+        await manager.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_submissions_beyond_the_queue_limit_are_rejected():
+    async def scenario():
+        manager = JobManager(workers=1, max_queued=1)
+        await manager.start()
+        release = asyncio.Event()
+
+        async def wait(job):
+            await release.wait()
+
+        manager.submit("guide", "running", wait)
+        await asyncio.sleep(0)
+        manager.submit("guide", "queued", wait)
+        with pytest.raises(JobQueueFull):
+            manager.submit("guide", "rejected", wait)
+        assert manager.stats() == {"workers": 1, "queued": 1, "running": 1, "retained": 2}
+        release.set()
+        await manager.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_only_the_newest_finished_jobs_are_retained():
+    async def scenario():
+        manager = JobManager(workers=2, max_retained=2)
+        await manager.start()
+
+        async def done(job):
+            return job.key
+
+        jobs = []
+        for key in ("a", "b", "c"):
+            jobs.append(manager.submit("analyze", key, done))
+            async for _ in jobs[-1].watch():
+                pass
+        assert manager.get(jobs[0].id) is None
+        assert manager.get(jobs[1].id) is jobs[1] and manager.get(jobs[2].id) is jobs[2]
+        await manager.aclose()
+
+    asyncio.run(scenario())
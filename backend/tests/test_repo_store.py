@@ -0,0 +1,164 @@
+import json
+import os
+import subprocess
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("git", reason="RepoStore needs GitPython")
+
+from repo_store import RepoBusyError, RepoStore  # noqa: E402
+
+
+def git(path, *args):
+    subprocess.run(["git", "-C", path, "-c", "user.email=test@example.com", "-c", "user.name=test", *args], check=True, capture_output=True)
+
+
+def commit_file(path, name, content):
+    with open(os.path.join(path, name), "w", encoding="utf-8") as f:
+        f.write(content)
+    git(path, "add", "-A")
+    git(path, "commit", "-qm", f"write {name}")
+
+
+@pytest.fixture
+def remote(tmp_path):
+    path = str(tmp_path / "remote")
+    os.makedirs(path)
+    git(path, "init", "-q")
+    commit_file(path, "a.txt", "first")
+    return path
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_lease_waits_for_in_place_refresh(tmp_path, remote):
+    store = RepoStore(str(tmp_path / "store"), max_bytes=1 << 30)
+    url = f"file://{remote}"
+    with store.clone(url) as checkout:
+        old_commit = checkout["commit"]
+    commit_file(remote, "b.txt", "second")
+
+    results = {}
+
+    def refresh():
+        with store.refresh(url) as (entry, changes):
+            results["refreshed"] = (entry["commit"], changes)
+
+    def lease():
+        with store.lease(url) as entry:
+            results["leased"] = entry["commit"]
+            results["files"] = sorted(os.listdir(entry["path"]))
+
+    with store.lease(url):
+        refresher = threading.Thread(target=refresh)
+        refresher.start()
+        # The refresh has fetched and now waits for this lease to go.
+        wait_until(lambda: store._writing)
+        reader = threading.Thread(target=lease)
+        reader.start()
+        time.sleep(0.1)
+        assert "leased" not in results
+    refresher.join(10)
+    reader.join(10)
+    assert not refresher.is_alive() and not reader.is_alive()
+
+    new_commit, changes = results["refreshed"]
+    assert new_commit != old_commit
+    assert changes["added"] == ["b.txt"]
+    # The waiting reader only saw the tree once it was fully updated.
+    assert results["leased"] == new_commit
+    assert "b.txt" in results["files"]
+
+
+def test_eviction_spares_leased_checkouts(tmp_path):
+    remotes = []
+    for name in ("one", "two"):
+        path = str(tmp_path / name)
+        os.makedirs(path)
+        git(path, "init", "-q")
+        commit_file(path, "data.txt", name * 1000)
+        remotes.append(f"file://{path}")
+    store = RepoStore(str(tmp_path / "store"), max_bytes=1)
+
+    with store.clone(remotes[0]) as first:
+        with store.clone(remotes[1]):
+            assert os.path.isdir(first["path"])
+        assert store.latest(remotes[1]) is None
+        assert os.path.isdir(first["path"])
+    assert store.latest(remotes[0]) is None
+    assert os.listdir(store.checkouts_dir) == []
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_concurrent_artifact_saves_do_not_interleave(tmp_path, remote):
+    store = RepoStore(str(tmp_path / "store"), max_bytes=1 << 30)
+    with store.clone(f"file://{remote}") as checkout:
+        key = checkout["key"]
+    payloads = [{"writer": i, "rows": list(range(2000))} for i in range(8)]
+    threads = [threading.Thread(target=store.save_artifact, args=(key, "tree", payload)) for payload in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    with open(store.artifact_path(key, "tree.json"), encoding="utf-8") as f:
+        assert json.load(f) in payloads
+    assert not [name for name in os.listdir(os.path.dirname(checkout["path"])) if name.endswith(".tmp")]
+
+
+def test_refresh_gives_up_on_a_long_lease(tmp_path, remote):
+    store = RepoStore(str(tmp_path / "store"), max_bytes=1 << 30, wait_timeout=0.2)
+    url = f"file://{remote}"
+    with store.clone(url) as checkout:
+        old_commit = checkout["commit"]
+    commit_file(remote, "b.txt", "second")
+
+    with store.lease(url):
+        with pytest.raises(RepoBusyError):
+            with store.refresh(url):
+                pass
+        # The checkout is left as it was and stays readable.
+        assert not store._writing
+        with store.lease(url) as entry:
+            assert entry["commit"] == old_commit
+    assert store._pins == {}
+    with store.refresh(url) as (entry, changes):
+        assert changes["added"] == ["b.txt"]
+
+
+def test_lease_gives_up_waiting_for_a_refresh(tmp_path, remote):
+    store = RepoStore(str(tmp_path / "store"), max_bytes=1 << 30, wait_timeout=0.2)
+    url = f"file://{remote}"
+    with store.clone(url) as checkout:
+        pass
+    store._writing.add(checkout["key"])
+    started = time.monotonic()
+    with pytest.raises(RepoBusyError):
+        with store.lease(url):
+            pass
+    assert time.monotonic() - started < 5
+
+
+def test_refresh_reports_the_commit_its_changes_start_from(tmp_path, remote):
+    store = RepoStore(str(tmp_path / "store"), max_bytes=1 << 30)
+    url = f"file://{remote}"
+    with store.clone(url) as checkout:
+        first_commit = checkout["commit"]
+    commit_file(remote, "b.txt", "second")
+
+    with store.refresh(url) as (entry, changes):
+        assert changes is not None
+        assert entry["previous_commit"] == first_commit
+        second_commit = entry["commit"]
+    # Nothing new upstream: no changes, relative to the current commit.
+    with store.refresh(url) as (entry, changes):
+        assert changes is None
+        assert entry["previous_commit"] == entry["commit"] == second_commit
+    assert "previous_commit" not in store.latest(url)
@@ -0,0 +1,53 @@
+import time
+
+from response_cache import ResponseCache, make_key
+
+
+def test_keys_ignore_whitespace_but_not_anything_that_changes_the_answer():
+    key = make_key("codellama", "explain", 1, "def f():\n    pass\n")
+    assert make_key("codellama", "explain", 1, "def f():  \r\n    pass") == key
+    assert make_key("codellama", "explain", 2, "def f():\n    pass\n") != key
+    assert make_key("llama3", "explain", 1, "def f():\n    pass\n") != key
+    assert make_key("codellama", "summarize", 1, "def f():\n    pass\n") != key
+    assert make_key("codellama", "explain", 1, "def g():\n    pass\n") != key
+    assert make_key("codellama", "explain", 1, "def f():\n    pass\n", {"temperature": 0}) != key
+
+
+def test_entries_expire_by_the_ttl_of_the_lookup():
+    cache = ResponseCache(None)
+    cache.put("explain", "k", "answer")
+    assert cache.get("explain", "k", ttl=60) == "answer"
+    time.sleep(0.02)
+    assert cache.get("explain", "k", ttl=0.01) is None
+    assert cache.get("explain", "missing", ttl=60) is None
+    assert cache.stats() == {"explain": {"hits": 1, "misses": 2}}
+
+
+def test_memory_tier_evicts_least_recently_used_entries():
+    cache = ResponseCache(None, max_memory_entries=2)
+    cache.put("explain", "a", "A")
+    cache.put("explain", "b", "B")
+    cache.get("explain", "a", ttl=60)
+    cache.put("explain", "c", "C")
+    assert cache.get("explain", "b", ttl=60) is None
+    assert cache.get("explain", "a", ttl=60) == "A"
+
+
+def test_responses_survive_a_restart_until_purged(tmp_path):
+    path = str(tmp_path / "cache" / "responses.sqlite3")
+    cache = ResponseCache(path, max_memory_entries=1)
+    cache.put("summarize", "old", "stale")
+    cache.put("summarize", "new", "fresh")
+    cache.close()
+
+    cache = ResponseCache(path)
+    assert cache.get("summarize", "old", ttl=60) == "stale"
+    time.sleep(0.02)
+    cache.put("summarize", "new", "fresh")
+    assert cache.purge(0.01) == 1
+    cache.close()
+
+    cache = ResponseCache(path)
+    assert cache.get("summarize", "old", ttl=60) is None
+    assert cache.get("summarize", "new", ttl=60) == "fresh"
+    cache.close()
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("git", reason="RepoStore needs GitPython")
+
+from admission import AdmissionController  # noqa: E402
+from llm_gateway import LLMGateway  # noqa: E402
+from repo_store import RepoStore  # noqa: E402
+from semantic_index import HashingEmbedder, SemanticIndex  # noqa: E402
+
+
+def test_embedding_batches_wait_for_an_admission_slot():
+    async def scenario():
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return httpx.Response(200, json={"embeddings": [[1.0, 0.0]]})
+
+        controller = AdmissionController(max_concurrent=1, max_queue_depth=10, max_queue_per_client=5)
+        gateway = LLMGateway("http://ollama", "model", transport=httpx.MockTransport(handler), admission=controller)
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot("chat"):
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        embedding = asyncio.ensure_future(gateway.embed(["text"]))
+        await asyncio.sleep(0.05)
+        assert calls == [] and controller.queued == 1
+
+        release.set()
+        assert await embedding == [[1.0, 0.0]]
+        assert calls == ["/api/embed"]
+        await holder
+        await gateway.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_saves_leave_one_index_and_no_temporary_files(tmp_path):
+    store = RepoStore(str(tmp_path / "store"), max_bytes=1 << 30)
+    index = SemanticIndex(store, HashingEmbedder(dim=4))
+    key = "checkout"
+    os.makedirs(os.path.dirname(index._matrix_path(key)))
+    meta = {"version": 1, "commit": "c", "embedder": index.embedder.name, "files": {}, "chunks": []}
+
+    def save(value):
+        index._save(key, meta, np.full((64, 4), value, dtype=np.float32))
+
+    threads = [threading.Thread(target=save, args=(value,)) for value in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(os.listdir(os.path.dirname(index._matrix_path(key)))) == ["embeddings.npy", "search.json"]
+    loaded_meta, matrix = index._load(key)
+    assert loaded_meta == meta
+    assert matrix.shape == (64, 4) and len(set(matrix.ravel().tolist())) == 1
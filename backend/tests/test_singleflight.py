@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"calls": calls}
+
+        callers = [asyncio.ensure_future(flights.do("repo", fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flights.in_flight("repo")
+        release.set()
+        results = await asyncio.gather(*callers)
+        assert calls == 1
+        assert all(result is results[0] for result in results)
+        assert not flights.in_flight("repo")
+        # Settled keys are forgotten, so the next call runs again.
+        assert await flights.do("repo", fetch) == {"calls": 2}
+
+    asyncio.run(scenario())
+
+
+def test_joined_callers_see_the_leaders_exception():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def fail():
+            await release.wait()
+            raise ValueError("clone failed")
+
+        callers = [asyncio.ensure_future(flights.do("repo", fail)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert [type(result) for result in results] == [ValueError] * 3
+        assert not flights.in_flight("repo")
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_the_leader_does_not_cancel_the_call():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "analysis"
+
+        leader = asyncio.ensure_future(flights.do("repo", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("repo", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert flights.in_flight("repo")
+        release.set()
+        assert await follower == "analysis"
+
+    asyncio.run(scenario())
@@ -0,0 +1,186 @@
+import asyncio
+
+import pytest
+
+from stream_coalescer import StreamCoalescer, is_deterministic, request_key
+
+
+class Upstream:
+    """A fake upstream response whose chunks the test releases one at a time."""
+
+    def __init__(self):
+        self.chunks: asyncio.Queue = asyncio.Queue()
+        self.cancelled = False
+        self.runs = 0
+
+    async def produce(self, stream):
+        self.runs += 1
+        try:
+            stream.start(200, "application/x-ndjson")
+            while True:
+                chunk = await self.chunks.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                stream.publish(chunk)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def collect(subscription):
+    return [chunk async for chunk in subscription.subscribe()]
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_late_subscriber_replays_missed_chunks_then_follows_live():
+    async def scenario():
+        coalescer = StreamCoalescer()
+        upstream = Upstream()
+        first = coalescer.join("key", upstream.produce)
+        assert await first.started() == (200, "application/x-ndjson")
+        first_body = asyncio.ensure_future(collect(first))
+        upstream.chunks.put_nowait(b"a")
+        upstream.chunks.put_nowait(b"b")
+        await settle()
+
+        late = coalescer.join("key", upstream.produce)
+        assert late.stream is first.stream
+        late_body = asyncio.ensure_future(collect(late))
+        upstream.chunks.put_nowait(b"c")
+        upstream.chunks.put_nowait(None)
+        assert await first_body == [b"a", b"b", b"c"]
+        assert await late_body == [b"a", b"b", b"c"]
+        assert upstream.runs == 1
+        assert coalescer.stats() == {"inFlight": 0, "subscribers": 0, "started": 1, "joined": 1}
+
+    asyncio.run(scenario())
+
+
+def test_joined_callers_see_the_upstream_error():
+    async def scenario():
+        coalescer = StreamCoalescer()
+        upstream = Upstream()
+        streams = [coalescer.join("key", upstream.produce) for _ in range(3)]
+        bodies = [asyncio.ensure_future(collect(stream)) for stream in streams]
+        upstream.chunks.put_nowait(b"partial")
+        upstream.chunks.put_nowait(ConnectionError("upstream went away"))
+        results = await asyncio.gather(*bodies, return_exceptions=True)
+        assert [type(result) for result in results] == [ConnectionError] * 3
+        assert coalescer.stats()["inFlight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_failure_before_the_response_starts_reaches_every_caller():
+    async def scenario():
+        coalescer = StreamCoalescer()
+
+        async def unreachable(stream):
+            raise ConnectionError("no host")
+
+        streams = [coalescer.join("key", unreachable) for _ in range(2)]
+        for stream in streams:
+            with pytest.raises(ConnectionError):
+                await stream.started()
+            stream.leave()
+        assert coalescer.stats()["inFlight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_leader_leaving_keeps_the_stream_for_the_others():
+    async def scenario():
+        coalescer = StreamCoalescer()
+        upstream = Upstream()
+        leader = coalescer.join("key", upstream.produce)
+        follower = coalescer.join("key", upstream.produce)
+        leader_body = leader.subscribe()
+        upstream.chunks.put_nowait(b"a")
+        assert await leader_body.__anext__() == b"a"
+        # The client that started the generation disconnects.
+        await leader_body.aclose()
+        await settle()
+        assert not upstream.cancelled
+
+        follower_body = asyncio.ensure_future(collect(follower))
+        upstream.chunks.put_nowait(b"b")
+        upstream.chunks.put_nowait(None)
+        assert await follower_body == [b"a", b"b"]
+
+    asyncio.run(scenario())
+
+
+def test_generation_is_cancelled_once_every_subscriber_leaves():
+    async def scenario():
+        coalescer = StreamCoalescer()
+        upstream = Upstream()
+        streams = [coalescer.join("key", upstream.produce) for _ in range(2)]
+        await streams[0].started()
+        for stream in streams:
+            body = stream.subscribe()
+            upstream.chunks.put_nowait(b"a")
+            await body.__anext__()
+            await body.aclose()
+        await settle()
+        assert upstream.cancelled
+        assert coalescer.stats()["inFlight"] == 0
+        # A new request after that starts a fresh generation.
+        assert coalescer.join("key", upstream.produce).stream is not streams[0].stream
+
+    asyncio.run(scenario())
+
+
+def test_subscriber_whose_body_never_starts_is_released():
+    async def scenario():
+        coalescer = StreamCoalescer()
+        upstream = Upstream()
+        subscription = coalescer.join("key", upstream.produce)
+        await subscription.started()
+        # The client went away before the response body was iterated; only the cleanup runs.
+        body = subscription.subscribe()
+        await body.aclose()
+        assert coalescer.stats()["subscribers"] == 1
+        subscription.leave()
+        subscription.leave()
+        await settle()
+        assert upstream.cancelled
+        assert coalescer.stats() == {"inFlight": 0, "subscribers": 0, "started": 1, "joined": 0}
+
+    asyncio.run(scenario())
+
+
+def test_leaving_again_after_the_body_closed_does_not_drop_other_subscribers():
+    async def scenario():
+        coalescer = StreamCoalescer()
+        upstream = Upstream()
+        first = coalescer.join("key", upstream.produce)
+        second = coalescer.join("key", upstream.produce)
+        body = first.subscribe()
+        upstream.chunks.put_nowait(b"a")
+        await body.__anext__()
+        await body.aclose()
+        first.leave()
+        await settle()
+        assert not upstream.cancelled
+        assert coalescer.stats()["subscribers"] == 1
+
+        second_body = asyncio.ensure_future(collect(second))
+        upstream.chunks.put_nowait(None)
+        assert await second_body == [b"a"]
+
+    asyncio.run(scenario())
+
+
+def test_only_identical_deterministic_requests_are_shared():
+    greedy = {"model": "codellama", "prompt": "hi", "options": {"temperature": 0}}
+    assert is_deterministic(greedy)
+    assert is_deterministic({"model": "codellama", "prompt": "hi", "options": {"seed": 7, "temperature": 0.8}})
+    assert not is_deterministic({"model": "codellama", "prompt": "hi"})
+    assert request_key("/api/generate", greedy) == request_key("/api/generate", dict(reversed(list(greedy.items()))))
+    assert request_key("/api/generate", greedy) != request_key("/api/generate", dict(greedy, prompt="hello"))
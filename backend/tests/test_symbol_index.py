@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("git", reason="symbol_index imports RepoStore, which needs GitPython")
+
+from symbol_index import extract_symbols, extract_symbols_batch, rank_symbols, read_sources  # noqa: E402
+
+PYTHON_SOURCE = '''import os
+from json import dumps
+
+
+class TokenStore:
+    """Keeps tokens."""
+
+    def save_token(self, token):
+        return dumps(token)
+
+
+def login_user(name):
+    return os.getenv(name)
+'''
+
+TYPESCRIPT_SOURCE = '''export function renderTree(nodes) {
+  return nodes.map((node) => node.name);
+}
+
+export class Painter {
+  paint() {}
+}
+'''
+
+
+def names(symbols):
+    return [(symbol["type"], symbol["name"]) for symbol in symbols]
+
+
+def test_python_symbols_are_qualified_and_positioned():
+    symbols = extract_symbols("pkg/auth.py", PYTHON_SOURCE)
+    assert names(symbols) == [
+        ("module", "pkg.auth"),
+        ("class", "TokenStore"),
+        ("function", "TokenStore.save_token"),
+        ("function", "login_user"),
+    ]
+    by_name = {symbol["name"]: symbol for symbol in symbols}
+    assert by_name["TokenStore"]["description"] == "Keeps tokens."
+    assert by_name["login_user"]["position"] == {"file": "pkg/auth.py", "lineStart": 12, "lineEnd": 13}
+
+
+def test_broken_python_gives_no_symbols():
+    assert extract_symbols("broken.py", "def nope(:\n") == []
+
+
+def test_brace_languages_find_block_ends():
+    symbols = extract_symbols("src/render.ts", TYPESCRIPT_SOURCE)
+    positions = {symbol["name"]: (symbol["position"]["lineStart"], symbol["position"]["lineEnd"]) for symbol in symbols}
+    assert positions["renderTree"] == (1, 3)
+    assert positions["Painter"] == (5, 7)
+
+
+def test_unreadable_large_and_binary_files_are_skipped(tmp_path):
+    (tmp_path / "ok.py").write_text("def ok():\n    pass\n")
+    (tmp_path / "blob.py").write_bytes(b"def x():\0\n")
+    sources = read_sources(str(tmp_path), ["ok.py", "blob.py", "missing.py"])
+    assert sources["blob.py"] is None and sources["missing.py"] is None
+    parsed = extract_symbols_batch(sources)
+    assert names(parsed["ok.py"])[-1] == ("function", "ok")
+    assert parsed["blob.py"] == [] and parsed["missing.py"] == []
+
+
+def test_rank_symbols_prefers_overlap_then_shorter_definitions():
+    def symbol(name, length):
+        return {"type": "function", "name": name, "position": {"file": "a.py", "lineStart": 1, "lineEnd": 1 + length}}
+
+    from prompt_context import split_words
+    candidates = [symbol(name, length) for name, length in [("parse_config", 40), ("load_config", 5), ("parseConfigFile", 10), ("render", 1)]]
+    named = [(frozenset(split_words(item["name"])), item) for item in candidates]
+    ranked = rank_symbols(named, "Where do we parse the config?", limit=3)
+    assert [item["name"] for item in ranked] == ["parseConfigFile", "parse_config", "load_config"]
+    assert rank_symbols(named, "the and of", limit=3) == []
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from token_cache import TokenCache
+
+
+class Validator:
+    """Counts validations; tokens starting with "bad" are rejected."""
+
+    def __init__(self, ttl=3600.0, gate=None):
+        self.calls = 0
+        self.ttl = ttl
+        self.gate = gate
+
+    def __call__(self, token):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        if token.startswith("bad"):
+            raise ValueError("invalid token")
+        return {"sub": token, "exp": time.time() + self.ttl}
+
+
+def test_valid_tokens_are_remembered_until_they_expire():
+    async def scenario():
+        validator = Validator()
+        cache = TokenCache(validator)
+        assert (await cache.validate("alice"))["sub"] == "alice"
+        assert (await cache.validate("alice"))["sub"] == "alice"
+        assert validator.calls == 1
+
+        validator.ttl = -1
+        await cache.validate("bob")
+        await cache.validate("bob")
+        assert validator.calls == 3
+        assert cache.stats() == {"hits": 1, "misses": 3, "entries": 2}
+
+    asyncio.run(scenario())
+
+
+def test_failed_validations_are_not_cached():
+    async def scenario():
+        validator = Validator()
+        cache = TokenCache(validator)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await cache.validate("bad-token")
+        assert validator.calls == 2
+        assert cache.stats()["entries"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_requests_share_one_validation():
+    async def scenario():
+        gate = threading.Event()
+        validator = Validator(gate=gate)
+        cache = TokenCache(validator)
+        requests = [asyncio.ensure_future(cache.validate("alice")) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        gate.set()
+        claims = await asyncio.gather(*requests)
+        assert all(claim["sub"] == "alice" for claim in claims)
+        assert validator.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_tokens_are_dropped_first():
+    async def scenario():
+        validator = Validator()
+        cache = TokenCache(validator, max_entries=2)
+        for token in ("a", "b", "a", "c"):
+            await cache.validate(token)
+        assert validator.calls == 3
+        await cache.validate("a")
+        assert validator.calls == 3
+        await cache.validate("b")
+        assert validator.calls == 4
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Used for validated tokens that carry no `exp` claim.
+DEFAULT_TOKEN_TTL = 60.0
+
+
+class TokenCache:
+    """
+    Remembers validated session tokens until they expire.
+
+    Tokens are keyed by their SHA-256 so raw JWTs are never held as keys.
+    Validation itself (signature checks, and key downloads when the signing
+    key is unknown) is blocking, so it runs in a worker thread, and
+    concurrent requests carrying the same new token share one validation.
+    Failed validations are not cached.
+    """
+
+    def __init__(self, validate: Callable[[str], dict], max_entries: int = 10000):
+        self.validate_sync = validate
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    async def validate(self, token: str) -> dict:
+        """Returns the token's claims, raising whatever the validator raises for an invalid token."""
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+        if self._flights.in_flight(key):
+            self.hits += 1
+        else:
+            self.misses += 1
+        return await self._flights.do(key, lambda: self._validate(key, token))
+
+    async def _validate(self, key: str, token: str) -> dict:
+        claims = await asyncio.to_thread(self.validate_sync, token)
+        expires_at = claims.get("exp") or time.time() + DEFAULT_TOKEN_TTL
+        self._entries[key] = (claims, float(expires_at))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return claims
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+def fetch_descope_keys(descope_client) -> Optional[int]:
+    """
+    Downloads the project's signing keys into the Descope client and returns
+    how many were loaded (None if the SDK offers no hook for it). Blocking.
+
+    The SDK only fetches keys lazily, inside the first validation that needs
+    them; doing it ahead of time keeps that download off the request path.
+    """
+    auth = getattr(descope_client, "_auth", None)
+    if auth is None or not hasattr(auth, "_fetch_public_keys"):
+        return None
+    with auth.lock_public_keys:
+        auth._fetch_public_keys()
+        return len(auth.public_keys)
+
+
+async def refresh_descope_keys(descope_client, interval: float):
+    """Re-downloads the signing keys every `interval` seconds so rotated keys are known before they are used."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            count = await asyncio.to_thread(fetch_descope_keys, descope_client)
+            logger.debug("Refreshed %s Descope signing keys", count)
+        except Exception as e:
+            logger.warning("Refreshing Descope signing keys failed: %s", e)
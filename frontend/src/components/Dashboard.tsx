@@ -14,7 +14,7 @@ import { useDescope } from '@descope/react-sdk';
 // Assumes these components exist in separate files in your project structure
 import CodeInput from './CodeInput';
 import RepositoryInput from './RepositoryInput';
-import FileExplorer, { FileItem } from './FileExplorer';
+import FileExplorer, { FileItem, DirectoryPage } from './FileExplorer';
 import ChatComponent from './ChatComponent';
 import IssueFinder from './IssueFinder';
 import GuidedContribution from './GuidedContribution';
@@ -181,6 +181,19 @@ const Dashboard: React.FC<DashboardProps> = ({ user }) => {
     }
   };
 
+  const handleLoadChildren = async (directory: FileItem, offset: number): Promise<DirectoryPage> => {
+    const response = await axios.get('http://localhost:8000/api/repo/tree', {
+      params: {
+        repo_url: repoUrl,
+        path: directory.path,
+        offset,
+        limit: 200,
+      },
+      headers: { 'Authorization': `Bearer ${sessionToken || ''}` }
+    });
+    return response.data;
+  };
+
   const handleFileSelect = async (file: FileItem) => {
     if (file.type === 'directory') return;
     if (!repoUrl) {
@@ -268,7 +281,7 @@ const Dashboard: React.FC<DashboardProps> = ({ user }) => {
               <Box sx={{ flex: '10', minWidth: 0 }}>
                 <Paper sx={{ p: 2, height: '100%', overflowY: 'auto' }}>
                   <Typography variant="h5">Code Map</Typography>
-                  <FileExplorer structure={repoStructure} onFileSelect={handleFileSelect} selectedFile={selectedFile} />
+                  <FileExplorer structure={repoStructure} onFileSelect={handleFileSelect} selectedFile={selectedFile} onLoadChildren={handleLoadChildren} />
                 </Paper>
               </Box>
               <Box sx={{ flex: '10', minWidth: 0, height: '100%' }}>
@@ -7,6 +7,7 @@ import {
   Collapse,
   IconButton,
   Typography,
+  CircularProgress,
 } from '@mui/material';
 import {
   Folder as FolderIcon,
@@ -23,28 +24,64 @@ export interface FileItem {
   type: 'file' | 'directory';
   language?: string;
   size?: number;
-  children?: FileItem[];
+  // Directories deeper than the initial response have children == null until expanded
+  children?: FileItem[] | null;
+  childCount?: number | null;
 }
 
+export interface DirectoryPage {
+  items: FileItem[];
+  total: number;
+}
+
+// Fetches a page of a directory's children from the backend (/api/repo/tree)
+export type LoadChildren = (directory: FileItem, offset: number) => Promise<DirectoryPage>;
+
 interface FileExplorerProps {
   structure: FileItem[];
   onFileSelect: (file: FileItem) => void;
   selectedFile: FileItem | null;
+  onLoadChildren?: LoadChildren;
 }
 
-const FileItemComponent: React.FC<{ item: FileItem; level: number; onFileSelect: (file: FileItem) => void; selectedFile: FileItem | null; }> = ({
+const FileItemComponent: React.FC<{ item: FileItem; level: number; onFileSelect: (file: FileItem) => void; selectedFile: FileItem | null; onLoadChildren?: LoadChildren; }> = ({
   item,
   level = 0,
   onFileSelect,
   selectedFile,
+  onLoadChildren,
 }) => {
   const [isOpen, setIsOpen] = useState(false);
+  const [children, setChildren] = useState<FileItem[] | null>(item.children ?? null);
+  const [childCount, setChildCount] = useState<number>(item.childCount ?? item.children?.length ?? 0);
+  const [isLoading, setIsLoading] = useState(false);
   const isDirectory = item.type === 'directory';
   const isSelected = selectedFile && selectedFile.path === item.path;
 
+  const loadMore = async () => {
+    if (!onLoadChildren || isLoading) return;
+    setIsLoading(true);
+    try {
+      const page = await onLoadChildren(item, children?.length ?? 0);
+      setChildren([...(children ?? []), ...page.items]);
+      setChildCount(page.total);
+    } catch (error) {
+      console.error(`Failed to load children of ${item.path}`, error);
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
+  const toggleOpen = () => {
+    if (!isOpen && children === null && childCount > 0) {
+      loadMore();
+    }
+    setIsOpen(!isOpen);
+  };
+
   const handleClick = () => {
     if (isDirectory) {
-      setIsOpen(!isOpen);
+      toggleOpen();
     } else {
       onFileSelect(item);
     }
@@ -65,7 +102,7 @@ const FileItemComponent: React.FC<{ item: FileItem; level: number; onFileSelect:
       >
         <ListItemIcon sx={{ minWidth: '32px' }}>
           {isDirectory ? (
-            <IconButton onClick={(e) => { e.stopPropagation(); setIsOpen(!isOpen); }} size="small">
+            <IconButton onClick={(e) => { e.stopPropagation(); toggleOpen(); }} size="small">
               {isOpen ? <ExpandMore /> : <ChevronRight />}
             </IconButton>
           ) : null}
@@ -83,18 +120,31 @@ const FileItemComponent: React.FC<{ item: FileItem; level: number; onFileSelect:
           }}
         />
       </ListItem>
-      {isDirectory && isOpen && item.children && (
+      {isDirectory && isOpen && (children || isLoading) && (
         <Collapse in={isOpen} timeout="auto" unmountOnExit>
           <List component="div" disablePadding>
-            {item.children.map((child) => (
+            {(children ?? []).map((child) => (
               <FileItemComponent
                 key={child.path}
                 item={child}
                 level={level + 1}
                 onFileSelect={onFileSelect}
                 selectedFile={selectedFile}
+                onLoadChildren={onLoadChildren}
               />
             ))}
+            {isLoading ? (
+              <ListItem sx={{ pl: (level + 1) * 2 + 2 }}>
+                <CircularProgress size={16} sx={{ color: '#a8ff00' }} />
+              </ListItem>
+            ) : children && children.length < childCount && onLoadChildren ? (
+              <ListItem onClick={loadMore} sx={{ pl: (level + 1) * 2 + 6, cursor: 'pointer' }}>
+                <ListItemText
+                  primary={`Show more (${childCount - children.length} remaining)`}
+                  sx={{ '& .MuiListItemText-primary': { fontSize: '0.85rem', color: '#a8ff00' } }}
+                />
+              </ListItem>
+            ) : null}
           </List>
         </Collapse>
       )}
@@ -102,7 +152,7 @@ const FileItemComponent: React.FC<{ item: FileItem; level: number; onFileSelect:
   );
 };
 
-const FileExplorer: React.FC<FileExplorerProps> = ({ structure, onFileSelect, selectedFile }) => {
+const FileExplorer: React.FC<FileExplorerProps> = ({ structure, onFileSelect, selectedFile, onLoadChildren }) => {
   if (!structure) return <Typography sx={{ color: '#a8ff00' }}>No repository structure available</Typography>;
 
   return (
@@ -114,6 +164,7 @@ const FileExplorer: React.FC<FileExplorerProps> = ({ structure, onFileSelect, se
           level={0}
           onFileSelect={onFileSelect}
           selectedFile={selectedFile}
+          onLoadChildren={onLoadChildren}
         />
       ))}
     </List>